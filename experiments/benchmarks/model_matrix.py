@@ -0,0 +1,202 @@
+"""
+Model-comparison matrix: accuracy vs. latency vs. memory per backend.
+
+Each backend in the matrix file is a set of INVOX_* overrides (GGUF
+quantization, llama.cpp threads, context size, spam model, ...) plus the
+stage it exercises ("pipeline" for the full classifier, "spam" for the spam
+cascade alone). Every backend runs in a fresh process through
+services/invox-ai/tests/features/email_classification/benchmark.py on the
+same seeded sample of the labelled dataset, so load time and peak RSS are its
+own. Model files set in a backend's env (INVOX_MODEL_FILE, INVOX_SPAM_MODEL)
+take precedence over the local model registry, so every row loads its own
+weights. The results are printed as one table and can be saved as JSON or
+Markdown.
+
+Usage:
+    python model_matrix.py [--matrix model_matrix.json] [--only a,b]
+                           [--limit N] [--seed S] [--mode hierarchical]
+                           [--output matrix.json] [--markdown matrix.md] [--stub]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, "..", ".."))
+SERVICE_ROOT = os.path.join(PROJECT_ROOT, "services", "invox-ai")
+BENCHMARK = os.path.join(
+    SERVICE_ROOT, "tests", "features", "email_classification", "benchmark.py"
+)
+DEFAULT_DATASET = os.path.join(os.path.dirname(BENCHMARK), "email_dataset")
+
+COLUMNS = [
+    ("Backend", "name", "{}"),
+    ("Stage", "stage", "{}"),
+    ("Accuracy", "accuracy", "{:.1%}"),
+    ("Parent", "parent_accuracy", "{:.1%}"),
+    ("p50 ms", "p50_ms", "{:.0f}"),
+    ("p95 ms", "p95_ms", "{:.0f}"),
+    ("Emails/s", "throughput_per_sec", "{:.2f}"),
+    ("Load s", "load_sec", "{:.1f}"),
+    ("Peak RSS MB", "peak_rss_mb", "{:.0f}"),
+]
+
+
+def load_matrix(path: str, only: list[str]) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        backends = json.load(f)["backends"]
+    if only:
+        unknown = set(only) - {b["name"] for b in backends}
+        if unknown:
+            raise SystemExit(f"Unknown backends: {', '.join(sorted(unknown))}")
+        backends = [b for b in backends if b["name"] in only]
+    return backends
+
+
+def run_backend(backend: dict, args) -> dict:
+    """Runs benchmark.py for one backend in its own process; returns one table row."""
+    stage = backend.get("stage", "pipeline")
+    row = {"name": backend["name"], "stage": stage, "env": backend.get("env", {})}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "run.json")
+        command = [
+            sys.executable,
+            BENCHMARK,
+            args.dataset_dir,
+            "--stage",
+            stage,
+            "--mode",
+            args.mode,
+            "--seed",
+            str(args.seed),
+            "--limit",
+            str(args.limit),
+            "--batch-size",
+            str(args.batch_size),
+            "--output",
+            output,
+        ]
+        if args.stub:
+            command.append("--stub")
+        env = {
+            **os.environ,
+            "PYTHONPATH": os.path.join(SERVICE_ROOT, "src"),
+            "INVOX_LOG_LEVEL": os.getenv("INVOX_LOG_LEVEL", "WARNING"),
+            **row["env"],
+        }
+
+        start_time = time.perf_counter()
+        try:
+            proc = subprocess.run(
+                command, env=env, capture_output=True, text=True, timeout=args.timeout
+            )
+        except subprocess.TimeoutExpired:
+            return {**row, "error": f"timed out after {args.timeout}s"}
+        row["wall_sec"] = round(time.perf_counter() - start_time, 1)
+
+        if proc.returncode != 0 or not os.path.exists(output):
+            tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or ["no output"]
+            return {**row, "error": f"exit {proc.returncode}: {tail[0]}"}
+        with open(output, "r", encoding="utf-8") as f:
+            result = json.load(f)
+
+    run = next(iter(result["runs"].values()))
+    return {
+        **row,
+        "accuracy": run["accuracy"],
+        "parent_accuracy": run["parent_accuracy"],
+        "p50_ms": run["latency_ms"]["p50"],
+        "p95_ms": run["latency_ms"]["p95"],
+        "p99_ms": run["latency_ms"]["p99"],
+        "throughput_per_sec": run["throughput_per_sec"],
+        "load_sec": run["load_sec"],
+        "peak_rss_mb": run["peak_rss_mb"],
+        "emails": run["emails"],
+    }
+
+
+def _cells(row: dict) -> list[str]:
+    if "error" in row:
+        return [row["name"], row["stage"], f"ERROR {row['error']}"] + [""] * (
+            len(COLUMNS) - 3
+        )
+    return [fmt.format(row[key]) for _, key, fmt in COLUMNS]
+
+
+def format_table(rows: list[dict]) -> str:
+    header = [title for title, _, _ in COLUMNS]
+    body = [_cells(row) for row in rows]
+    widths = [
+        max(len(line[i]) for line in [header] + body if i < len(line))
+        for i in range(len(header))
+    ]
+    lines = [" | ".join(cell.ljust(w) for cell, w in zip(header, widths))]
+    lines.append("-+-".join("-" * w for w in widths))
+    for line in body:
+        lines.append(" | ".join(cell.ljust(w) for cell, w in zip(line, widths)))
+    return "\n".join(lines)
+
+
+def format_markdown(rows: list[dict]) -> str:
+    header = [title for title, _, _ in COLUMNS]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for row in rows:
+        lines.append("| " + " | ".join(_cells(row)) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--matrix", default=os.path.join(SCRIPT_DIR, "model_matrix.json"))
+    parser.add_argument("--only", default="", help="Comma-separated backend names")
+    parser.add_argument("--dataset-dir", default=DEFAULT_DATASET)
+    parser.add_argument("--limit", type=int, default=0, help="Seeded sample of N emails")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--mode", choices=["hierarchical", "flat"], default="hierarchical"
+    )
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="Seconds allowed per backend"
+    )
+    parser.add_argument("--output", help="Write all rows to this JSON file")
+    parser.add_argument("--markdown", help="Write the table to this Markdown file")
+    parser.add_argument(
+        "--stub", action="store_true", help="Run benchmark.py with stub models"
+    )
+    args = parser.parse_args()
+
+    backends = load_matrix(args.matrix, [n for n in args.only.split(",") if n])
+    rows = []
+    for backend in backends:
+        print(f"[MATRIX] {backend['name']}...", file=sys.stderr, flush=True)
+        rows.append(run_backend(backend, args))
+
+    print(format_table(rows))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "seed": args.seed,
+                    "limit": args.limit,
+                    "mode": args.mode,
+                    "stub": args.stub,
+                    "rows": rows,
+                },
+                f,
+                indent=2,
+            )
+    if args.markdown:
+        with open(args.markdown, "w", encoding="utf-8") as f:
+            f.write(format_markdown(rows))
+
+
+if __name__ == "__main__":
+    main()
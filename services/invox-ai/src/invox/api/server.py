@@ -0,0 +1,345 @@
+"""
+Resident classification daemon.
+
+Loads the spam gate and Gemma router once and serves classification requests
+over a small HTTP/1.1 API on a local TCP port or Unix socket. Concurrent
+requests are queued and handed to process_email_classification_batch() in
+batches, so callers never pay model start-up and the LLM sees full batches.
+
+Endpoints:
+    GET  /healthz   200 while the process is up
+    GET  /readyz    200 once models are loaded and the batcher runs, 503 before
+                    (or after a load failure or a batcher crash)
+    GET  /metrics   per-stage timings and token counts in the Prometheus text format
+    POST /classify  {"email": "..."} or {"emails": ["...", ...]}
+
+At most INVOX_SERVER_MAX_QUEUE emails wait for the model at once; a request
+that does not fit gets 503 straight away instead of growing the backlog.
+
+Usage:
+    python -m invox.api.server --port 8765
+    python -m invox.api.server --unix /run/invox/classify.sock
+"""
+
+import os
+import json
+import time
+import asyncio
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+from invox.features.email_classification import metrics
+from invox.features.email_classification.log import get_logger
+
+MAX_BATCH = int(os.getenv("INVOX_SERVER_MAX_BATCH", "16"))
+# How long the batcher waits for more requests after the first one arrives
+MAX_WAIT_MS = float(os.getenv("INVOX_SERVER_MAX_WAIT_MS", "20"))
+# Emails waiting for a batch, across all requests
+MAX_QUEUE = int(os.getenv("INVOX_SERVER_MAX_QUEUE", "1024"))
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+_STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+log = get_logger("server")
+
+
+class ClassificationServer:
+    def __init__(
+        self,
+        max_batch: int = MAX_BATCH,
+        max_wait_ms: float = MAX_WAIT_MS,
+        max_queue: int = MAX_QUEUE,
+    ):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.queue: Optional[asyncio.Queue] = None
+        # Model calls are not thread-safe; everything runs on one inference thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invox-infer")
+        self.service = None
+        self.load_error: Optional[str] = None
+        # Strong references: the event loop keeps only weak ones to tasks
+        self.load_future: Optional[asyncio.Future] = None
+        self.batch_task: Optional[asyncio.Task] = None
+        self.batch_error: Optional[str] = None
+        self._in_flight: list = []
+        self.started_at = time.time()
+        self.requests_served = 0
+        self.batches_run = 0
+
+    @property
+    def batcher_running(self) -> bool:
+        return self.batch_task is not None and not self.batch_task.done()
+
+    @property
+    def ready(self) -> bool:
+        return self.service is not None and self.batcher_running
+
+    # --- Model lifecycle ---
+
+    def _load_models(self) -> None:
+        try:
+            from invox.features.email_classification import service
+
+            service.warmup(batch=True)
+            self.service = service
+            log.info("[SERVER] Models loaded, ready for traffic.")
+        except BaseException:
+            # service.py calls sys.exit() on import failure; keep the daemon alive
+            # so /readyz can report why.
+            self.load_error = traceback.format_exc()
+            log.error("[SERVER] Model load failed:\n%s", self.load_error)
+
+    async def start(self) -> None:
+        metrics.configure(prometheus=True)
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        loop = asyncio.get_running_loop()
+        self.load_future = loop.run_in_executor(self.executor, self._load_models)
+        self.batch_task = asyncio.create_task(self._batch_loop())
+        self.batch_task.add_done_callback(self._on_batch_loop_done)
+
+    def _on_batch_loop_done(self, task: asyncio.Task) -> None:
+        """Fails every waiting request once the batcher is gone; /readyz turns 503."""
+        if task.cancelled():
+            self.batch_error = "Batch loop cancelled"
+        else:
+            error = task.exception()
+            self.batch_error = "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            )
+        log.error("[SERVER] Batch loop stopped:\n%s", self.batch_error)
+
+        pending = self._in_flight
+        self._in_flight = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Batch loop stopped"))
+
+    # --- Batching ---
+
+    def has_room(self, n_emails: int) -> bool:
+        return self.queue.qsize() + n_emails <= self.max_queue
+
+    async def classify(self, email_texts: list[str]) -> list[tuple[str, str]]:
+        """Callers check has_room() first; there is no await before the last put."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for email_text in email_texts:
+            future = loop.create_future()
+            self.queue.put_nowait((email_text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self._in_flight = batch
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.service.process_email_classification_batch, texts
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._in_flight = []
+                continue
+
+            self.batches_run += 1
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._in_flight = []
+
+    # --- HTTP handling ---
+
+    async def _respond(self, writer, status: int, payload: Union[dict, str]) -> None:
+        # A str payload is plain text (the Prometheus exposition format)
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            body = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        head = (
+            f"HTTP/1.1 {status} {_STATUS_TEXT[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: keep-alive\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Malformed request line"})
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Without a usable length the next request cannot be found
+                    await self._respond(writer, 400, {"error": "Invalid Content-Length"})
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "Request body too large"})
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self._route(method, path, body)
+                await self._respond(writer, status, payload)
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(
+        self, method: str, path: str, body: bytes
+    ) -> tuple[int, Union[dict, str]]:
+        path = path.split("?", 1)[0]
+
+        if path == "/healthz":
+            return 200, {
+                "status": "ok",
+                "uptime_sec": round(time.time() - self.started_at, 3),
+                "requests_served": self.requests_served,
+                "batches_run": self.batches_run,
+                "queue_depth": self.queue.qsize(),
+                "batcher": "running" if self.batcher_running else "stopped",
+            }
+
+        if path == "/readyz":
+            if self.ready:
+                return 200, {"status": "ready"}
+            if self.load_error:
+                return 503, {"status": "failed", "error": self.load_error}
+            if self.batch_error:
+                return 503, {"status": "failed", "error": self.batch_error}
+            return 503, {"status": "loading"}
+
+        if path == "/metrics":
+            return 200, (
+                metrics.render_prometheus()
+                + "# TYPE invox_server_requests_total counter\n"
+                + f"invox_server_requests_total {self.requests_served}\n"
+                + "# TYPE invox_server_batches_total counter\n"
+                + f"invox_server_batches_total {self.batches_run}\n"
+                + "# TYPE invox_server_queue_depth gauge\n"
+                + f"invox_server_queue_depth {self.queue.qsize()}\n"
+            )
+
+        if path != "/classify":
+            return 404, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": "Use POST"}
+        if self.batch_error:
+            return 503, {"error": "Batch loop stopped, see /readyz"}
+        if not self.ready:
+            return 503, {"error": "Models are not loaded yet"}
+
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return 400, {"error": "Body must be JSON"}
+        if not isinstance(request, dict):
+            return 400, {"error": "Body must be a JSON object"}
+
+        single = "email" in request
+        emails = [request["email"]] if single else request.get("emails")
+        if not isinstance(emails, list) or not all(isinstance(e, str) for e in emails):
+            return 400, {"error": 'Expected {"email": str} or {"emails": [str, ...]}'}
+        if len(emails) > self.max_queue:
+            return 413, {"error": f"At most {self.max_queue} emails per request"}
+        if not self.has_room(len(emails)):
+            return 503, {"error": "Classification queue is full, retry later"}
+
+        start_time = time.time()
+        try:
+            results = await self.classify(emails)
+        except Exception as e:
+            return 500, {"error": str(e)}
+        elapsed = time.time() - start_time
+        self.requests_served += 1
+
+        formatted = [{"parent": parent, "child": child} for parent, child in results]
+        if single:
+            return 200, {**formatted[0], "elapsed_sec": round(elapsed, 3)}
+        return 200, {"results": formatted, "elapsed_sec": round(elapsed, 3)}
+
+
+async def serve(host: str, port: int, unix_path: Optional[str]) -> None:
+    server = ClassificationServer()
+    await server.start()
+
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+        listener = await asyncio.start_unix_server(server.handle_connection, path=unix_path)
+        log.info("[SERVER] Listening on unix:%s", unix_path)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+        log.info("[SERVER] Listening on http://%s:%d", host, port)
+
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Invox classification daemon")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Serve on this Unix socket instead of TCP")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
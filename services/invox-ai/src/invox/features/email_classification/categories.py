@@ -3,8 +3,17 @@
 """
 Hierarchical Email Categories for Invox AI.
 Used for Top-down Multi-step Hierarchical (TMH) zero-shot classification.
+
+The taxonomy is frozen at import: every label list below is a tuple built
+once, label names, their aliases and singular/plural forms are indexed in one
+dict, and model output is parsed with a word-level trie over it (see
+match_labels()) instead of a substring scan over the label list.
 """
 
+import re
+from types import MappingProxyType
+from typing import Optional
+
 CATEGORY_HIERARCHY = {
     "Work": [
         "Meetings",
@@ -135,23 +144,185 @@ CATEGORY_HIERARCHY = {
 }
 
 
-def get_parent_labels() -> list[str]:
-    """Returns the list of 10 top-level categories for Step 1 classification."""
-    return list(CATEGORY_HIERARCHY.keys())
+# Synonyms the model tends to answer with, per level. Plural/singular forms of
+# every label are added automatically.
+PARENT_ALIASES = {
+    "Work": ["Job", "Office", "Business"],
+    "Finance": ["Financial", "Money"],
+    "Purchases": ["Shopping"],
+    "Travel": ["Trip"],
+    "Education": ["School", "University"],
+    "Social": ["Social Media"],
+    "Promotions": ["Promotional", "Marketing", "Advertising"],
+    "Spam": ["Junk Mail"],
+    "Personal": ["Private"],
+}
+CHILD_ALIASES = {
+    "Others": ["Other", "General", "Misc", "Miscellaneous"],
+}
+
+# Parents the Gemma router chooses between; Spam is decided by the spam gate
+ROUTER_EXCLUDED = ("Spam",)
+
+CATEGORY_HIERARCHY = MappingProxyType(
+    {parent: tuple(children) for parent, children in CATEGORY_HIERARCHY.items()}
+)
+PARENT_LABELS = tuple(CATEGORY_HIERARCHY)
+FLAT_LABELS = tuple(
+    f"{parent} - {child}"
+    for parent, children in CATEGORY_HIERARCHY.items()
+    for child in children
+)
+ROUTABLE_PARENTS = tuple(p for p in PARENT_LABELS if p not in ROUTER_EXCLUDED)
+ROUTABLE_FLAT_LABELS = tuple(
+    label for label in FLAT_LABELS if label.split(" - ", 1)[0] in ROUTABLE_PARENTS
+)
+# "Parent - Child" -> (parent, child)
+FLAT_LABEL_PAIRS = MappingProxyType(
+    {label: tuple(label.split(" - ", 1)) for label in FLAT_LABELS}
+)
 
 
-def get_child_labels(parent_category: str) -> list[str]:
-    """Returns the list of sub-categories for a specific parent for Step 2 classification."""
-    return CATEGORY_HIERARCHY.get(parent_category, [])
+def normalize_label(text: str) -> str:
+    """Lower-cases and reduces to words: "Work - Meetings." -> "work meetings"."""
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
 
 
-def get_flat_labels() -> list[str]:
+def _other_number(word: str) -> Optional[str]:
     """
-    Returns the original flat list of categories (e.g., 'Work - Meetings').
-    Useful for backwards compatibility with legacy benchmarking scripts.
+    The plural of a singular word or the singular of a plural one:
+    "Meetings" <-> "Meeting", "Classes" -> "Class", "Groceries" -> "Grocery",
+    "Sales" -> "Sale". None when the word is neither ("Business").
     """
-    flat_labels = []
+    if word.endswith(("ss", "us", "is")):
+        return None
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "zes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1] if len(word) > 3 else None
+    if word.endswith("y") and word[-2:-1] not in ("a", "e", "o", "u"):
+        return word[:-1] + "ies"
+    if word.endswith(("x", "z", "ch", "sh")):
+        return word + "es"
+    return word + "s"
+
+
+def _forms(name: str, aliases: list[str]) -> set[str]:
+    forms = set()
+    for form in [name] + aliases:
+        form = normalize_label(form)
+        forms.add(form)
+        head, _, last = form.rpartition(" ")
+        other = _other_number(last)
+        if other:
+            forms.add(f"{head} {other}" if head else other)
+    return forms
+
+
+def _build_index() -> dict[str, frozenset]:
+    """Normalized name -> every (parent, child) it can denote; child None for a parent."""
+    index: dict[str, set] = {}
     for parent, children in CATEGORY_HIERARCHY.items():
+        parent_forms = _forms(parent, PARENT_ALIASES.get(parent, []))
+        for form in parent_forms:
+            index.setdefault(form, set()).add((parent, None))
         for child in children:
-            flat_labels.append(f"{parent} - {child}")
-    return flat_labels
+            for child_form in _forms(child, CHILD_ALIASES.get(child, [])):
+                index.setdefault(child_form, set()).add((parent, child))
+                for parent_form in parent_forms:
+                    index.setdefault(f"{parent_form} {child_form}", set()).add(
+                        (parent, child)
+                    )
+    return {name: frozenset(labels) for name, labels in index.items()}
+
+
+# Normalized name -> frozenset of (parent, child). A child name shared by
+# several parents ("others") maps to all of them; the flat form
+# ("work others") always maps to exactly one.
+LABEL_INDEX = MappingProxyType(_build_index())
+
+
+def _build_trie(index) -> dict:
+    trie: dict = {}
+    for name, labels in index.items():
+        node = trie
+        for word in name.split():
+            node = node.setdefault(word, {})
+        node[None] = labels
+    return trie
+
+
+_LABEL_TRIE = _build_trie(LABEL_INDEX)
+
+
+def match_labels(text: str) -> list[frozenset]:
+    """
+    Every label mention in `text`, in order of appearance. Matching is on whole
+    words and leftmost-longest, so "Work - Others" is one mention of
+    (Work, Others) rather than a Work mention plus nine ambiguous Others, and a
+    label is never found inside a longer word.
+    """
+    words = normalize_label(text).split()
+    mentions = []
+    i = 0
+    while i < len(words):
+        node, end, labels = _LABEL_TRIE, i, None
+        for j in range(i, len(words)):
+            node = node.get(words[j])
+            if node is None:
+                break
+            if None in node:
+                end, labels = j + 1, node[None]
+        if labels is None:
+            i += 1
+        else:
+            mentions.append(labels)
+            i = end
+    return mentions
+
+
+def resolve_parent(
+    text: str, parents: tuple[str, ...] = ROUTABLE_PARENTS
+) -> Optional[str]:
+    """
+    The first parent in `parents` that `text` names unambiguously, directly or
+    through one of its children; None when it names none of them.
+    """
+    for labels in match_labels(text):
+        candidates = {parent for parent, _ in labels if parent in parents}
+        if len(candidates) == 1:
+            return candidates.pop()
+    return None
+
+
+def resolve_child(text: str, parent: str) -> str:
+    """
+    The first child of `parent` that `text` names; falls back to "Others"
+    (or the first child when `parent` has none).
+    """
+    children = CATEGORY_HIERARCHY[parent]
+    for labels in match_labels(text):
+        for label_parent, child in labels:
+            if label_parent == parent and child is not None:
+                return child
+    return "Others" if "Others" in children else children[0]
+
+
+def get_parent_labels() -> tuple[str, ...]:
+    """Returns the 10 top-level categories for Step 1 classification."""
+    return PARENT_LABELS
+
+
+def get_child_labels(parent_category: str) -> tuple[str, ...]:
+    """Returns the sub-categories of a specific parent for Step 2 classification."""
+    return CATEGORY_HIERARCHY.get(parent_category, ())
+
+
+def get_flat_labels() -> tuple[str, ...]:
+    """
+    Returns the original flat categories (e.g., 'Work - Meetings').
+    Useful for backwards compatibility with legacy benchmarking scripts.
+    """
+    return FLAT_LABELS
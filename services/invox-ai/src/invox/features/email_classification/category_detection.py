@@ -1,134 +1,674 @@
-import sys
 import os
+import time
+import threading
+from typing import Optional
 from dotenv import load_dotenv
-from huggingface_hub import hf_hub_download
-from llama_cpp import Llama
 from invox.features.email_classification.categories import (
-    get_parent_labels,
+    CATEGORY_HIERARCHY,
+    FLAT_LABEL_PAIRS,
+    ROUTABLE_FLAT_LABELS,
+    ROUTABLE_PARENTS,
     get_child_labels,
+    get_flat_labels,
+    resolve_child,
+    resolve_parent,
 )
+from invox.features.email_classification import metrics, preprocess, token_budget
+from invox.features.email_classification.lazy_model import LazyModel
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.model_registry import model_tag, resolve_model
 
 # Load environment variables from the .env file
 load_dotenv()
 
-print(
-    "  -> [Gemma Router] Locating optimized GGUF weights for CPU inference...",
-    file=sys.stderr,
-)
-
 # Download the pre-quantized 4-bit GGUF model specifically built for CPUs/iGPUs.
 # This is a 5.6GB file that will fit perfectly inside your 16GB of RAM.
-model_path = hf_hub_download(
-    repo_id="bartowski/gemma-2-9b-it-GGUF",
-    filename="gemma-2-9b-it-Q4_K_M.gguf",
-    token=os.getenv("HF_TOKEN"),  # Securely fetches the token from .env
+# Other quantizations (Q5_K_M, Q8_0, ...) can be picked for comparison runs.
+MODEL_REPO = os.getenv("INVOX_MODEL_REPO", "bartowski/gemma-2-9b-it-GGUF")
+MODEL_FILE = os.getenv("INVOX_MODEL_FILE", "gemma-2-9b-it-Q4_K_M.gguf")
+# Coordinates set explicitly take precedence over the model registry
+MODEL_PINNED = tuple(
+    key
+    for key, var in (("repo_id", "INVOX_MODEL_REPO"), ("filename", "INVOX_MODEL_FILE"))
+    if var in os.environ
 )
 
-print(
-    "  -> [Gemma Router] Booting up Llama.cpp engine on Ryzen CPU...", file=sys.stderr
+# Logical name of the router in the local model registry (see model_registry.py)
+MODEL_NAME = os.getenv("INVOX_ROUTER_MODEL_NAME", "gemma-router")
+
+# Context of the single-sequence Llama (only "generate" mode decodes in it)
+N_CTX = int(os.getenv("INVOX_N_CTX", "2048"))
+
+# llama.cpp threads per process; with the worker pool, threads per worker
+N_THREADS = int(os.getenv("INVOX_LLM_THREADS", "4"))
+
+# Bump whenever the prompts or the parsing of answers change so cached results
+# from older versions are ignored
+PROMPT_VERSION = "6"
+
+log = get_logger("category_detection")
+
+
+def _load_llm():
+    # llama_cpp is only imported once the model is needed
+    from llama_cpp import Llama
+
+    log.info("  -> [Gemma Router] Locating optimized GGUF weights for CPU inference...")
+    # A local path from the registry (e.g. a shared read-only volume) needs no HTTP
+    model_path = resolve_model(
+        MODEL_NAME, MODEL_PINNED, repo_id=MODEL_REPO, filename=MODEL_FILE
+    )
+
+    log.info("  -> [Gemma Router] Booting up Llama.cpp engine on Ryzen CPU...")
+
+    # Initialize the blazing-fast CPU engine
+    return Llama(
+        model_path=model_path,
+        n_ctx=N_CTX,  # Context window size
+        n_threads=N_THREADS,  # 4 suits a Ryzen 5; raise it on bigger boxes
+        n_threads_batch=N_THREADS,
+        # Map the weights instead of copying them, so every process on the host
+        # shares one page-cache copy of the GGUF file
+        use_mmap=True,
+        use_mlock=os.getenv("INVOX_MLOCK", "0") == "1",
+        verbose=False,  # Suppress massive C++ logs
+    )
+
+
+gemma_model = LazyModel("Gemma Router", _load_llm)
+
+
+def router_tag() -> str:
+    """The GGUF the router loads, for result cache keys."""
+    return model_tag(MODEL_NAME, MODEL_PINNED, repo_id=MODEL_REPO, filename=MODEL_FILE)
+
+
+def get_llm():
+    return gemma_model.get()
+
+
+# Gemma 2 Chat Template pieces. The email sits right after the turn opener so
+# that every step for the same email shares one prompt prefix.
+PROMPT_HEADER = (
+    "<start_of_turn>user\n"
+    "You are an expert email routing AI.\n"
+    "Read the email below carefully. You will be asked to categorize it.\n\n"
+    "Email Content:\n"
 )
+PROMPT_FOOTER = "<end_of_turn>\n<start_of_turn>model\n"
+
+# Step instructions, rendered once per parent; a step prompt is the email
+# prefix followed by one of these.
+PARENT_INSTRUCTIONS = f"""Classify the email above into exactly ONE of these categories: {list(ROUTABLE_PARENTS)}.
+Output ONLY the exact category name from the list. Do not explain.
 
-# Initialize the blazing-fast CPU engine
-llm = Llama(
-    model_path=model_path,
-    n_ctx=2048,  # Context window size
-    n_threads=4,  # Optimized for your Ryzen 5 (4 cores)
-    verbose=False,  # Suppress massive C++ logs
+Category Name:{PROMPT_FOOTER}"""
+
+
+def _child_instructions(parent: str, children: tuple[str, ...]) -> str:
+    return f"""This email belongs to the '{parent}' category.
+Pick the most specific sub-category from this list: {list(children)}.
+Output ONLY the exact sub-category name from the list. Do not explain.
+
+Sub-category Name:{PROMPT_FOOTER}"""
+
+
+CHILD_INSTRUCTIONS = {
+    parent: _child_instructions(parent, children)
+    for parent, children in CATEGORY_HIERARCHY.items()
+}
+_flat_taxonomy = "\n".join(
+    f"{p}: {', '.join(get_child_labels(p))}" for p in ROUTABLE_PARENTS
 )
+FLAT_INSTRUCTIONS = f"""Classify the email above into exactly ONE category and sub-category from this list:
+{_flat_taxonomy}
+Output ONLY the answer as "Category - Sub-category". Do not explain.
+
+Answer:{PROMPT_FOOTER}"""
+
+# Prefill accounting for the most recent classify_hierarchical() call.
+last_prefill_stats = {"prompt_tokens": 0, "prefilled_tokens": 0, "saved_tokens": 0}
+
+
+# How a step picks its label: "score" ranks the known labels by
+# log-likelihood, "generate" lets Gemma write free text and matches it against
+# the taxonomy (categories.match_labels()).
+LABEL_MODE = os.getenv("INVOX_LABEL_MODE", "score")
+
+# Multi-sequence decoders keyed by number of email slots, created on first use.
+# Slots left over up to llama.cpp's sequence limit serve as label branches.
+BATCH_SIZE = int(os.getenv("INVOX_BATCH_SIZE", "8"))
+# Context per sequence. "auto" sizes it from the prompt overhead plus the email
+# budget (INVOX_SUMMARY_TOKENS) instead of a fixed 1024, so KV memory per
+# sequence only covers what a prompt can actually use.
+SEQ_CTX = os.getenv("INVOX_SEQ_CTX", "auto")
+MAX_SEQUENCES = 64
+# score_labels() branches each label off its email into a scratch sequence;
+# keep enough of them for the largest Parent/Child label set in one round
+SCRATCH_SEQUENCES = max(
+    len(ROUTABLE_PARENTS), *(len(get_child_labels(p)) for p in ROUTABLE_PARENTS)
+)
+if not 1 <= BATCH_SIZE <= MAX_SEQUENCES - SCRATCH_SEQUENCES:
+    _clamped = min(max(BATCH_SIZE, 1), MAX_SEQUENCES - SCRATCH_SEQUENCES)
+    log.warning(
+        "INVOX_BATCH_SIZE=%d outside 1..%d (%d of %d sequences score labels); using %d",
+        BATCH_SIZE,
+        MAX_SEQUENCES - SCRATCH_SEQUENCES,
+        SCRATCH_SEQUENCES,
+        MAX_SEQUENCES,
+        _clamped,
+    )
+    BATCH_SIZE = _clamped
+_decoders = {}
+_decoders_lock = threading.Lock()
+
+
+# Send the pre-processed summary (subject, sender domain, cleaned body) instead
+# of the raw email text
+PREPROCESS = os.getenv("INVOX_PREPROCESS", "1") == "1"
+
+# Tokens kept free on top of the measured prompt overhead
+CTX_MARGIN = 16
+_prompt_overhead = None
+_label_keywords = None
+
+
+def prompt_overhead_tokens() -> int:
+    """
+    Tokens every prompt needs besides the email: header, instructions and label
+    list of the longest step prompt, plus room for the answer (the longest
+    label when scoring, 15 generated tokens otherwise).
+    """
+    global _prompt_overhead
+    if _prompt_overhead is None:
+        llm = get_llm()
+
+        def count(text: str) -> int:
+            return len(llm.tokenize(text.encode("utf-8"), special=True))
+
+        prefix = build_email_prefix("")
+        prompts = [build_parent_prompt(prefix), build_flat_prompt(prefix)]
+        prompts += [build_child_prompt(prefix, p) for p in ROUTABLE_PARENTS]
+        labels = ROUTABLE_PARENTS + ROUTABLE_FLAT_LABELS
+        # +1 for the <end_of_turn> appended to labels that prefix others
+        answer = max(max(count(label) for label in labels) + 1, 15)
+        _prompt_overhead = max(count(prompt) for prompt in prompts) + answer
+    return _prompt_overhead
+
+
+def seq_ctx() -> int:
+    """Per-sequence context of the multi-sequence decoders."""
+    if SEQ_CTX != "auto":
+        return int(SEQ_CTX)
+    needed = prompt_overhead_tokens() + preprocess.SUMMARY_TOKENS + CTX_MARGIN
+    return -(-needed // 64) * 64
+
+
+def email_snippet(email_text: str, n_ctx: Optional[int] = None) -> str:
+    """
+    The part of an email that goes into the prompt, fitted with the Gemma
+    tokenizer to what a context of `n_ctx` tokens (default: seq_ctx()) leaves
+    after the prompt overhead.
+    """
+    global _label_keywords
+    budget = (n_ctx or seq_ctx()) - prompt_overhead_tokens() - CTX_MARGIN
+    tokenizer = token_budget.LlamaTokenizer(get_llm())
+    if not PREPROCESS:
+        return token_budget.fit_text(email_text, budget, tokenizer, "head")
+
+    if _label_keywords is None:
+        _label_keywords = token_budget.keywords_of(*get_flat_labels())
+    return preprocess.summarize(
+        email_text,
+        min(budget, preprocess.SUMMARY_TOKENS),
+        tokenizer=tokenizer,
+        keywords=_label_keywords,
+    )
+
+
+def build_email_prefix(text_snippet: str) -> str:
+    """Returns the prompt prefix shared by every classification step of one email."""
+    return f"{PROMPT_HEADER}{text_snippet}\n\n"
+
+
+def build_parent_prompt(email_prefix: str) -> str:
+    return email_prefix + PARENT_INSTRUCTIONS
+
+
+def build_child_prompt(email_prefix: str, parent: str) -> str:
+    return email_prefix + CHILD_INSTRUCTIONS[parent]
+
+
+def build_flat_prompt(email_prefix: str) -> str:
+    return email_prefix + FLAT_INSTRUCTIONS
+
+
+def _clean_output(raw_out: str) -> str:
+    return raw_out.strip().replace(".", "").replace('"', "").replace("'", "")
 
 
-def ask_gemma(prompt: str, step_label: str) -> str:
-    print(
-        f"    -> [Gemma Inference] Generating {step_label} classification...",
-        file=sys.stderr,
+def _parent_from_output(raw_out: str, parents: tuple[str, ...]) -> str:
+    """
+    The parent Gemma's free-text answer names. An answer naming none of
+    `parents` gets the first of them, as before the trie parser, but logged.
+    """
+    parent = resolve_parent(raw_out, parents)
+    if parent is None:
+        log.warning(
+            "  -> [Gemma Router] No category in answer %r, defaulting to %s",
+            raw_out[:80],
+            parents[0],
+        )
+        parent = parents[0]
+    return parent
+
+
+def _split_flat_scores(flat_scores: dict[str, float]) -> dict:
+    """
+    Turns a distribution over "Parent - Child" labels into the same result
+    shape as the TMH path: the parent marginals and the child distribution
+    conditioned on the winning parent.
+    """
+    parent_scores: dict[str, float] = {}
+    for label, prob in flat_scores.items():
+        parent = FLAT_LABEL_PAIRS[label][0]
+        parent_scores[parent] = parent_scores.get(parent, 0.0) + prob
+    parent_scores = dict(sorted(parent_scores.items(), key=lambda kv: -kv[1]))
+
+    top_parent = next(iter(parent_scores))
+    child_scores = {
+        FLAT_LABEL_PAIRS[label][1]: prob / parent_scores[top_parent]
+        for label, prob in flat_scores.items()
+        if FLAT_LABEL_PAIRS[label][0] == top_parent
+    }
+    return {
+        "parent": top_parent,
+        "child": next(iter(child_scores)),
+        "parent_scores": parent_scores,
+        "child_scores": child_scores,
+    }
+
+
+def _count_cached_tokens(prompt_tokens: list[int]) -> int:
+    """
+    Returns how many leading prompt tokens are already sitting in the KV cache.
+    llama-cpp-python skips these on the next call instead of prefilling them again.
+    """
+    llm = get_llm()
+    cached = llm.input_ids[: llm.n_tokens]
+    shared = 0
+    for cached_token, prompt_token in zip(cached, prompt_tokens):
+        if cached_token != prompt_token:
+            break
+        shared += 1
+    # llama-cpp-python always re-evaluates the final prompt token to get fresh logits
+    return min(shared, len(prompt_tokens) - 1)
+
+
+def _eval_timings(llm) -> Optional[tuple[float, float, int]]:
+    """
+    (prompt eval ms, token eval ms, token evals) accumulated by the Llama's own
+    context, or None when this llama.cpp build does not expose them.
+    """
+    import llama_cpp
+
+    perf = getattr(llama_cpp, "llama_perf_context", None)
+    ctx = getattr(llm, "ctx", None)
+    if perf is None or ctx is None:
+        return None
+    data = perf(ctx)
+    return data.t_p_eval_ms, data.t_eval_ms, data.n_eval
+
+
+def ask_gemma(prompt: str, step_label: str, stats: Optional[dict] = None) -> str:
+    """
+    Runs one greedy generation step. `prompt` must already be in the Gemma chat
+    format (see build_email_prefix). If `stats` is given, prompt/prefill token
+    counts for this call are added to it.
+    """
+    log.debug("    -> [Gemma Inference] Generating %s classification...", step_label)
+
+    llm = get_llm()
+    prompt_tokens = llm.tokenize(prompt.encode("utf-8"), special=True)
+    cached_tokens = _count_cached_tokens(prompt_tokens)
+    if stats is not None:
+        stats["prompt_tokens"] += len(prompt_tokens)
+        stats["prefilled_tokens"] += len(prompt_tokens) - cached_tokens
+        stats["saved_tokens"] += cached_tokens
+    metrics.add(
+        prompt_tokens=len(prompt_tokens),
+        prefilled_tokens=len(prompt_tokens) - cached_tokens,
+        saved_tokens=cached_tokens,
     )
 
-    # Gemma 2 Chat Template format
-    formatted_prompt = (
-        f"<start_of_turn>user\n{prompt}<end_of_turn>\n<start_of_turn>model\n"
+    log.debug(
+        "    -> [Gemma Inference] Prompt tokens: %d, reused from KV cache: %d",
+        len(prompt_tokens),
+        cached_tokens,
     )
 
+    timings_before = _eval_timings(llm) if metrics.enabled() else None
+    start_time = time.perf_counter()
     output = llm(
-        formatted_prompt,
+        prompt,
         max_tokens=15,
         stop=["<end_of_turn>", "\n"],
         temperature=0.0,  # Deterministic logic
     )
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
 
-    raw_out = output["choices"][0]["text"]
-    clean_out = raw_out.strip().replace(".", "").replace('"', "").replace("'", "")
+    if timings_before is not None:
+        prefill_ms, decode_ms, steps = (
+            max(after - before, 0)
+            for after, before in zip(_eval_timings(llm), timings_before)
+        )
+        metrics.add(
+            prefill_ms=prefill_ms, decode_ms=decode_ms, decode_steps=steps, decode_tokens=steps
+        )
+    else:
+        # No split available: the whole call counts as decoding
+        metrics.add(decode_ms=elapsed_ms)
 
-    print(
-        f"    -> [Gemma Inference] Raw output captured: '{clean_out}'", file=sys.stderr
-    )
+    clean_out = _clean_output(output["choices"][0]["text"])
+
+    log.debug("    -> [Gemma Inference] Raw output captured: '%s'", clean_out)
     return clean_out
 
 
-def classify_hierarchical(email_text: str) -> tuple[str, str]:
-    print("  -> [Gemma Router] Formatting payload...", file=sys.stderr)
-    text_snippet = email_text[
-        :1500
-    ]  # Slightly shorter to ensure it fits in 2048 context
+def get_last_prefill_stats() -> dict:
+    """
+    Returns prompt, prefilled and saved (KV-cache reused) token counts for the
+    last email passed to classify_hierarchical().
+    """
+    return dict(last_prefill_stats)
 
-    parents = get_parent_labels()
-    if "Spam" in parents:
-        parents.remove("Spam")
 
-    # --- Parent Step ---
-    print(
-        f"  -> [Gemma Router] Step 1: Asking Gemma for Parent Category...",
-        file=sys.stderr,
+def _get_decoder(n_seq: int):
+    with _decoders_lock:
+        if n_seq not in _decoders:
+            from invox.features.email_classification.multi_sequence import (
+                MultiSequenceDecoder,
+            )
+
+            log.info("  -> [Gemma Router] Opening %d-sequence decoding context...", n_seq)
+            _decoders[n_seq] = MultiSequenceDecoder(
+                get_llm(),
+                n_seq=n_seq,
+                n_ctx_per_seq=seq_ctx(),
+                n_scratch=MAX_SEQUENCES - n_seq,
+            )
+        return _decoders[n_seq]
+
+
+def warmup(batch: bool = False) -> None:
+    """
+    Loads the GGUF weights and opens the decoding context the current
+    LABEL_MODE needs, so the first email does not pay for it. `batch` also
+    opens the BATCH_SIZE-sequence context used by the batch entry points.
+    """
+    get_llm()
+    if LABEL_MODE == "score":
+        _get_decoder(1)
+    if batch:
+        _get_decoder(BATCH_SIZE)
+
+
+def _record_decoder_work(decoder, before: dict, stats: Optional[dict] = None) -> None:
+    """
+    Adds the decoder's token counts and timings since the `before` snapshot
+    (decoder.counters()) to `stats` and to the current metrics records.
+    """
+    delta = {name: value - before[name] for name, value in decoder.counters().items()}
+    prompt_tokens = delta["saved_tokens"] + delta["prefilled_tokens"]
+    if stats is not None:
+        stats["prompt_tokens"] += prompt_tokens
+        stats["prefilled_tokens"] += delta["prefilled_tokens"]
+        stats["saved_tokens"] += delta["saved_tokens"]
+    metrics.add(
+        prompt_tokens=prompt_tokens,
+        prefilled_tokens=delta["prefilled_tokens"],
+        saved_tokens=delta["saved_tokens"],
+        prefill_ms=delta["prefill_seconds"] * 1000,
+        decode_ms=delta["decode_seconds"] * 1000,
+        decode_steps=delta["decode_steps"],
+        decode_tokens=delta["decode_tokens"],
     )
-    p_prompt = f"""You are an expert email routing AI. 
-Analyze the email below and classify it into exactly ONE of these categories: {parents}.
-Output ONLY the exact category name from the list. Do not explain.
 
-Email Content:
-{text_snippet}
 
-Category Name:"""
+def score_labels(
+    prompt: str, labels: tuple[str, ...], step_label: str, stats: Optional[dict] = None
+) -> tuple[str, dict[str, float]]:
+    """
+    Picks the most likely label for `prompt` out of `labels` by log-likelihood
+    instead of free generation. Returns the label and the full probability
+    distribution over `labels`.
+    """
+    log.debug("    -> [Gemma Inference] Scoring %d %s labels...", len(labels), step_label)
+    decoder = _get_decoder(1)
+    before = decoder.counters()
 
-    raw_parent = ask_gemma(p_prompt, "Parent")
+    distribution = decoder.score_labels([prompt], [labels])[0]
+    _record_decoder_work(decoder, before, stats)
 
-    top_parent = next(
-        (p for p in parents if p.lower() in raw_parent.lower()), parents[0]
+    top_label = next(iter(distribution))
+    log.debug(
+        "    -> [Gemma Inference] Best label: '%s' (p=%.3f)",
+        top_label,
+        distribution[top_label],
     )
-    print(
-        f"  -> [Gemma Router] Step 1 resolved. Mapped to: [{top_parent}]",
-        file=sys.stderr,
+    return top_label, distribution
+
+
+def classify_hierarchical_with_scores(email_text: str, mode: Optional[str] = None) -> dict:
+    """
+    Runs the two-step TMH classification and returns a dict with `parent`,
+    `child` and, in "score" mode, the `parent_scores` / `child_scores`
+    probability distributions (empty in "generate" mode).
+    """
+    global last_prefill_stats
+    mode = mode or LABEL_MODE
+
+    log.debug("  -> [Gemma Router] Formatting payload...")
+    # "generate" decodes in the Llama's own context, "score" in the 1-sequence decoder
+    text_snippet = email_snippet(
+        email_text, get_llm().n_ctx() if mode == "generate" else None
     )
 
+    # Both steps start with the same header + email, so the Child step only has
+    # to prefill its short instruction suffix on top of the cached prefix.
+    email_prefix = build_email_prefix(text_snippet)
+    stats = {"prompt_tokens": 0, "prefilled_tokens": 0, "saved_tokens": 0}
+    result = {"parent": None, "child": None, "parent_scores": {}, "child_scores": {}}
+
+    parents = ROUTABLE_PARENTS
+
+    # --- Parent Step ---
+    log.debug("  -> [Gemma Router] Step 1: Asking Gemma for Parent Category...")
+    p_prompt = build_parent_prompt(email_prefix)
+    if mode == "score":
+        top_parent, result["parent_scores"] = score_labels(p_prompt, parents, "Parent", stats)
+    else:
+        top_parent = _parent_from_output(ask_gemma(p_prompt, "Parent", stats), parents)
+    result["parent"] = top_parent
+
+    log.debug("  -> [Gemma Router] Step 1 resolved. Mapped to: [%s]", top_parent)
+
     # --- Child Step ---
     children = get_child_labels(top_parent)
     if not children:
-        print(
-            "  -> [Gemma Router] No sub-categories configured for this parent. Bypassing Step 2.",
-            file=sys.stderr,
+        log.debug(
+            "  -> [Gemma Router] No sub-categories configured for this parent. Bypassing Step 2."
         )
-        return top_parent, "General"
+        last_prefill_stats = stats
+        result["child"] = "General"
+        return result
 
-    print(
-        f"  -> [Gemma Router] Step 2: Asking Gemma for Child Category within '{top_parent}'...",
-        file=sys.stderr,
+    log.debug(
+        "  -> [Gemma Router] Step 2: Asking Gemma for Child Category within '%s'...",
+        top_parent,
     )
-    c_prompt = f"""You are an expert email routing AI. 
-This email belongs to the '{top_parent}' category. 
-Pick the most specific sub-category from this list: {children}.
-Output ONLY the exact sub-category name from the list. Do not explain.
+    c_prompt = build_child_prompt(email_prefix, top_parent)
+    if mode == "score":
+        top_child, result["child_scores"] = score_labels(c_prompt, children, "Child", stats)
+    else:
+        top_child = resolve_child(ask_gemma(c_prompt, "Child", stats), top_parent)
+    result["child"] = top_child
+
+    log.debug("  -> [Gemma Router] Step 2 resolved. Mapped to: [%s]", top_child)
+    log.debug(
+        "  -> [Gemma Router] Prefill tokens saved by prefix reuse: %d of %d",
+        stats["saved_tokens"],
+        stats["prompt_tokens"],
+    )
+
+    last_prefill_stats = stats
+    return result
 
-Email Content:
-{text_snippet}
 
-Sub-category Name:"""
+def classify_hierarchical(email_text: str) -> tuple[str, str]:
+    result = classify_hierarchical_with_scores(email_text)
+    return result["parent"], result["child"]
+
 
-    raw_child = ask_gemma(c_prompt, "Child")
+def classify_hierarchical_batch_with_scores(
+    email_texts: list[str], mode: Optional[str] = None
+) -> list[dict]:
+    """
+    Batched version of classify_hierarchical_with_scores(). Each chunk of
+    BATCH_SIZE emails goes through the Parent step as one multi-sequence
+    decode, then through the Child step as another; every email keeps its own
+    KV-cache sequence, so the Child step still reuses the email prefix.
+    """
+    mode = mode or LABEL_MODE
+    decoder = _get_decoder(BATCH_SIZE)
+    parents = ROUTABLE_PARENTS
+    results = []
 
-    top_child = next(
-        (c for c in children if c.lower() in raw_child.lower()), children[0]
+    for start in range(0, len(email_texts), BATCH_SIZE):
+        chunk = email_texts[start : start + BATCH_SIZE]
+        with metrics.subset(range(start, start + len(chunk))):
+            results.extend(_classify_hierarchical_chunk(decoder, chunk, parents, mode))
+
+    log.info(
+        "  -> [Gemma Router] Batch prefill: %d tokens evaluated, %d reused from KV cache",
+        decoder.prefilled_tokens,
+        decoder.saved_tokens,
     )
-    print(
-        f"  -> [Gemma Router] Step 2 resolved. Mapped to: [{top_child}]",
-        file=sys.stderr,
+    return results
+
+
+def _classify_hierarchical_chunk(
+    decoder, chunk: list[str], parents: tuple[str, ...], mode: str
+) -> list[dict]:
+    """Both TMH steps for up to BATCH_SIZE emails, one decoder sequence each."""
+    before = decoder.counters()
+    log.info("  -> [Gemma Router] Batch step 1: %d emails...", len(chunk))
+    prefixes = [build_email_prefix(email_snippet(text)) for text in chunk]
+    parent_prompts = [build_parent_prompt(prefix) for prefix in prefixes]
+
+    if mode == "score":
+        parent_scores = decoder.score_labels(parent_prompts, [parents] * len(chunk))
+        top_parents = [next(iter(scores)) for scores in parent_scores]
+    else:
+        parent_scores = [{} for _ in chunk]
+        top_parents = [
+            _parent_from_output(_clean_output(raw), parents)
+            for raw in decoder.generate(parent_prompts)
+        ]
+
+    # Prompts keep their slot so each email lands on its cached prefix;
+    # emails whose parent has no children leave their slot empty.
+    child_sets = [get_child_labels(parent) or None for parent in top_parents]
+    child_prompts = [
+        build_child_prompt(prefix, parent) if children else None
+        for prefix, parent, children in zip(prefixes, top_parents, child_sets)
+    ]
+
+    log.info("  -> [Gemma Router] Batch step 2: %d emails...", len(chunk))
+    if mode == "score":
+        child_scores = decoder.score_labels(child_prompts, child_sets)
+        top_children = [next(iter(scores), None) for scores in child_scores]
+    else:
+        child_scores = [{} for _ in chunk]
+        top_children = [
+            resolve_child(_clean_output(raw), parent) if children else None
+            for raw, parent, children in zip(
+                decoder.generate(child_prompts), top_parents, child_sets
+            )
+        ]
+
+    _record_decoder_work(decoder, before)
+    return [
+        {
+            "parent": parent,
+            "child": top_children[i] or "General",
+            "parent_scores": parent_scores[i],
+            "child_scores": child_scores[i],
+        }
+        for i, parent in enumerate(top_parents)
+    ]
+
+
+def classify_hierarchical_batch(email_texts: list[str]) -> list[tuple[str, str]]:
+    return [
+        (result["parent"], result["child"])
+        for result in classify_hierarchical_batch_with_scores(email_texts)
+    ]
+
+
+def classify_flat_with_scores(email_text: str) -> dict:
+    """
+    Single-pass alternative to the TMH path: scores all "Parent - Child"
+    labels from get_flat_labels() against one prompt, so each email costs one
+    LLM round trip instead of two. Returns the same dict shape as
+    classify_hierarchical_with_scores().
+    """
+    global last_prefill_stats
+
+    log.debug("  -> [Gemma Router] Flat mode: formatting payload...")
+    email_prefix = build_email_prefix(email_snippet(email_text))
+    stats = {"prompt_tokens": 0, "prefilled_tokens": 0, "saved_tokens": 0}
+
+    prompt = build_flat_prompt(email_prefix)
+    _, flat_scores = score_labels(prompt, ROUTABLE_FLAT_LABELS, "Flat", stats)
+    result = _split_flat_scores(flat_scores)
+
+    log.debug(
+        "  -> [Gemma Router] Flat label resolved. Mapped to: [%s - %s]",
+        result["parent"],
+        result["child"],
     )
+    last_prefill_stats = stats
+    return result
+
+
+def classify_flat(email_text: str) -> tuple[str, str]:
+    result = classify_flat_with_scores(email_text)
+    return result["parent"], result["child"]
+
+
+def classify_flat_batch_with_scores(email_texts: list[str]) -> list[dict]:
+    """Batched version of classify_flat_with_scores()."""
+    decoder = _get_decoder(BATCH_SIZE)
+    results = []
+
+    for start in range(0, len(email_texts), BATCH_SIZE):
+        chunk = email_texts[start : start + BATCH_SIZE]
+        log.info("  -> [Gemma Router] Flat batch: %d emails...", len(chunk))
+        before = decoder.counters()
+        prompts = [
+            build_flat_prompt(build_email_prefix(email_snippet(text))) for text in chunk
+        ]
+        for flat_scores in decoder.score_labels(prompts, [ROUTABLE_FLAT_LABELS] * len(chunk)):
+            results.append(_split_flat_scores(flat_scores))
+        with metrics.subset(range(start, start + len(chunk))):
+            _record_decoder_work(decoder, before)
+
+    return results
+
 
-    return top_parent, top_child
+def classify_flat_batch(email_texts: list[str]) -> list[tuple[str, str]]:
+    return [
+        (result["parent"], result["child"])
+        for result in classify_flat_batch_with_scores(email_texts)
+    ]
@@ -0,0 +1,296 @@
+"""
+Embedding-based nearest-centroid classifier.
+
+Every (Parent, Child) pair in CATEGORY_HIERARCHY gets one centroid vector.
+Emails are embedded with a small sentence-transformers model and compared to
+all centroids with a single matrix product. When the best label clearly beats
+the runner-up the answer is returned without touching Gemma; otherwise the
+caller escalates to classify_hierarchical().
+
+The centroids start as the embeddings of the label names. fit_centroids()
+(or `embedding_classifier.py <dataset_dir>`) moves them towards labelled
+examples and writes them to a file of their own, keyed by a digest of the
+training data; a pointer file makes the latest fit the one in use. Refitting
+on the same data always gives the same centroids, and cache_tag() names the
+fit so cached results from other centroids are not reused.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+from typing import Optional
+
+from invox.features.email_classification import preprocess
+from invox.features.email_classification.categories import CATEGORY_HIERARCHY
+from invox.features.email_classification.lazy_model import LazyModel
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.settings import CACHE_DIR
+
+EMBEDDING_MODEL = os.getenv(
+    "INVOX_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"
+)
+# Minimum cosine-similarity gap between the best and second-best label for the
+# fast path to answer on its own.
+CONFIDENT_MARGIN = float(os.getenv("INVOX_EMBEDDING_MARGIN", "0.05"))
+
+LABEL_PAIRS = [
+    (parent, child)
+    for parent, children in CATEGORY_HIERARCHY.items()
+    for child in children
+]
+
+_centroids = None
+# Training-data digest of the centroids in use ("names" when not fitted)
+_centroid_digest: Optional[str] = None
+
+log = get_logger("embedding_classifier")
+
+
+def _load_model():
+    from sentence_transformers import SentenceTransformer
+
+    log.info("  -> [Embedding Router] Loading %s...", EMBEDDING_MODEL)
+    return SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+
+
+embedding_model = LazyModel("Embedding Router", _load_model)
+
+
+def _get_model():
+    return embedding_model.get()
+
+
+def _label_text(parent: str, child: str) -> str:
+    if child == "Others":
+        return f"{parent} email (general)"
+    return f"{parent} email about {child}"
+
+
+def _embedding_text(email_text: str) -> str:
+    # The same subject/sender/body view Gemma and the student get
+    return preprocess.summarize(email_text)
+
+
+def _encode_emails(email_texts: list[str]) -> np.ndarray:
+    return _get_model().encode(
+        [_embedding_text(text) for text in email_texts],
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        batch_size=32,
+    )
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _centroid_key() -> str:
+    return hashlib.sha256(
+        json.dumps([EMBEDDING_MODEL, LABEL_PAIRS]).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+def centroid_cache_path() -> str:
+    """Cache file of the name-only centroids for the current model and hierarchy."""
+    return os.path.join(CACHE_DIR, "embeddings", f"centroids-{_centroid_key()}.npy")
+
+
+def fitted_centroid_path(digest: str) -> str:
+    """Cache file of the centroids fitted on the training data with `digest`."""
+    return os.path.join(
+        CACHE_DIR, "embeddings", f"centroids-{_centroid_key()}-fit-{digest}.npy"
+    )
+
+
+def _fitted_pointer_path() -> str:
+    return os.path.join(CACHE_DIR, "embeddings", f"centroids-{_centroid_key()}-fit.json")
+
+
+def training_digest(email_texts: list[str], labels: list[tuple[str, str]]) -> str:
+    """Digest of the labelled examples and of how they are embedded."""
+    digest = hashlib.sha256(f"summary:{preprocess.SUMMARY_TOKENS}".encode("utf-8"))
+    for text, (parent, child) in zip(email_texts, labels):
+        digest.update(f"\0{parent}\0{child}\0".encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _fitted_digest() -> Optional[str]:
+    """Digest of the latest fit whose centroids are still on disk, if any."""
+    try:
+        with open(_fitted_pointer_path(), "r", encoding="utf-8") as f:
+            digest = json.load(f)["digest"]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+    return digest if os.path.exists(fitted_centroid_path(digest)) else None
+
+
+def name_centroids() -> np.ndarray:
+    """
+    The (106, dim) matrix of unit-length label-name embeddings, built on first
+    use and cached to disk. Fitting always starts from these.
+    """
+    path = centroid_cache_path()
+    if os.path.exists(path):
+        return np.load(path)
+
+    log.info("  -> [Embedding Router] Embedding %d labels (first run)...", len(LABEL_PAIRS))
+    texts = [_label_text(parent, child) for parent, child in LABEL_PAIRS]
+    centroids = _normalize(
+        _get_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+    )
+    _save_array(path, centroids)
+    return centroids
+
+
+def load_centroids() -> np.ndarray:
+    """
+    Returns the (106, dim) matrix of unit-length label centroids in use: the
+    latest fit if there is one, else the name-only centroids.
+    """
+    global _centroids, _centroid_digest
+    if _centroids is not None:
+        return _centroids
+
+    digest = _fitted_digest()
+    if digest is not None:
+        _centroids = np.load(fitted_centroid_path(digest))
+    else:
+        _centroids = name_centroids()
+    _centroid_digest = digest or "names"
+    return _centroids
+
+
+def cache_tag() -> str:
+    """Identifies the embedding model and centroids, for result cache keys."""
+    if _centroid_digest is None:
+        digest = _fitted_digest()
+    else:
+        digest = _centroid_digest
+    return f"{EMBEDDING_MODEL}:{digest or 'names'}|margin>={CONFIDENT_MARGIN}"
+
+
+def fit_centroids(email_texts: list[str], labels: list[tuple[str, str]]) -> np.ndarray:
+    """
+    Moves each name-only centroid towards the mean embedding of its labelled
+    examples, saves the result under the training-data digest and makes it
+    the fit in use. Labels without examples keep their name-only vector.
+    """
+    global _centroids, _centroid_digest
+    base = name_centroids()
+    digest = training_digest(email_texts, labels)
+    embeddings = _encode_emails(email_texts)
+
+    index = {pair: i for i, pair in enumerate(LABEL_PAIRS)}
+    sums = np.zeros_like(base)
+    counts = np.zeros(len(LABEL_PAIRS))
+    for embedding, label in zip(embeddings, labels):
+        if label in index:
+            sums[index[label]] += embedding
+            counts[index[label]] += 1
+
+    has_examples = counts > 0
+    centroids = base.copy()
+    centroids[has_examples] = (
+        base[has_examples] + sums[has_examples] / counts[has_examples, None]
+    )
+    _centroids = _normalize(centroids)
+    _save_array(fitted_centroid_path(digest), _centroids)
+
+    pointer_path = _fitted_pointer_path()
+    with open(f"{pointer_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"digest": digest, "emails": len(email_texts)}, f)
+    os.replace(f"{pointer_path}.tmp", pointer_path)
+    _centroid_digest = digest
+    return _centroids
+
+
+def warmup() -> None:
+    """Loads the embedding model and label centroids ahead of the first email."""
+    _get_model()
+    load_centroids()
+
+
+def classify_by_embedding_batch(
+    email_texts: list[str], exclude_parents: tuple[str, ...] = ("Spam",)
+) -> list[dict]:
+    """
+    Nearest-centroid classification for many emails at once. Each result has
+    `parent`, `child`, `similarity`, `margin` (gap to the runner-up) and
+    `confident` (margin >= CONFIDENT_MARGIN).
+    """
+    centroids = load_centroids()
+    embeddings = _encode_emails(email_texts)
+
+    similarities = embeddings @ centroids.T
+    excluded = np.array([parent in exclude_parents for parent, _ in LABEL_PAIRS])
+    similarities[:, excluded] = -np.inf
+
+    top_two = np.argsort(-similarities, axis=1)[:, :2]
+    rows = np.arange(len(email_texts))
+    best = similarities[rows, top_two[:, 0]]
+    margins = best - similarities[rows, top_two[:, 1]]
+
+    results = []
+    for i in rows:
+        parent, child = LABEL_PAIRS[top_two[i, 0]]
+        results.append(
+            {
+                "parent": parent,
+                "child": child,
+                "similarity": float(best[i]),
+                "margin": float(margins[i]),
+                "confident": bool(margins[i] >= CONFIDENT_MARGIN),
+            }
+        )
+    return results
+
+
+def classify_by_embedding(
+    email_text: str, exclude_parents: tuple[str, ...] = ("Spam",)
+) -> dict:
+    result = classify_by_embedding_batch([email_text], exclude_parents)[0]
+    log.debug(
+        "  -> [Embedding Router] Nearest label: [%s - %s] (margin %.3f, confident=%s)",
+        result["parent"],
+        result["child"],
+        result["margin"],
+        result["confident"],
+    )
+    return result
+
+
+if __name__ == "__main__":
+    # Refit the centroids from a labelled dataset directory (NNN.txt + answer.txt)
+    if len(sys.argv) != 2:
+        print("Usage: embedding_classifier.py <dataset_dir>", file=sys.stderr)
+        sys.exit(1)
+
+    dataset_dir = sys.argv[1]
+    with open(os.path.join(dataset_dir, "answer.txt"), "r", encoding="utf-8") as f:
+        answers = [line.strip() for line in f if line.strip()]
+
+    texts, labels = [], []
+    for i, answer in enumerate(answers, start=1):
+        path = os.path.join(dataset_dir, f"{i:03d}.txt")
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+        parent, child = [part.strip() for part in answer.split(",", 1)]
+        labels.append((parent, child))
+
+    fit_centroids(texts, labels)
+    digest = training_digest(texts, labels)
+    print(f"Fitted centroids on {len(texts)} emails -> {fitted_centroid_path(digest)}")
@@ -0,0 +1,39 @@
+"""
+Thread-safe lazy holder for heavyweight models.
+
+Importing a pipeline module should be cheap; the cost of loading weights is
+paid on first use or explicitly through warmup(), whichever comes first.
+"""
+
+import time
+import threading
+from typing import Callable, Optional
+
+from invox.features.email_classification.log import get_logger
+
+log = get_logger("lazy_model")
+
+
+class LazyModel:
+    """Calls `loader` once, on the first get(), and caches what it returns."""
+
+    def __init__(self, name: str, loader: Callable[[], object]):
+        self.name = name
+        self._loader = loader
+        self._value = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    start_time = time.time()
+                    self._value = self._loader()
+                    self.load_seconds = time.time() - start_time
+                    log.info("  -> [%s] Loaded in %.2fs", self.name, self.load_seconds)
+        return self._value
@@ -0,0 +1,27 @@
+"""
+Leveled logging for the email classification pipeline.
+
+Progress messages go to stderr through the "invox" logger. INVOX_LOG_LEVEL
+picks what is shown: INFO (default) covers model loading and batch progress,
+DEBUG adds the per-email, per-step detail, WARNING keeps stderr quiet.
+Messages use %-style arguments, so a disabled level costs one level check.
+"""
+
+import os
+import sys
+import logging
+
+LOG_LEVEL = os.getenv("INVOX_LOG_LEVEL", "INFO").upper()
+
+_root = logging.getLogger("invox")
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for one pipeline module, e.g. get_logger("spam_detection")."""
+    return _root.getChild(name)
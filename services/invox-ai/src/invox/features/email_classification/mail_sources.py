@@ -0,0 +1,115 @@
+"""
+Streaming email sources for the pipeline (see pipeline.py).
+
+Each source is a generator of (name, email) pairs, where the email is its
+text or a callable that reads it, so whole archives go through in one pass
+without being listed or loaded up front:
+
+    mbox_source(path)      messages of an mbox file, split on "From " lines
+                           as the file is read; name "<file>:<n>"
+    maildir_source(path)   messages in new/ and cur/ of a Maildir, read by
+                           the pipeline's reader threads; name "new/<file>"
+    ndjson_source(stream)  one JSON object per line ({"id", "text"}, "email"
+                           also accepted) or a bare JSON string; stdin by
+                           default; name is the id or the line number
+
+mbox and Maildir messages are cut at INVOX_MAX_EMAIL_BYTES (the
+pre-processor reads no further), so one huge attachment does not grow
+memory either. Bytes are decoded as UTF-8, with replacement characters for
+anything that is not.
+"""
+
+import os
+import sys
+import json
+import functools
+from typing import BinaryIO, Callable, Iterator, Optional, Union
+
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.preprocess import MAX_EMAIL_BYTES
+
+MAILDIR_FOLDERS = ("new", "cur")
+
+log = get_logger("mail_sources")
+
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace")
+
+
+def mbox_source(path: str) -> Iterator[tuple[str, str]]:
+    """Messages of the mbox at `path`, in file order, one at a time."""
+    basename = os.path.basename(path)
+    count = 0
+    lines: list[bytes] = []
+    size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"From "):
+                if count:
+                    yield f"{basename}:{count}", _decode(b"".join(lines))
+                count += 1
+                lines, size = [], 0
+                continue
+            if count and size < MAX_EMAIL_BYTES:
+                lines.append(line[: MAX_EMAIL_BYTES - size])
+                size += len(lines[-1])
+        if count:
+            yield f"{basename}:{count}", _decode(b"".join(lines))
+
+
+def _read_message(path: str) -> str:
+    with open(path, "rb") as f:
+        return _decode(f.read(MAX_EMAIL_BYTES))
+
+
+def maildir_source(path: str) -> Iterator[tuple[str, Callable[[], str]]]:
+    """
+    (folder/file name, loader) per message of the Maildir at `path`, in
+    directory order. Maildir++ subfolders (.Sent, ...) are Maildirs of their
+    own and are not descended into.
+    """
+    if not os.path.isdir(os.path.join(path, "cur")):
+        raise FileNotFoundError(f"Not a Maildir (no cur/): {path}")
+    for folder in MAILDIR_FOLDERS:
+        folder_path = os.path.join(path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                yield f"{folder}/{entry.name}", functools.partial(
+                    _read_message, entry.path
+                )
+
+
+def ndjson_source(
+    stream: Optional[Union[BinaryIO, Iterator[bytes]]] = None,
+) -> Iterator[tuple[str, str]]:
+    """
+    Emails from JSON lines on `stream` (stdin by default). Lines that are not
+    JSON or carry no text are logged and skipped.
+    """
+    if stream is None:
+        stream = sys.stdin.buffer
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            log.warning("[INGEST] Skipping NDJSON line %d: %s", line_number, e)
+            continue
+
+        if isinstance(record, str):
+            name, text = str(line_number), record
+        elif isinstance(record, dict):
+            name = str(record.get("id", line_number))
+            text = record.get("text", record.get("email"))
+        else:
+            name, text = str(line_number), None
+        if not isinstance(text, str):
+            log.warning("[INGEST] Skipping NDJSON line %d: no email text", line_number)
+            continue
+        yield name, text
@@ -0,0 +1,235 @@
+"""
+Per-email pipeline metrics.
+
+A classification call opens a collection with one record per email; the
+stages it runs through add what they measured to the records of the emails
+they handled: spam-gate latency and tier, prompt/prefill/saved token counts,
+prefill and decode time, decode steps and tokens, and where the answer came
+from (result cache, near-duplicate reuse or the models).
+
+Finished records go to two optional sinks:
+
+    INVOX_METRICS_JSONL   one JSON object per email, appended to this path
+                          ("-" for stderr)
+    render_prometheus()   process-wide totals in the Prometheus text format,
+                          served by the daemon at GET /metrics
+
+With neither enabled nothing is collected and every hook returns at once.
+Work shared by a batch (one multi-sequence decode, one BERT-tiny call) is
+split evenly over the emails in it.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+METRICS_JSONL = os.getenv("INVOX_METRICS_JSONL", "")
+
+_prometheus = False
+_jsonl_file = None
+_lock = threading.Lock()
+# Records of the emails the running stage is working on
+_current: ContextVar[Optional[list[dict]]] = ContextVar("invox_metrics", default=None)
+
+# Process-wide aggregates for render_prometheus()
+_sums: dict[str, float] = {}
+_counts: dict[str, int] = {}
+_labels: dict[tuple[str, str], int] = {}
+_emails_total = 0
+
+
+def configure(jsonl: Optional[str] = None, prometheus: Optional[bool] = None) -> None:
+    """Turns the JSONL sink (path or "-") and/or the Prometheus aggregates on."""
+    global METRICS_JSONL, _prometheus, _jsonl_file
+    if jsonl is not None and jsonl != METRICS_JSONL:
+        with _lock:
+            if _jsonl_file is not None and _jsonl_file is not sys.stderr:
+                _jsonl_file.close()
+            _jsonl_file = None
+            METRICS_JSONL = jsonl
+    if prometheus is not None:
+        _prometheus = prometheus
+
+
+def enabled() -> bool:
+    return bool(METRICS_JSONL) or _prometheus
+
+
+@contextmanager
+def collect(email_texts: list[str], **fields):
+    """
+    Opens one record per email for the duration of the block and emits them
+    when it ends. `fields` are copied into every record; each record also gets
+    a short content hash as `email_id` and its share of the wall time as
+    `total_ms`.
+    """
+    records = start(email_texts, **fields)
+    if records is None:
+        yield
+        return
+
+    token = _current.set(records)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        for record in records:
+            record["total_ms"] = elapsed_ms / max(len(records), 1)
+        _finish(records)
+
+
+def start(email_texts: list[str], keep: bool = False, **fields) -> Optional[list[dict]]:
+    """
+    Opens records like collect() does, for emails whose work is not one
+    block (the streaming pipeline): bind them with use() around each piece
+    of work and pass them to finish() at the end. None when disabled,
+    unless `keep` asks for records the caller reads itself.
+    """
+    if not (keep or enabled()):
+        return None
+    return [
+        {
+            "email_id": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16],
+            "pid": os.getpid(),
+            **fields,
+        }
+        for text in email_texts
+    ]
+
+
+@contextmanager
+def use(records: Optional[list[dict]]):
+    """Makes `records` (from start()) the current records inside the block."""
+    if records is None:
+        yield
+        return
+    token = _current.set(records)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def finish(records: Optional[list[dict]], total_ms: float) -> None:
+    """Emits records from start(), each with `total_ms` as its wall time."""
+    if records is None:
+        return
+    for record in records:
+        record["total_ms"] = total_ms
+    _finish(records)
+
+
+@contextmanager
+def subset(indices):
+    """Narrows the current records to `indices` (positions within them)."""
+    records = _current.get()
+    if records is None:
+        yield
+        return
+    token = _current.set([records[i] for i in indices])
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def add(index: Optional[int] = None, **values: float) -> None:
+    """
+    Adds numeric `values` to the record at `index` of the current records, or
+    spreads them evenly over all of them when `index` is None.
+    """
+    records = _current.get()
+    if not records:
+        return
+    targets = records if index is None else [records[index]]
+    for name, value in values.items():
+        share = value / len(targets)
+        for record in targets:
+            record[name] = record.get(name, 0) + share
+
+
+def tag(index: Optional[int] = None, **values) -> None:
+    """Sets non-numeric fields (tier, cache outcome, ...) like add() does."""
+    records = _current.get()
+    if not records:
+        return
+    for record in records if index is None else [records[index]]:
+        record.update(values)
+
+
+@contextmanager
+def stage(name: str):
+    """Times the block and add()s it to the current records as `<name>_ms`."""
+    if not _current.get():
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(**{f"{name}_ms": (time.perf_counter() - start_time) * 1000})
+
+
+def _finish(records: list[dict]) -> None:
+    global _jsonl_file, _emails_total
+    for record in records:
+        if record.get("decode_steps"):
+            record["tokens_per_step"] = record["decode_tokens"] / record["decode_steps"]
+        for name, value in record.items():
+            if isinstance(value, float):
+                record[name] = round(value, 3)
+
+    with _lock:
+        if _prometheus:
+            _emails_total += len(records)
+            for record in records:
+                for name, value in record.items():
+                    if name in ("email_id", "pid"):
+                        continue
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        _sums[name] = _sums.get(name, 0.0) + value
+                        _counts[name] = _counts.get(name, 0) + 1
+                    else:
+                        key = (name, str(value))
+                        _labels[key] = _labels.get(key, 0) + 1
+
+        if METRICS_JSONL:
+            if _jsonl_file is None:
+                _jsonl_file = (
+                    sys.stderr
+                    if METRICS_JSONL == "-"
+                    else open(METRICS_JSONL, "a", encoding="utf-8")
+                )
+            # One write per batch keeps lines from different workers whole
+            _jsonl_file.write("".join(json.dumps(r) + "\n" for r in records))
+            _jsonl_file.flush()
+
+
+def render_prometheus() -> str:
+    """Totals since start-up in the Prometheus text exposition format."""
+    with _lock:
+        lines = [
+            "# TYPE invox_emails_total counter",
+            f"invox_emails_total {_emails_total}",
+        ]
+        for name in sorted(_sums):
+            metric = f"invox_email_{name}"
+            lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_sum {_sums[name]:.3f}")
+            lines.append(f"{metric}_count {_counts[name]}")
+        for field in sorted({name for name, _ in _labels}):
+            metric = f"invox_emails_by_{field}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (name, value), count in sorted(_labels.items()):
+                if name == field:
+                    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+                    lines.append(f'{metric}{{{field}="{escaped}"}} {count}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,233 @@
+"""
+Local model registry.
+
+Maps logical model names ("gemma-router", "spam-gate", ...) to weights on
+disk so start-up never needs the network. Entries come from a JSON file
+(INVOX_MODEL_REGISTRY, default <INVOX_CACHE_DIR>/models.json):
+
+    {
+      "models": {
+        "gemma-router": {
+          "path": "/mnt/models/gemma-2-9b-it-Q4_K_M.gguf",
+          "sha256": "4f2c..."
+        },
+        "spam-gate": {
+          "path": "/mnt/models/bert-tiny-finetuned-enron-spam-detection",
+          "sha256": {"model.safetensors": "9a1e..."}
+        }
+      }
+    }
+
+Callers pass the hub coordinates they were configured with. Those set
+explicitly through an INVOX_* variable (`pinned`, e.g. INVOX_MODEL_FILE) win
+over the registry: an entry is only used when it names the same values
+(`filename`, else the file name of `path`; `repo_id`), so a comparison run
+that picks another quantization never gets the registry's file instead.
+
+`path` may be a single file (GGUF) or a directory (HF model folder); for a
+directory `sha256` maps relative file names to digests. Checksums are
+verified once per (path, size, mtime) and remembered in the cache dir, so a
+multi-GB GGUF is not re-hashed on every start. Entries without a usable
+`path` fall back to the Hugging Face cache (no HTTP when the files are
+already cached) and, unless INVOX_OFFLINE / HF_HUB_OFFLINE is set, to a
+download.
+"""
+
+import os
+import sys
+import json
+import hashlib
+import threading
+
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.settings import CACHE_DIR
+
+REGISTRY_PATH = os.getenv("INVOX_MODEL_REGISTRY", os.path.join(CACHE_DIR, "models.json"))
+VERIFIED_PATH = os.path.join(CACHE_DIR, "verified_models.json")
+
+log = get_logger("model_registry")
+
+_lock = threading.Lock()
+_resolved: dict[str, str] = {}
+_tags: dict[str, str] = {}
+
+
+class ModelResolutionError(RuntimeError):
+    pass
+
+
+def is_offline() -> bool:
+    return os.getenv("INVOX_OFFLINE", "0") == "1" or os.getenv("HF_HUB_OFFLINE", "0") == "1"
+
+
+def load_registry() -> dict:
+    """Returns the `models` mapping of the registry file ({} if there is none)."""
+    if not os.path.exists(REGISTRY_PATH):
+        return {}
+    with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
+        return json.load(f).get("models", {})
+
+
+def sha256_file(path: str, chunk_size: int = 8 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_verified() -> dict:
+    try:
+        with open(VERIFIED_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_verified(verified: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(VERIFIED_PATH), exist_ok=True)
+        tmp_path = f"{VERIFIED_PATH}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(verified, f, indent=2)
+        os.replace(tmp_path, VERIFIED_PATH)
+    except OSError:
+        # A read-only cache dir only costs a re-hash on the next start
+        pass
+
+
+def verify_file(path: str, expected_sha256: str) -> None:
+    """Raises ModelResolutionError if `path` does not hash to `expected_sha256`."""
+    stat = os.stat(path)
+    stamp = f"{stat.st_size}:{stat.st_mtime_ns}:{expected_sha256}"
+    verified = _load_verified()
+    if verified.get(os.path.abspath(path)) == stamp:
+        return
+
+    log.info("  -> [Model Registry] Verifying checksum of %s...", path)
+    actual = sha256_file(path)
+    if actual != expected_sha256.lower():
+        raise ModelResolutionError(
+            f"Checksum mismatch for {path}: expected {expected_sha256}, got {actual}"
+        )
+    verified[os.path.abspath(path)] = stamp
+    _save_verified(verified)
+
+
+def _verify_entry(name: str, entry: dict, path: str) -> None:
+    expected = entry.get("sha256")
+    if not expected:
+        return
+    if os.path.isdir(path):
+        if not isinstance(expected, dict):
+            raise ModelResolutionError(
+                f"Model '{name}' is a directory; sha256 must map file names to digests"
+            )
+        for relative, digest in expected.items():
+            verify_file(os.path.join(path, relative), digest)
+    else:
+        verify_file(path, expected)
+
+
+def _resolve_from_hub(name: str, entry: dict) -> str:
+    repo_id = entry.get("repo_id")
+    if not repo_id:
+        raise ModelResolutionError(f"Model '{name}' has neither a local path nor a repo_id")
+
+    from huggingface_hub import hf_hub_download, snapshot_download
+
+    kwargs = {"repo_id": repo_id, "token": os.getenv("HF_TOKEN")}
+    if entry.get("revision"):
+        kwargs["revision"] = entry["revision"]
+    fetch = snapshot_download
+    if entry.get("filename"):
+        fetch = hf_hub_download
+        kwargs["filename"] = entry["filename"]
+
+    try:
+        # Already in the local HF cache: no HTTP at all
+        return fetch(local_files_only=True, **kwargs)
+    except Exception:
+        if is_offline():
+            raise ModelResolutionError(
+                f"Model '{name}' ({repo_id}) is not available locally and offline mode is on"
+            )
+
+    log.info("  -> [Model Registry] Downloading '%s' from %s...", name, repo_id)
+    return fetch(**kwargs)
+
+
+def _matches(entry: dict, key: str, value: str) -> bool:
+    if entry.get(key):
+        return entry[key] == value
+    path = entry.get("path")
+    return key == "filename" and bool(path) and os.path.basename(path) == value
+
+
+def _entry(name: str, pinned: tuple, defaults: dict) -> dict:
+    registered = load_registry().get(name, {})
+    mismatched = [key for key in pinned if not _matches(registered, key, defaults[key])]
+    if registered and mismatched:
+        log.warning(
+            "  -> [Model Registry] Ignoring the registry entry for '%s': %s set explicitly",
+            name,
+            ", ".join(f"{key}={defaults[key]}" for key in mismatched),
+        )
+        registered = {}
+    return {**defaults, **registered}
+
+
+def model_tag(name: str, pinned: tuple = (), **defaults) -> str:
+    """
+    What resolve_model() with the same arguments loads, for result cache
+    keys: the registry path and checksum, or the hub coordinates.
+    """
+    key = f"{name}|{pinned}|{sorted(defaults.items())}"
+    with _lock:
+        if key not in _tags:
+            entry = _entry(name, pinned, defaults)
+            fields = ("path", "sha256") if entry.get("path") else ("repo_id", "filename")
+            values = [json.dumps(entry.get(field), sort_keys=True) for field in fields]
+            _tags[key] = hashlib.sha256("|".join(values).encode()).hexdigest()[:12]
+        return f"{name}:{_tags[key]}"
+
+
+def resolve_model(name: str, pinned: tuple = (), **defaults) -> str:
+    """
+    Returns a local filesystem path for logical model `name`, verifying its
+    checksum when the registry provides one. `defaults` (repo_id, filename,
+    revision) are the hub coordinates used when the registry has no entry;
+    those named in `pinned` were set explicitly and override the registry.
+    """
+    with _lock:
+        if name in _resolved:
+            return _resolved[name]
+
+        entry = _entry(name, pinned, defaults)
+        if not entry:
+            raise ModelResolutionError(f"Unknown model '{name}'")
+
+        path = entry.get("path")
+        if path and os.path.exists(path):
+            resolved = path
+        elif path and is_offline():
+            raise ModelResolutionError(f"Model '{name}' path does not exist: {path}")
+        else:
+            resolved = _resolve_from_hub(name, entry)
+
+        _verify_entry(name, entry, resolved)
+        log.info("  -> [Model Registry] '%s' -> %s", name, resolved)
+        _resolved[name] = resolved
+        return resolved
+
+
+if __name__ == "__main__":
+    # Resolve (and verify) every model in the registry file, e.g. as a deploy-time check
+    failed = False
+    for model_name in load_registry():
+        try:
+            print(f"{model_name}: {resolve_model(model_name)}")
+        except ModelResolutionError as e:
+            failed = True
+            print(f"{model_name}: ERROR {e}")
+    sys.exit(1 if failed else 0)
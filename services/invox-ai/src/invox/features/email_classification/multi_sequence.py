@@ -0,0 +1,369 @@
+"""
+Multi-sequence greedy decoding on top of llama.cpp.
+
+The high-level `Llama` object only drives one sequence at a time. This module
+opens a second llama.cpp context on the same (already loaded) model weights
+with one KV-cache sequence per prompt, so a whole batch of prompts is
+prefilled and decoded together in shared `llama_decode` calls.
+
+It can also score a fixed set of candidate labels instead of generating free
+text: every label's log-likelihood is read off a single extra forward pass in
+which the labels branch off the cached prompt as a token tree.
+"""
+
+import time
+from typing import Optional
+
+import numpy as np
+import llama_cpp
+
+
+def _new_context(model, params):
+    # llama_new_context_with_model was renamed in newer llama.cpp builds
+    init = getattr(llama_cpp, "llama_init_from_model", None)
+    if init is None:
+        init = llama_cpp.llama_new_context_with_model
+    return init(model, params)
+
+
+def _seq_rm(ctx, seq_id: int, p0: int, p1: int) -> None:
+    """Drops KV-cache cells of `seq_id` in positions [p0, p1). p1 = -1 means to the end."""
+    if hasattr(llama_cpp, "llama_memory_seq_rm"):
+        llama_cpp.llama_memory_seq_rm(llama_cpp.llama_get_memory(ctx), seq_id, p0, p1)
+    elif hasattr(llama_cpp, "llama_kv_self_seq_rm"):
+        llama_cpp.llama_kv_self_seq_rm(ctx, seq_id, p0, p1)
+    else:
+        llama_cpp.llama_kv_cache_seq_rm(ctx, seq_id, p0, p1)
+
+
+def _seq_cp(ctx, src: int, dst: int, p0: int, p1: int) -> None:
+    """Makes `dst` share the KV-cache cells of `src` in positions [p0, p1)."""
+    if hasattr(llama_cpp, "llama_memory_seq_cp"):
+        llama_cpp.llama_memory_seq_cp(llama_cpp.llama_get_memory(ctx), src, dst, p0, p1)
+    elif hasattr(llama_cpp, "llama_kv_self_seq_cp"):
+        llama_cpp.llama_kv_self_seq_cp(ctx, src, dst, p0, p1)
+    else:
+        llama_cpp.llama_kv_cache_seq_cp(ctx, src, dst, p0, p1)
+
+
+def _logsumexp(logits: np.ndarray) -> float:
+    peak = float(logits.max())
+    return peak + float(np.log(np.exp(logits - peak).sum()))
+
+
+def common_prefix_len(a: list[int], b: list[int]) -> int:
+    """Returns the number of leading tokens `a` and `b` have in common."""
+    shared = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        shared += 1
+    return shared
+
+
+class MultiSequenceDecoder:
+    """
+    Greedy decoder that runs up to `n_seq` prompts through one llama.cpp
+    context, one KV-cache sequence per prompt.
+
+    Each sequence remembers the tokens it holds in the KV cache. When the
+    next prompt for that slot starts with the same tokens (e.g. the Child
+    step of the same email), only the differing suffix is prefilled.
+
+    `n_scratch` extra sequence ids are reserved for score_labels(), where each
+    multi-token candidate label temporarily gets its own branch of a prompt.
+    """
+
+    def __init__(
+        self,
+        llm,
+        n_seq: int,
+        n_ctx_per_seq: int = 1024,
+        n_batch: int = 512,
+        n_scratch: int = 0,
+    ):
+        self.llm = llm
+        self.n_seq = n_seq
+        self.n_scratch = n_scratch
+        self.n_ctx_per_seq = n_ctx_per_seq
+        self.n_batch = n_batch
+        self.n_vocab = llm.n_vocab()
+
+        params = llama_cpp.llama_context_default_params()
+        # Label branches of one scoring round never exceed a single batch
+        params.n_ctx = n_seq * n_ctx_per_seq + (n_batch if n_scratch else 0)
+        params.n_batch = n_batch
+        params.n_ubatch = n_batch
+        params.n_seq_max = n_seq + n_scratch
+        params.n_threads = llm.n_threads
+        params.n_threads_batch = llm.n_threads_batch
+        if hasattr(params, "kv_unified"):
+            # One shared cell pool; a short sequence leaves room for a long one
+            params.kv_unified = True
+
+        self.ctx = _new_context(llm.model, params)
+        if not self.ctx:
+            raise RuntimeError("Failed to create multi-sequence llama.cpp context")
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, n_seq + n_scratch)
+
+        self.seq_tokens: list[list[int]] = [[] for _ in range(n_seq)]
+        self.end_of_turn = llm.tokenize(b"<end_of_turn>", add_bos=False, special=True)[0]
+        self.stop_tokens = {llm.token_eos(), self.end_of_turn}
+        self._label_tokens_cache: dict[tuple[str, ...], list[list[int]]] = {}
+        self.saved_tokens = 0
+        self.prefilled_tokens = 0
+        # Time spent in llama_decode, split into prompt prefill and the
+        # generation/label-scoring steps after it (see _decode())
+        self.prefill_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.decode_steps = 0
+        self.decode_tokens = 0
+
+    def close(self) -> None:
+        if self.ctx is not None:
+            llama_cpp.llama_batch_free(self.batch)
+            llama_cpp.llama_free(self.ctx)
+            self.ctx = None
+
+    def __del__(self):
+        self.close()
+
+    # --- Low-level batch helpers ---
+
+    def _add(self, token: int, pos: int, seq_ids: list[int], want_logits: bool) -> int:
+        i = self.batch.n_tokens
+        self.batch.token[i] = token
+        self.batch.pos[i] = pos
+        self.batch.n_seq_id[i] = len(seq_ids)
+        for k, seq_id in enumerate(seq_ids):
+            self.batch.seq_id[i][k] = seq_id
+        self.batch.logits[i] = want_logits
+        self.batch.n_tokens += 1
+        return i
+
+    def _decode(self, prefill: bool = False) -> None:
+        start_time = time.perf_counter()
+        rc = llama_cpp.llama_decode(self.ctx, self.batch)
+        if rc != 0:
+            raise RuntimeError(f"llama_decode failed with code {rc}")
+        elapsed = time.perf_counter() - start_time
+        if prefill:
+            self.prefill_seconds += elapsed
+        else:
+            self.decode_seconds += elapsed
+            self.decode_steps += 1
+            self.decode_tokens += self.batch.n_tokens
+
+    def _logits(self, batch_index: int) -> np.ndarray:
+        ptr = llama_cpp.llama_get_logits_ith(self.ctx, batch_index)
+        return np.ctypeslib.as_array(ptr, shape=(self.n_vocab,))
+
+    # --- Public API ---
+
+    def counters(self) -> dict:
+        """Running token and timing totals; callers report deltas between two snapshots."""
+        return {
+            "saved_tokens": self.saved_tokens,
+            "prefilled_tokens": self.prefilled_tokens,
+            "prefill_seconds": self.prefill_seconds,
+            "decode_seconds": self.decode_seconds,
+            "decode_steps": self.decode_steps,
+            "decode_tokens": self.decode_tokens,
+        }
+
+    def tokenize(self, prompt: str) -> list[int]:
+        return self.llm.tokenize(prompt.encode("utf-8"), special=True)
+
+    def prefill(
+        self, prompt_tokens: list[Optional[list[int]]]
+    ) -> list[Optional[np.ndarray]]:
+        """
+        Loads prompt `i` into sequence `i`, reusing whatever prefix that
+        sequence already holds. Returns the next-token logits of every prompt.
+        A `None` entry leaves its sequence untouched and yields `None`.
+        """
+        if len(prompt_tokens) > self.n_seq:
+            raise ValueError(
+                f"Got {len(prompt_tokens)} prompts but the decoder holds {self.n_seq} sequences"
+            )
+
+        pending = []  # (seq_id, pos, token, is_last)
+        for seq_id, tokens in enumerate(prompt_tokens):
+            if tokens is None:
+                continue
+            if len(tokens) >= self.n_ctx_per_seq:
+                raise ValueError(
+                    f"Prompt of {len(tokens)} tokens does not fit n_ctx_per_seq={self.n_ctx_per_seq}"
+                )
+            # Always re-evaluate the last prompt token so we get fresh logits
+            keep = min(common_prefix_len(self.seq_tokens[seq_id], tokens), len(tokens) - 1)
+            _seq_rm(self.ctx, seq_id, keep, -1)
+            self.seq_tokens[seq_id] = list(tokens)
+            self.saved_tokens += keep
+            self.prefilled_tokens += len(tokens) - keep
+            for pos in range(keep, len(tokens)):
+                pending.append((seq_id, pos, tokens[pos], pos == len(tokens) - 1))
+
+        last_logits: list[np.ndarray] = [None] * len(prompt_tokens)
+        for start in range(0, len(pending), self.n_batch):
+            chunk = pending[start : start + self.n_batch]
+            self.batch.n_tokens = 0
+            for seq_id, pos, token, is_last in chunk:
+                self._add(token, pos, [seq_id], is_last)
+            self._decode(prefill=True)
+            for batch_index, (seq_id, _, _, is_last) in enumerate(chunk):
+                if is_last:
+                    last_logits[seq_id] = self._logits(batch_index).copy()
+        return last_logits
+
+    def generate(
+        self, prompts: list[Optional[str]], max_tokens: int = 15
+    ) -> list[str]:
+        """
+        Greedy (temperature 0) completion of every prompt in one shared decode
+        loop. Generation stops at <end_of_turn>, EOS or a newline. `None`
+        prompts are skipped and complete to an empty string.
+        """
+        logits = self.prefill([self.tokenize(p) if p is not None else None for p in prompts])
+        next_token = {
+            seq_id: int(np.argmax(l)) for seq_id, l in enumerate(logits) if l is not None
+        }
+        outputs: list[list[int]] = [[] for _ in prompts]
+
+        for _ in range(max_tokens):
+            self.batch.n_tokens = 0
+            slots = []
+            for seq_id, token in next_token.items():
+                if token in self.stop_tokens:
+                    continue
+                outputs[seq_id].append(token)
+                if len(outputs[seq_id]) >= max_tokens:
+                    continue
+                if b"\n" in self.llm.detokenize([token]):
+                    continue
+                pos = len(self.seq_tokens[seq_id])
+                slots.append((seq_id, self._add(token, pos, [seq_id], True)))
+                self.seq_tokens[seq_id].append(token)
+
+            if not slots:
+                break
+            self._decode()
+            next_token = {
+                seq_id: int(np.argmax(self._logits(batch_index)))
+                for seq_id, batch_index in slots
+            }
+
+        texts = []
+        for tokens in outputs:
+            text = self.llm.detokenize(tokens).decode("utf-8", errors="ignore")
+            texts.append(text.split("\n")[0])
+        return texts
+
+    def label_tokens(self, labels: list[str]) -> list[list[int]]:
+        """
+        Token ids of each label as the model would emit it right after the
+        prompt. A label whose tokens are a prefix of another label's tokens
+        gets <end_of_turn> appended so that the two stay distinguishable.
+        """
+        key = tuple(labels)
+        if key not in self._label_tokens_cache:
+            seqs = [
+                self.llm.tokenize(label.encode("utf-8"), add_bos=False, special=False)
+                for label in labels
+            ]
+            for i, tokens in enumerate(seqs):
+                if any(
+                    len(other) > len(tokens) and other[: len(tokens)] == tokens
+                    for other in seqs
+                ):
+                    seqs[i] = tokens + [self.end_of_turn]
+            self._label_tokens_cache[key] = seqs
+        return self._label_tokens_cache[key]
+
+    def score_labels(
+        self,
+        prompts: list[Optional[str]],
+        label_sets: list[Optional[list[str]]],
+    ) -> list[dict[str, float]]:
+        """
+        Ranks the candidate labels of each prompt by the log-likelihood the
+        model assigns to them as the completion. Returns one
+        {label: probability} dict per prompt, renormalized over its candidates
+        and sorted from most to least likely. `None` prompts yield `{}`.
+
+        Single-token labels are read straight off the prompt's next-token
+        logits. Multi-token labels are evaluated in one extra decode: each gets
+        a scratch sequence sharing the prompt's KV cells, and a token common to
+        several labels is evaluated once on behalf of all of them.
+        """
+        root_logits = self.prefill(
+            [self.tokenize(p) if p is not None else None for p in prompts]
+        )
+
+        scores: list[dict[str, float]] = [{} for _ in prompts]
+        work = []  # (seq_id, label, tokens) for labels longer than one token
+        for seq_id, labels in enumerate(label_sets):
+            if labels is None or root_logits[seq_id] is None:
+                continue
+            logits = root_logits[seq_id]
+            norm = _logsumexp(logits)
+            for label, tokens in zip(labels, self.label_tokens(labels)):
+                scores[seq_id][label] = float(logits[tokens[0]]) - norm
+                if len(tokens) > 1:
+                    work.append((seq_id, label, tokens))
+
+        if work and self.n_scratch == 0:
+            raise ValueError("Scoring multi-token labels needs n_scratch > 0")
+
+        start = 0
+        while start < len(work):
+            # Fill one round: as many labels as there are scratch sequences,
+            # as long as the token tree fits into a single batch.
+            nodes: dict[tuple, list[int]] = {}
+            items = []
+            while start < len(work) and len(items) < self.n_scratch:
+                seq_id, label, tokens = work[start]
+                prefixes = [(seq_id, tuple(tokens[:d])) for d in range(1, len(tokens))]
+                new_nodes = sum(1 for key in prefixes if key not in nodes)
+                if items and len(nodes) + new_nodes > self.n_batch:
+                    break
+                scratch_id = self.n_seq + len(items)
+                for key in prefixes:
+                    nodes.setdefault(key, []).append(scratch_id)
+                items.append((seq_id, label, tokens, scratch_id))
+                start += 1
+
+            for seq_id, _, _, scratch_id in items:
+                _seq_cp(self.ctx, seq_id, scratch_id, 0, -1)
+
+            self.batch.n_tokens = 0
+            node_index = {}
+            for (seq_id, prefix), scratch_ids in nodes.items():
+                pos = len(self.seq_tokens[seq_id]) + len(prefix) - 1
+                node_index[(seq_id, prefix)] = self._add(prefix[-1], pos, scratch_ids, True)
+            self._decode()
+
+            norms = {}
+            for seq_id, label, tokens, _ in items:
+                for d in range(1, len(tokens)):
+                    key = (seq_id, tuple(tokens[:d]))
+                    logits = self._logits(node_index[key])
+                    if key not in norms:
+                        norms[key] = _logsumexp(logits)
+                    scores[seq_id][label] += float(logits[tokens[d]]) - norms[key]
+
+            for _, _, _, scratch_id in items:
+                _seq_rm(self.ctx, scratch_id, 0, -1)
+
+        distributions = []
+        for label_scores in scores:
+            if not label_scores:
+                distributions.append({})
+                continue
+            labels = list(label_scores)
+            logps = np.array([label_scores[label] for label in labels])
+            probs = np.exp(logps - logps.max())
+            probs /= probs.sum()
+            order = np.argsort(-probs)
+            distributions.append({labels[i]: float(probs[i]) for i in order})
+        return distributions
@@ -0,0 +1,174 @@
+"""
+MinHash-LSH near-duplicate detection for templated mail.
+
+Automated emails (order confirmations, security alerts, newsletters) are
+mostly fixed text with a few substituted values such as order numbers, case
+IDs or dates. Tokens containing digits are masked before shingling, so two
+renders of the same template produce almost the same shingle set and a
+previously computed label can be reused instead of calling the LLM again.
+
+Where a message comes from is not a template value: the sender domain and
+the hosts of linked URLs are left unmasked and also kept as the
+fingerprint's `origin`, which must match exactly. A lookalike sender or a
+link to a bare IP never inherits the label of the genuine template.
+
+MinHash banding only proposes candidates; each candidate is then verified
+with the exact Jaccard similarity of the stored shingle hashes. Templates
+shared across categories (same body, different category words) sit only a
+few points of Jaccard apart, so the threshold is deliberately strict.
+"""
+
+import os
+import re
+import random
+import hashlib
+import threading
+from array import array
+from typing import Optional
+
+SHINGLE_SIZE = 3
+NUM_BANDS = 8
+ROWS_PER_BAND = 4
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+# Minimum exact Jaccard similarity for two emails to share a label
+DEFAULT_THRESHOLD = 0.95
+# Emails kept per index; a few KB of shingle hashes each
+DEFAULT_MAX_ENTRIES = int(os.getenv("INVOX_NEAR_DUPLICATE_MAX", "200000"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_WORD_RE = re.compile(r"[a-z0-9@._-]+")
+_HAS_DIGIT_RE = re.compile(r"\d")
+_URL_HOST_RE = re.compile(r"\b[a-z][a-z0-9+.-]*://([^/\s:?#>\"'@]+)")
+_SENDER_RE = re.compile(
+    r"^(?:from|reply-to|return-path):[^\n]*?@([a-z0-9.-]+)", re.MULTILINE
+)
+
+
+def email_origin(email_text: str) -> frozenset[str]:
+    """Sender (From/Reply-To/Return-Path) domains and URL hosts of the email."""
+    text = email_text.lower()
+    hosts = {host.rstrip(".") for host in _URL_HOST_RE.findall(text)}
+    senders = {domain.rstrip(".") for domain in _SENDER_RE.findall(text)}
+    return frozenset(hosts | {f"@{domain}" for domain in senders})
+
+
+def _mask(word: str, origin: frozenset[str]) -> str:
+    if not _HAS_DIGIT_RE.search(word):
+        return word
+    # Addresses and hosts keep their digits: bank1-secure.com is not bank.com
+    domain = word.rsplit("@", 1)[-1].strip("._-")
+    if domain in origin or f"@{domain}" in origin:
+        return word
+    return "#"
+
+
+def shingle_hashes(
+    email_text: str, origin: Optional[frozenset[str]] = None
+) -> frozenset[int]:
+    """
+    64-bit hashes of the email's word 3-shingles, with numeric tokens masked
+    except for the sender domains and URL hosts in `origin`.
+    """
+    if origin is None:
+        origin = email_origin(email_text)
+    words = [_mask(word, origin) for word in _WORD_RE.findall(email_text.lower())]
+    shingles = {
+        " ".join(words[i : i + SHINGLE_SIZE])
+        for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))
+    }
+    return frozenset(
+        int.from_bytes(
+            hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for s in shingles
+    )
+
+
+def minhash(hashes: frozenset[int]) -> tuple[int, ...]:
+    if not hashes:
+        return (0,) * NUM_PERM
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS
+    )
+
+
+class Fingerprint:
+    """Shingle hashes, MinHash signature and origin of one email."""
+
+    __slots__ = ("hashes", "signature", "origin")
+
+    def __init__(self, email_text: str):
+        self.origin = email_origin(email_text)
+        self.hashes = shingle_hashes(email_text, self.origin)
+        self.signature = minhash(self.hashes)
+
+
+class NearDuplicateIndex:
+    """
+    Stores (fingerprint, value) pairs and returns the stored value of the most
+    similar previous email when its Jaccard similarity is >= `threshold`.
+    Once it holds `max_entries` emails it stops adding, so a long stream keeps
+    the templates it met first in bounded memory. Safe to share between threads.
+    """
+
+    def __init__(
+        self, threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._bands: list[dict[tuple, list[int]]] = [{} for _ in range(NUM_BANDS)]
+        self._hashes: list[array] = []
+        self._origins: list[frozenset[str]] = []
+        self._values: list[object] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @staticmethod
+    def _band_keys(signature: tuple[int, ...]) -> list[tuple]:
+        return [
+            signature[i * ROWS_PER_BAND : (i + 1) * ROWS_PER_BAND]
+            for i in range(NUM_BANDS)
+        ]
+
+    def add(self, fingerprint: Fingerprint, value) -> None:
+        with self._lock:
+            if len(self._values) >= self.max_entries:
+                return
+            entry_id = len(self._values)
+            # Sorted unsigned array keeps the exact shingle set at 8 bytes per shingle
+            self._hashes.append(array("Q", sorted(fingerprint.hashes)))
+            self._origins.append(fingerprint.origin)
+            self._values.append(value)
+            for band, key in zip(self._bands, self._band_keys(fingerprint.signature)):
+                band.setdefault(key, []).append(entry_id)
+
+    def query(self, fingerprint: Fingerprint) -> Optional[tuple[object, float]]:
+        """
+        Returns (value, jaccard) of the best match above the threshold with
+        the same origin, or None.
+        """
+        with self._lock:
+            candidates = set()
+            for band, key in zip(self._bands, self._band_keys(fingerprint.signature)):
+                candidates.update(band.get(key, ()))
+
+            best = None
+            query_hashes = fingerprint.hashes
+            for entry_id in candidates:
+                if self._origins[entry_id] != fingerprint.origin:
+                    continue
+                stored = self._hashes[entry_id]
+                shared = sum(1 for h in stored if h in query_hashes)
+                union = len(stored) + len(query_hashes) - shared
+                jaccard = shared / union if union else 1.0
+                if jaccard >= self.threshold and (best is None or jaccard > best[1]):
+                    best = (self._values[entry_id], jaccard)
+            return best
@@ -0,0 +1,154 @@
+"""
+Packed email datasets: one JSONL file plus a binary offset index.
+
+Each line of `<name>.jsonl` is one record, {"id", "parent", "child", "text"}.
+`<name>.jsonl.idx` holds a magic header followed by native-order uint64 byte
+offsets, one per record plus the final file size, so record i is the byte
+range [offsets[i], offsets[i + 1]). Readers memory-map both files: opening a
+dataset of millions of emails costs two mmap() calls, and record i is one
+slice and one json.loads() away, with no per-email open().
+
+load_labelled() reads either this format or the older dataset directory
+(numbered .txt files plus answer.txt).
+"""
+
+import os
+import json
+import mmap
+from array import array
+from typing import Iterator, Optional
+
+INDEX_MAGIC = b"IVXIDX1\0"
+
+
+def index_path(path: str) -> str:
+    return f"{path}.idx"
+
+
+def _write_index(path: str, offsets: array) -> None:
+    tmp_path = f"{index_path(path)}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        offsets.tofile(f)
+    os.replace(tmp_path, index_path(path))
+
+
+class PackedWriter:
+    """Appends records to a packed dataset; close() writes the offset index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb")
+        self._offsets = array("Q", [0])
+
+    def write_line(self, line: bytes) -> None:
+        """Writes one already-encoded JSON record ending in a newline."""
+        self._file.write(line)
+        self._offsets.append(self._offsets[-1] + len(line))
+
+    def write(self, record: dict) -> None:
+        self.write_line(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def close(self) -> None:
+        self._file.close()
+        _write_index(self.path, self._offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_index(path: str) -> None:
+    """Writes the offset index of a JSONL file that has none (one pass over the map)."""
+    offsets = array("Q", [0])
+    if os.path.getsize(path):
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            position = data.find(b"\n")
+            while position != -1:
+                offsets.append(position + 1)
+                position = data.find(b"\n", position + 1)
+            if offsets[-1] != len(data):
+                offsets.append(len(data))
+    _write_index(path, offsets)
+
+
+class PackedDataset:
+    """Random and sequential read access to a packed dataset through mmap."""
+
+    def __init__(self, path: str):
+        self.path = path
+        if not os.path.exists(index_path(path)):
+            build_index(path)
+
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        self._index_file = open(index_path(path), "rb")
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._index[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f"{index_path(path)} is not a packed dataset index")
+        self._offsets = memoryview(self._index)[len(INDEX_MAGIC) :].cast("Q")
+        if self._offsets[-1] != size:
+            raise ValueError(f"{index_path(path)} is stale; delete it to rebuild")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._data[self._offsets[i] : self._offsets[i + 1]]
+
+    def __getitem__(self, i: int) -> dict:
+        return json.loads(self.raw(i))
+
+    def text(self, i: int) -> str:
+        return self[i]["text"]
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def chunks(self, size: int, start: int = 0, stop: Optional[int] = None):
+        """Yields lists of up to `size` consecutive records."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for begin in range(start, stop, size):
+            yield [self[i] for i in range(begin, min(begin + size, stop))]
+
+    def close(self) -> None:
+        self._offsets.release()
+        self._index.close()
+        self._index_file.close()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_labelled(path: str) -> list[tuple[str, tuple[str, str]]]:
+    """(text, (parent, child)) per email of a dataset directory or packed file."""
+    if os.path.isfile(path):
+        with PackedDataset(path) as dataset:
+            return [(r["text"], (r["parent"], r["child"])) for r in dataset]
+
+    with open(os.path.join(path, "answer.txt"), "r", encoding="utf-8") as f:
+        answers = [line.strip() for line in f if line.strip()]
+    emails = []
+    for i, answer in enumerate(answers, start=1):
+        email_path = os.path.join(path, f"{i:03d}.txt")
+        if not os.path.exists(email_path):
+            continue
+        with open(email_path, "r", encoding="utf-8") as f:
+            parent, child = [part.strip() for part in answer.split(",", 1)]
+            emails.append((f.read(), (parent, child)))
+    return emails
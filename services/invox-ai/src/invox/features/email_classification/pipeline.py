@@ -0,0 +1,500 @@
+"""
+Streaming classification pipeline.
+
+The CLI loops take one email (or one batch) all the way through reading, the
+spam gate, the router and printing before they start on the next, so file
+I/O, BERT-tiny and Gemma never overlap. Here each of those is an asyncio
+stage with its own workers, connected by bounded queues:
+
+    source -> readers -> spam gate batcher -> router -> results
+
+    readers   load the email texts (file reads run on threads)
+    spam      result cache lookups, the spam gate and the tiers in front of
+              Gemma (service.gate_batch), over batches of
+              up to INVOX_STREAM_SPAM_BATCH emails
+    router    Gemma over batches of the emails still unanswered: one
+              in-process Llama, or INVOX_STREAM_ROUTERS worker processes
+              (worker_pool.py) each with its own
+
+A full queue blocks the stage feeding it, so a slow router holds the readers
+back instead of the whole input piling up in memory. Batchers wait up to
+INVOX_STREAM_MAX_WAIT_MS for a batch to fill. run() is an async generator
+that yields each email's result as soon as it is done, in completion order:
+
+    with StreamingPipeline() as pipeline:
+        pipeline.warmup()
+        async for result in pipeline.run(file_source(paths)):
+            ...
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import functools
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from invox.features.email_classification import metrics
+from invox.features.email_classification.log import get_logger
+
+READERS = int(os.getenv("INVOX_STREAM_READERS", "4"))
+SPAM_WORKERS = int(os.getenv("INVOX_STREAM_SPAM_WORKERS", "1"))
+SPAM_BATCH = int(os.getenv("INVOX_STREAM_SPAM_BATCH", "32"))
+# >1 runs the router in that many worker processes
+ROUTERS = int(os.getenv("INVOX_STREAM_ROUTERS", "1"))
+# Defaults to the multi-sequence batch the router decodes at once
+ROUTER_BATCH = int(
+    os.getenv("INVOX_STREAM_ROUTER_BATCH", os.getenv("INVOX_BATCH_SIZE", "8"))
+)
+# Capacity of each queue between stages
+QUEUE_SIZE = int(os.getenv("INVOX_STREAM_QUEUE", "64"))
+MAX_WAIT_MS = float(os.getenv("INVOX_STREAM_MAX_WAIT_MS", "20"))
+
+# Marks the end of a queue's input; each worker of the next stage gets one
+_DONE = object()
+
+log = get_logger("pipeline")
+
+
+def _read_file(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def file_source(paths: list[str]) -> Iterator[tuple[str, Callable[[], str]]]:
+    """(file name, loader) per path; the readers call the loaders on threads."""
+    for path in paths:
+        yield os.path.basename(path), functools.partial(_read_file, path)
+
+
+def packed_source(path: str) -> Iterator[tuple[str, str]]:
+    """(#id, text) per record of a packed dataset (see packed_dataset.py)."""
+    from invox.features.email_classification.packed_dataset import PackedDataset
+
+    with PackedDataset(path) as dataset:
+        for record in dataset:
+            yield f"#{record['id']}", record["text"]
+
+
+class _Email:
+    """One email on its way through the stages."""
+
+    __slots__ = (
+        "index",
+        "name",
+        "payload",
+        "text",
+        "result",
+        "key",
+        "fingerprint",
+        "records",
+        "start_time",
+    )
+
+    def __init__(self, index: int, name: str, payload):
+        self.index = index
+        self.name = name
+        self.payload = payload
+        self.text = None
+        self.result = None
+        self.key = None
+        self.fingerprint = None
+        self.records = None
+        self.start_time = time.perf_counter()
+
+
+def _records(batch: list[_Email]) -> Optional[list[dict]]:
+    if batch[0].records is None:
+        return None
+    return [email.records[0] for email in batch]
+
+
+class StreamingPipeline:
+    """
+    Reader, spam-gate and router stages with `readers`, `spam_workers` and
+    `routers` workers each. `service` is the service module whose settings
+    apply; by default it is imported. `pool_env` holds INVOX_* overrides for
+    the router processes when `routers` > 1. `details` adds each email's
+    metrics record (scores, tiers, stage timings) to its result, whether or
+    not a metrics sink is configured.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        readers: int = READERS,
+        spam_workers: int = SPAM_WORKERS,
+        spam_batch: int = SPAM_BATCH,
+        routers: int = ROUTERS,
+        router_batch: int = ROUTER_BATCH,
+        queue_size: int = QUEUE_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        service=None,
+        pool_env: Optional[dict] = None,
+        details: bool = False,
+    ):
+        if service is None:
+            from invox.features.email_classification import service
+        self.service = service
+        self.mode = mode or service.CLASSIFIER_MODE
+        self.readers = max(1, readers)
+        self.spam_workers = max(1, spam_workers)
+        self.spam_batch = max(1, spam_batch)
+        self.routers = max(1, routers)
+        self.router_batch = max(1, router_batch)
+        self.queue_size = max(1, queue_size)
+        self.max_wait = max_wait_ms / 1000
+        self.details = details
+
+        # File reads, source generators and result-cache writes
+        self._io_executor = ThreadPoolExecutor(
+            max_workers=self.readers + 1, thread_name_prefix="invox-io"
+        )
+        self._spam_executor = ThreadPoolExecutor(
+            max_workers=self.spam_workers, thread_name_prefix="invox-spam"
+        )
+        # One Llama is not thread-safe, so in process the router has one thread
+        self._router_executor = None
+        self._pool = None
+        if self.routers > 1:
+            from invox.features.email_classification.worker_pool import WorkerPool
+
+            self._pool = WorkerPool(
+                workers=self.routers, chunk_size=self.router_batch, env=pool_env
+            )
+        else:
+            self._router_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="invox-router"
+            )
+
+    def warmup(self) -> None:
+        """Loads the models of every stage (and starts the router processes)."""
+        self.service.warmup(batch=self.router_batch > 1, router=self._pool is None)
+        if self._pool is not None:
+            self._pool.warmup()
+
+    def close(self) -> None:
+        self._io_executor.shutdown(wait=True)
+        self._spam_executor.shutdown(wait=True)
+        if self._router_executor is not None:
+            self._router_executor.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- Stages ---
+
+    async def _feed(self, source, outbox: asyncio.Queue) -> None:
+        index = 0
+        if hasattr(source, "__aiter__"):
+            async for name, payload in source:
+                await outbox.put(_Email(index, name, payload))
+                index += 1
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = iter(source)
+        while True:
+            # Generators over mail archives read files; keep that off the loop
+            item = await loop.run_in_executor(self._io_executor, next, iterator, _DONE)
+            if item is _DONE:
+                return
+            await outbox.put(_Email(index, *item))
+            index += 1
+
+    async def _read(
+        self, inbox: asyncio.Queue, outbox: asyncio.Queue, results: asyncio.Queue
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            email = await inbox.get()
+            if email is _DONE:
+                return
+            payload, email.payload = email.payload, None
+            try:
+                if callable(payload):
+                    payload = await loop.run_in_executor(self._io_executor, payload)
+                email.text = payload
+            except FileNotFoundError:
+                email.result = ("Error", "FileNotFound")
+            except Exception:
+                log.error("\n--- FATAL READ ERROR ---\n%s", traceback.format_exc())
+                email.result = ("Error", "RuntimeFailure")
+
+            if email.result is not None:
+                await results.put(email)
+                continue
+            email.records = metrics.start([email.text], keep=self.details, mode=self.mode)
+            await outbox.put(email)
+
+    async def _next_batch(self, queue: asyncio.Queue, size: int) -> tuple[list, bool]:
+        """
+        Waits for one email, then up to max_wait for more, up to `size`.
+        Returns (batch, whether the queue has ended).
+        """
+        loop = asyncio.get_running_loop()
+        first = await queue.get()
+        if first is _DONE:
+            return [], True
+        batch = [first]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < size:
+            try:
+                email = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    email = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if email is _DONE:
+                return batch, True
+            batch.append(email)
+        return batch, False
+
+    def _gate_batch(self, batch: list[_Email]) -> None:
+        """Earlier results, then the tiers in front of the router (on a thread)."""
+        service = self.service
+        with metrics.use(_records(batch)):
+            for k, email in enumerate(batch):
+                with metrics.subset([k]):
+                    email.result, email.key, email.fingerprint = service._lookup_previous(
+                        email.text, self.mode
+                    )
+
+            pending = [k for k, email in enumerate(batch) if email.result is None]
+            if not pending:
+                return
+            fingerprints = [batch[k].fingerprint for k in pending]
+            try:
+                with metrics.subset(pending):
+                    gated = service.gate_batch(
+                        [batch[k].text for k in pending], self.mode, fingerprints
+                    )
+            except Exception:
+                log.error("\n--- FATAL SPAM STAGE ERROR ---\n%s", traceback.format_exc())
+                gated = [("Error", "RuntimeFailure")] * len(pending)
+
+        for k, result, fingerprint in zip(pending, gated, fingerprints):
+            email = batch[k]
+            email.fingerprint = fingerprint
+            if result is not None:
+                email.result = result
+                service._remember_result(result, email.key, email.fingerprint, self.mode)
+
+    async def _gate(
+        self, inbox: asyncio.Queue, outbox: asyncio.Queue, results: asyncio.Queue
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, done = await self._next_batch(inbox, self.spam_batch)
+            if batch:
+                await loop.run_in_executor(self._spam_executor, self._gate_batch, batch)
+                for email in batch:
+                    await (outbox if email.result is None else results).put(email)
+            if done:
+                return
+
+    def _route_in_process(self, batch: list[_Email]) -> list[tuple[str, str]]:
+        with metrics.use(_records(batch)):
+            return self.service.route_batch([email.text for email in batch], self.mode)
+
+    def _remember(self, batch: list[_Email]) -> None:
+        for email in batch:
+            self.service._remember_result(
+                email.result, email.key, email.fingerprint, self.mode
+            )
+
+    async def _route(self, inbox: asyncio.Queue, results: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch, done = await self._next_batch(inbox, self.router_batch)
+            if batch:
+                try:
+                    if self._pool is not None:
+                        future = self._pool.submit_route(
+                            [email.text for email in batch], self.mode
+                        )
+                        routed = await asyncio.wrap_future(future)
+                    else:
+                        routed = await loop.run_in_executor(
+                            self._router_executor, self._route_in_process, batch
+                        )
+                except Exception:
+                    log.error("\n--- FATAL ROUTER ERROR ---\n%s", traceback.format_exc())
+                    routed = [("Error", "RuntimeFailure")] * len(batch)
+
+                for email, result in zip(batch, routed):
+                    email.result = tuple(result)
+                await loop.run_in_executor(self._io_executor, self._remember, batch)
+                for email in batch:
+                    await results.put(email)
+            if done:
+                return
+
+    @staticmethod
+    async def _stage(workers: list, outbox: asyncio.Queue, downstream: int) -> None:
+        """Runs a stage's workers, then tells each downstream worker it is over."""
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for _ in range(downstream):
+                await outbox.put(_DONE)
+
+    # --- Output ---
+
+    async def run(self, source) -> AsyncIterator[dict]:
+        """
+        Classifies the (name, email) pairs of `source`, a sync or async
+        iterable; an email is its text or a callable returning it. Yields
+        {"index", "name", "parent", "child", "elapsed_sec"} per email as it
+        finishes, where `index` is its position in `source` and
+        `elapsed_sec` its time from entering the pipeline to its result;
+        with `details`, also "details", its metrics record.
+        """
+        sources = asyncio.Queue(self.queue_size)
+        texts = asyncio.Queue(self.queue_size)
+        unrouted = asyncio.Queue(self.queue_size)
+        results = asyncio.Queue(self.queue_size)
+
+        tasks = [
+            asyncio.create_task(
+                self._stage([self._feed(source, sources)], sources, self.readers)
+            ),
+            asyncio.create_task(
+                self._stage(
+                    [self._read(sources, texts, results) for _ in range(self.readers)],
+                    texts,
+                    self.spam_workers,
+                )
+            ),
+            asyncio.create_task(
+                self._stage(
+                    [
+                        self._gate(texts, unrouted, results)
+                        for _ in range(self.spam_workers)
+                    ],
+                    unrouted,
+                    self.routers,
+                )
+            ),
+            # The spam stage has finished before the router stage can, so its
+            # results are all queued by the time the end marker is
+            asyncio.create_task(
+                self._stage(
+                    [self._route(unrouted, results) for _ in range(self.routers)],
+                    results,
+                    1,
+                )
+            ),
+        ]
+
+        try:
+            while True:
+                email = await results.get()
+                if email is _DONE:
+                    break
+                elapsed = time.perf_counter() - email.start_time
+                metrics.finish(email.records, elapsed * 1000)
+                parent, child = email.result
+                result = {
+                    "index": email.index,
+                    "name": email.name,
+                    "parent": parent,
+                    "child": child,
+                    "elapsed_sec": elapsed,
+                }
+                if self.details:
+                    result["details"] = email.records[0] if email.records else {}
+                yield result
+            # Surfaces a failed source or stage
+            for task in tasks:
+                await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class JsonlWriter:
+    """
+    Writes run() results to `path` ("-" for stdout) as JSON lines of name,
+    label, total_ms and, with `details`, the email's scores and stage
+    timings. Lines are written `buffer_bytes` at a time, and at least every
+    `flush_seconds` so a slow stream still shows progress.
+    """
+
+    def __init__(
+        self, path: str, buffer_bytes: int = 1 << 16, flush_seconds: float = 1.0
+    ):
+        self.path = path
+        self.buffer_bytes = buffer_bytes
+        self.flush_seconds = flush_seconds
+        self._file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+        self._lines: list[str] = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self.written = 0
+
+    def write(self, result: dict) -> None:
+        record = {
+            "name": result["name"],
+            "parent": result["parent"],
+            "child": result["child"],
+            "total_ms": round(result["elapsed_sec"] * 1000, 3),
+        }
+        for name, value in result.get("details", {}).items():
+            if name not in record and name != "pid":
+                record[name] = value
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._lines.append(line)
+        self._pending += len(line)
+        self.written += 1
+        if (
+            self._pending >= self.buffer_bytes
+            or time.monotonic() - self._last_flush >= self.flush_seconds
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._lines:
+            self._file.write("".join(self._lines))
+            self._lines, self._pending = [], 0
+        self._file.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not sys.stdout:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def classify_stream(
+    source, pipeline: Optional[StreamingPipeline] = None, **options
+) -> AsyncIterator[dict]:
+    """
+    run() over a pipeline built from `options` (and closed at the end), or
+    over `pipeline` when one is given.
+    """
+    if pipeline is not None:
+        async for result in pipeline.run(source):
+            yield result
+        return
+    with StreamingPipeline(**options) as own_pipeline:
+        async for result in own_pipeline.run(source):
+            yield result
@@ -0,0 +1,232 @@
+"""
+Email pre-processing ahead of the LLM.
+
+Raw emails spend most of a prompt on transport headers, quoted replies,
+signatures, legal footers and HTML markup. This module parses the message
+with the stdlib `email` feed parser (fed in chunks, so files and sockets can
+be streamed), keeps the subject, sender domain and attachment names, strips
+the boilerplate from the body and renders a compact summary that fits a
+token budget (see token_budget.py).
+"""
+
+import os
+import re
+from email import policy
+from email.parser import BytesFeedParser, FeedParser
+from email.utils import parseaddr
+from html.parser import HTMLParser
+from typing import BinaryIO
+
+from invox.features.email_classification import token_budget
+
+# Token budget for the summary handed to the LLM
+SUMMARY_TOKENS = int(os.getenv("INVOX_SUMMARY_TOKENS", "350"))
+# Stop reading a message after this many bytes; the tail is attachments
+MAX_EMAIL_BYTES = int(os.getenv("INVOX_MAX_EMAIL_BYTES", str(1024 * 1024)))
+_CHUNK_SIZE = 64 * 1024
+
+# A reply's quoted history starts at one of these lines
+_REPLY_MARKERS = [
+    re.compile(r"^On .{1,200} wrote:\s*$"),
+    re.compile(r"^-{2,}\s*(Original|Forwarded) Message\s*-{2,}", re.IGNORECASE),
+    re.compile(r"^_{10,}\s*$"),
+    re.compile(r"^From: .+$"),
+]
+# Lines that open a signature or footer; everything after them is dropped
+# when they appear in the last SIGNATURE_WINDOW lines of the body
+_SIGNATURE_MARKERS = [
+    re.compile(r"^--\s*$"),
+    re.compile(
+        r"^(best|kind|warm)?\s*(regards|wishes)[,.!]?\s*$"
+        r"|^(thanks|thank you|cheers|sincerely|yours truly|best)[,.!]?\s*$",
+        re.IGNORECASE,
+    ),
+    re.compile(r"^sent from my \w+", re.IGNORECASE),
+    re.compile(
+        r"^(confidentiality notice|disclaimer"
+        r"|this (e-?mail|message) (and any|is intended))",
+        re.IGNORECASE,
+    ),
+    re.compile(
+        r"^(to )?unsubscribe\b|^you are receiving this (e-?mail|message)",
+        re.IGNORECASE,
+    ),
+]
+SIGNATURE_WINDOW = 12
+
+_WHITESPACE_RE = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+class _HTMLText(HTMLParser):
+    """Collects the visible text of an HTML body."""
+
+    _SKIP = {"script", "style", "head", "title"}
+    _BLOCK = {"p", "div", "br", "li", "tr", "table", "blockquote", "h1", "h2", "h3"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+        self._quote_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag == "blockquote":
+            # Quoted replies in HTML mail
+            self._quote_depth += 1
+        if tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "blockquote" and self._quote_depth:
+            self._quote_depth -= 1
+        if tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth and not self._quote_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    parser = _HTMLText()
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def strip_quotes(body: str) -> str:
+    """Drops '>'-quoted lines and everything from the first reply marker on."""
+    kept = []
+    for line in body.split("\n"):
+        stripped = line.strip()
+        # A "From:" line only marks a quote once some body text came before it
+        if kept and any(marker.match(stripped) for marker in _REPLY_MARKERS):
+            break
+        if stripped.startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def strip_signature(body: str) -> str:
+    """Cuts the body at a signature or footer marker near its end."""
+    lines = body.rstrip().split("\n")
+    window_start = max(len(lines) - SIGNATURE_WINDOW, 1)
+    for i in range(window_start, len(lines)):
+        if any(marker.match(lines[i].strip()) for marker in _SIGNATURE_MARKERS):
+            return "\n".join(lines[:i])
+    return "\n".join(lines)
+
+
+def _normalize(text: str) -> str:
+    lines = [_WHITESPACE_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _message_body(message) -> tuple[str, list[str]]:
+    """Plain-text body (HTML only when there is no text part) and attachment names."""
+    plain, html, attachments = [], [], []
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        filename = part.get_filename()
+        if filename or part.get_content_disposition() == "attachment":
+            attachments.append(filename or part.get_content_type())
+            continue
+        content_type = part.get_content_type()
+        if content_type not in ("text/plain", "text/html"):
+            continue
+        try:
+            content = part.get_content()
+        except (LookupError, UnicodeDecodeError):
+            payload = part.get_payload(decode=True) or b""
+            content = payload.decode("utf-8", errors="replace")
+        (plain if content_type == "text/plain" else html).append(content)
+
+    if plain:
+        return "\n".join(plain), attachments
+    return "\n".join(html_to_text(h) for h in html), attachments
+
+
+def _prepare_message(message) -> dict:
+    subject = str(message.get("subject") or "").strip()
+    sender = parseaddr(str(message.get("from") or ""))[1]
+    sender_domain = sender.rsplit("@", 1)[1].lower() if "@" in sender else ""
+
+    body, attachments = _message_body(message)
+    body = _normalize(strip_signature(strip_quotes(body)))
+    return {
+        "subject": subject,
+        "sender_domain": sender_domain,
+        "attachments": attachments,
+        "body": body,
+    }
+
+
+def prepare(email_text: str) -> dict:
+    """
+    Parses a raw RFC 822 email (or plain text without headers) and returns
+    `subject`, `sender_domain`, `attachments` and the cleaned `body`.
+    """
+    parser = FeedParser(policy=policy.default)
+    limit = min(len(email_text), MAX_EMAIL_BYTES)
+    for start in range(0, limit, _CHUNK_SIZE):
+        parser.feed(email_text[start : min(start + _CHUNK_SIZE, limit)])
+    return _prepare_message(parser.close())
+
+
+def prepare_stream(stream: BinaryIO) -> dict:
+    """Same as prepare() for a binary file object, read in chunks."""
+    parser = BytesFeedParser(policy=policy.default)
+    remaining = MAX_EMAIL_BYTES
+    while remaining > 0:
+        chunk = stream.read(min(_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        parser.feed(chunk)
+        remaining -= len(chunk)
+    return _prepare_message(parser.close())
+
+
+def render_summary(
+    prepared: dict,
+    max_tokens: int = SUMMARY_TOKENS,
+    tokenizer=None,
+    strategy: str = token_budget.STRATEGY,
+    keywords: set[str] = frozenset(),
+) -> str:
+    """
+    The text the LLM sees: subject, sender domain, attachments, then as much
+    of the body as fits in `max_tokens` (counted with `tokenizer`; estimated
+    from characters without one). Subject words count as salient keywords.
+    """
+    tokenizer = tokenizer or token_budget.CharTokenizer()
+    lines = []
+    if prepared["subject"]:
+        lines.append(f"Subject: {prepared['subject']}")
+    if prepared["sender_domain"]:
+        lines.append(f"Sender domain: {prepared['sender_domain']}")
+    if prepared["attachments"]:
+        lines.append(f"Attachments: {', '.join(prepared['attachments'])}")
+    header = token_budget.fit_text("\n".join(lines), max_tokens, tokenizer, "head")
+
+    # +2 for the blank line between header and body
+    body_budget = max_tokens - (tokenizer.count(header) + 2 if header else 0)
+    body = token_budget.fit_text(
+        prepared["body"],
+        body_budget,
+        tokenizer,
+        strategy,
+        keywords | token_budget.keywords_of(prepared["subject"]),
+    )
+    return f"{header}\n\n{body}".strip() if header else body
+
+
+def summarize(email_text: str, max_tokens: int = SUMMARY_TOKENS, **budget_options) -> str:
+    """prepare() + render_summary(); `budget_options` go to render_summary()."""
+    return render_summary(prepare(email_text), max_tokens, **budget_options)
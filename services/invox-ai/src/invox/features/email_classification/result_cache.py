@@ -0,0 +1,175 @@
+"""
+Content-addressed cache of classification results.
+
+Keys are a SHA-256 over the normalized email text plus a namespace string
+describing the models and prompt version that produced the answer, so a model
+or prompt change never serves stale labels. Lookups go through an in-process
+LRU first and a SQLite file second; the SQLite store survives restarts and is
+trimmed back to `disk_max_entries` by least-recent use.
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.settings import CACHE_DIR
+
+DEFAULT_CACHE_PATH = os.path.join(CACHE_DIR, "results.sqlite3")
+
+log = get_logger("result_cache")
+
+
+def normalize_email(email_text: str) -> str:
+    """Case-folds and collapses whitespace so trivially different copies hash the same."""
+    return " ".join(email_text.split()).lower()
+
+
+def cache_key(email_text: str, namespace: str) -> str:
+    digest = hashlib.sha256(namespace.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_email(email_text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Two-level (memory LRU + SQLite) result cache. Values must be
+    JSON-serializable. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        memory_size: int = 4096,
+        disk_max_entries: int = 1_000_000,
+    ):
+        self.memory_size = memory_size
+        self.disk_max_entries = disk_max_entries
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_entries = 0
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)"
+            )
+            self._db.commit()
+            self._disk_entries = self._db.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()[0]
+
+    def _remember(self, key: str, value) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """Returns the cached value for `key`, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE results SET last_used = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    self._db.commit()
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._remember(key, value)
+            if self._db is None:
+                return
+
+            exists = self._db.execute(
+                "SELECT 1 FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            if exists is None:
+                self._disk_entries += 1
+            if self._disk_entries > self.disk_max_entries:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        # Trim 10% below the limit so eviction does not run on every insert
+        target = int(self.disk_max_entries * 0.9)
+        self._db.execute(
+            "DELETE FROM results WHERE key IN ("
+            "SELECT key FROM results ORDER BY last_used ASC LIMIT ?)",
+            (self._disk_entries - target,),
+        )
+        self._disk_entries = self._db.execute(
+            "SELECT COUNT(*) FROM results"
+        ).fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_entries,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def log_stats(cache: ResultCache) -> None:
+    stats = cache.stats()
+    log.info(
+        "[CACHE] hits=%d (memory=%d, disk=%d) misses=%d hit_rate=%.1f%% entries=%d",
+        stats["hits"],
+        stats["memory_hits"],
+        stats["disk_hits"],
+        stats["misses"],
+        100 * stats["hit_rate"],
+        stats["disk_entries"],
+    )
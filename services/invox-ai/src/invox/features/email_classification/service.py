@@ -21,9 +21,10 @@
 import sys
 import os
 import time
+import argparse
+from typing import Optional
 import traceback
 from dotenv import load_dotenv
-from transformers import logging as hf_logging
 
 # This automatically finds your .env file and loads the variables into the system
 load_dotenv()
@@ -31,51 +32,685 @@ load_dotenv()
 # Now you can safely grab the token without hardcoding it
 HF_TOKEN = os.getenv("HF_TOKEN")
 
-hf_logging.set_verbosity_info()
+# Imported after load_dotenv() so INVOX_LOG_LEVEL can come from .env
+from invox.features.email_classification.log import get_logger
 
-print("\n" + "=" * 50, file=sys.stderr)
-print("⚙️  INITIALIZING INVOX AI CLASSIFICATION PIPELINE", file=sys.stderr)
-print("=" * 50, file=sys.stderr)
+log = get_logger("service")
+
+log.info("\n" + "=" * 50)
+log.info("⚙️  INITIALIZING INVOX AI CLASSIFICATION PIPELINE")
+log.info("=" * 50)
 
 try:
-    print("[INIT] Loading Spam Detection Module...", file=sys.stderr)
-    from invox.features.email_classification.spam_detection import check_is_spam
+    log.info("[INIT] Loading Spam Detection Module...")
+    from invox.features.email_classification import (
+        metrics,
+        spam_detection,
+        spam_subcategory,
+        category_detection,
+        embedding_classifier,
+        student_classifier,
+    )
+    from invox.features.email_classification.spam_detection import (
+        check_is_spam,
+        check_is_spam_batch,
+    )
 
-    print("[INIT] Loading Category Detection Module...", file=sys.stderr)
+    log.info("[INIT] Loading Category Detection Module...")
     from invox.features.email_classification.category_detection import (
+        PROMPT_VERSION,
+        LABEL_MODE,
         classify_hierarchical,
+        classify_hierarchical_batch_with_scores,
+        classify_flat,
+        classify_flat_batch_with_scores,
+    )
+
+    from invox.features.email_classification.embedding_classifier import (
+        classify_by_embedding,
+        classify_by_embedding_batch,
+    )
+    from invox.features.email_classification.result_cache import (
+        ResultCache,
+        cache_key,
+        log_stats,
     )
+    from invox.features.email_classification.near_duplicate import (
+        Fingerprint,
+        NearDuplicateIndex,
+    )
+    from invox.features.email_classification.packed_dataset import PackedDataset
 
-    print("[INIT] All modules loaded successfully!\n", file=sys.stderr)
+    log.info("[INIT] All modules loaded successfully!\n")
 except Exception as e:
-    print(f"\n--- FATAL IMPORT ERROR ---\n{traceback.format_exc()}", file=sys.stderr)
+    log.error("\n--- FATAL IMPORT ERROR ---\n%s", traceback.format_exc())
     sys.exit(1)
 
 
-def process_email_classification(email_text: str) -> tuple[str, str]:
-    try:
-        is_spam = check_is_spam(email_text)
+# "hierarchical" runs the two-call TMH path, "flat" picks a "Parent - Child"
+# label in a single LLM call.
+CLASSIFIER_MODE = os.getenv("INVOX_CLASSIFIER_MODE", "hierarchical")
+
+# Answer easy emails from the embedding nearest-centroid stage and only send
+# low-margin ones on to Gemma.
+EMBEDDING_FAST_PATH = os.getenv("INVOX_EMBEDDING_FAST_PATH", "0") == "1"
+
+# Content-addressed result cache (memory LRU + SQLite), shared by all entry points
+result_cache = (
+    ResultCache() if os.getenv("INVOX_RESULT_CACHE", "1") == "1" else None
+)
+
+
+# Reuse labels of earlier emails rendered from the same template (order IDs,
+# case IDs, dates substituted). One in-memory index per cache namespace.
+NEAR_DUPLICATE_REUSE = os.getenv("INVOX_NEAR_DUPLICATE", "1") == "1"
+near_duplicate_indexes: dict[str, NearDuplicateIndex] = {}
+# _cache_namespace() per mode; the settings it reads are fixed once classifying starts
+_namespaces: dict[str, str] = {}
+near_duplicate_hits = 0
+
+
+def warmup(batch: bool = False, router: bool = True) -> None:
+    """
+    Loads every model the current configuration will use. Importing this module
+    is cheap; call this to pay the load cost at a time of your choosing.
+    `router=False` leaves Gemma to other processes (see pipeline.py).
+    """
+    log.info("[INIT] Warming up models...")
+    spam_detection.warmup()
+    spam_subcategory.warmup()
+    if student_classifier.STUDENT_ENABLED:
+        student_classifier.warmup()
+    if router:
+        category_detection.warmup(batch=batch)
+    if EMBEDDING_FAST_PATH:
+        embedding_classifier.warmup()
+    log.info("[INIT] Models ready.\n")
+
+
+def _cache_namespace(mode: str) -> str:
+    """
+    Everything besides the email text that decides the answer. Built once per
+    mode: the tags load the spam child and student models.
+    """
+    if mode in _namespaces:
+        return _namespaces[mode]
+    fast_path = embedding_classifier.cache_tag() if EMBEDDING_FAST_PATH else "off"
+    spam_tag = f"{spam_detection.cache_tag()}|{spam_subcategory.cache_tag()}"
+    prompt = f"prompt-v{PROMPT_VERSION}" + ("" if category_detection.PREPROCESS else "-raw")
+    # The registry can point at a different GGUF than MODEL_FILE
+    router = category_detection.router_tag()
+    student = (
+        student_classifier.cache_tag()
+        if student_classifier.STUDENT_ENABLED
+        else "student:off"
+    )
+    _namespaces[mode] = (
+        f"{spam_tag}|{router}|{prompt}|{mode}|{LABEL_MODE}|fast:{fast_path}|{student}"
+    )
+    return _namespaces[mode]
+
+
+def _lookup_previous(email_text: str, mode: str):
+    """
+    Checks the exact result cache. Returns (result or None, cache key,
+    fingerprint); the last two are handed on to _reuse_near_duplicate() and
+    _remember_result() on a miss. With both the result cache and near-duplicate
+    reuse off there is nothing to check, and no namespace is built.
+    """
+    if result_cache is None and not NEAR_DUPLICATE_REUSE:
+        metrics.tag(cache="off")
+        return None, None, None
+
+    namespace = _cache_namespace(mode)
+    key = fingerprint = None
+
+    if result_cache is not None:
+        key = cache_key(email_text, namespace)
+        cached = result_cache.get(key)
+        if cached is not None:
+            metrics.tag(cache="exact")
+            return tuple(cached), key, None
+
+    if NEAR_DUPLICATE_REUSE:
+        near_duplicate_indexes.setdefault(namespace, NearDuplicateIndex())
+        fingerprint = Fingerprint(email_text)
+
+    metrics.tag(cache="miss")
+    return None, key, fingerprint
+
+
+def _reuse_near_duplicate(fingerprint, mode: str) -> Optional[tuple[str, str]]:
+    """
+    Label of an earlier ham email from the same template, or None. Only asked
+    for emails the spam gate has passed: a phishing copy of a real template
+    must still meet the spam rules and BERT-tiny.
+    """
+    global near_duplicate_hits
+    if fingerprint is None:
+        return None
+    match = near_duplicate_indexes[_cache_namespace(mode)].query(fingerprint)
+    if match is None:
+        return None
+    near_duplicate_hits += 1
+    metrics.tag(cache="near_duplicate")
+    log.debug("[PIPELINE] Near-duplicate hit (jaccard=%.3f), reusing label", match[1])
+    return tuple(match[0])
+
+
+def _remember_result(result: tuple[str, str], key, fingerprint, mode: str) -> None:
+    if result[0] == "Error":
+        return
+    if key is not None:
+        result_cache.put(key, list(result))
+    # Only ham labels are reused, so only ham emails are indexed
+    if fingerprint is not None and result[0] != "Spam":
+        near_duplicate_indexes[_cache_namespace(mode)].add(fingerprint, list(result))
+
+
+def process_email_classification(
+    email_text: str, mode: Optional[str] = None
+) -> tuple[str, str]:
+    mode = mode or CLASSIFIER_MODE
+    with metrics.collect([email_text], mode=mode):
+        previous, key, fingerprint = _lookup_previous(email_text, mode)
+        if previous is not None:
+            return previous
+
+        fingerprints = [fingerprint]
+        try:
+            result = _classify_uncached(email_text, mode, fingerprints)
+        except Exception as e:
+            log.error("\n--- FATAL PIPELINE ERROR ---\n%s", traceback.format_exc())
+            return "Error", "RuntimeFailure"
+
+        _remember_result(result, key, fingerprints[0], mode)
+        return result
+
+
+def _classify_uncached(email_text: str, mode: str, fingerprints: list) -> tuple[str, str]:
+    """`fingerprints` is [fingerprint]; cleared when a near duplicate answers."""
+    is_spam = check_is_spam(email_text)
+
+    if is_spam:
+        # The Spam subtree has its own small model; Gemma is never asked
+        with metrics.stage("spam_child"):
+            return "Spam", spam_subcategory.classify_spam_child(email_text)["child"]
+
+    reused = _reuse_near_duplicate(fingerprints[0], mode)
+    if reused is not None:
+        fingerprints[0] = None
+        return reused
+
+    if student_classifier.STUDENT_ENABLED:
+        # Distilled from Gemma; only unsure emails go on to the router
+        with metrics.stage("student"):
+            student = student_classifier.classify_by_student(email_text)
+        metrics.tag(student="answered" if student["confident"] else "deferred")
+        if student["confident"]:
+            return student["parent"], student["child"]
 
-        if is_spam:
-            return "Spam", "Spam"
+    if EMBEDDING_FAST_PATH:
+        with metrics.stage("embedding"):
+            fast = classify_by_embedding(email_text)
+        if fast["confident"]:
+            return fast["parent"], fast["child"]
 
-        parent, child = classify_hierarchical(email_text)
-        return parent, child
+    with metrics.stage("router"):
+        if mode == "flat":
+            parent, child = classify_flat(email_text)
+        else:
+            parent, child = classify_hierarchical(email_text)
+    return parent, child
 
+
+def process_email_classification_batch(
+    email_texts: list[str], mode: Optional[str] = None
+) -> list[tuple[str, str]]:
+    """
+    Classifies many emails at once. The spam gate runs as one batched pipeline
+    call and the remaining emails share multi-sequence Gemma decodes.
+    Results come back in input order; emails already in the result cache skip
+    the models entirely.
+    """
+    mode = mode or CLASSIFIER_MODE
+    with metrics.collect(email_texts, mode=mode):
+        return _process_batch(email_texts, mode)
+
+
+def _process_batch(email_texts: list[str], mode: str) -> list[tuple[str, str]]:
+    results = [None] * len(email_texts)
+    keys = [None] * len(email_texts)
+    fingerprints = [None] * len(email_texts)
+    for i, email_text in enumerate(email_texts):
+        with metrics.subset([i]):
+            results[i], keys[i], fingerprints[i] = _lookup_previous(email_text, mode)
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    pending_fingerprints = [fingerprints[i] for i in pending]
+    try:
+        with metrics.subset(pending):
+            pending_results = _classify_batch_uncached(
+                [email_texts[i] for i in pending], mode, pending_fingerprints
+            )
     except Exception as e:
-        print(
-            f"\n--- FATAL PIPELINE ERROR ---\n{traceback.format_exc()}", file=sys.stderr
+        log.error("\n--- FATAL BATCH PIPELINE ERROR ---\n%s", traceback.format_exc())
+        pending_results = [("Error", "RuntimeFailure")] * len(pending)
+
+    for i, result, fingerprint in zip(pending, pending_results, pending_fingerprints):
+        results[i] = result
+        _remember_result(result, keys[i], fingerprint, mode)
+    return results
+
+
+def _classify_batch_uncached(
+    email_texts: list[str], mode: str, fingerprints: Optional[list] = None
+) -> list[tuple[str, str]]:
+    results = gate_batch(email_texts, mode, fingerprints)
+    ham_indices = [i for i, result in enumerate(results) if result is None]
+    if ham_indices:
+        with metrics.subset(ham_indices):
+            ham_results = route_batch([email_texts[i] for i in ham_indices], mode)
+        for i, result in zip(ham_indices, ham_results):
+            results[i] = result
+    return results
+
+
+def gate_batch(
+    email_texts: list[str], mode: str, fingerprints: Optional[list] = None
+) -> list[Optional[tuple[str, str]]]:
+    """
+    Runs the tiers in front of the router: the spam gate (and Spam child),
+    near-duplicate reuse for the ham emails, then the student and the
+    embedding fast path when enabled. Emails they answer get their result;
+    the rest are None and need route_batch(). `fingerprints` come from
+    _lookup_previous(); those of reused emails are set to None in place, as
+    they are already indexed.
+    """
+    spam_flags = check_is_spam_batch(email_texts)
+    results = [None] * len(email_texts)
+
+    spam_indices = [i for i, is_spam in enumerate(spam_flags) if is_spam]
+    if spam_indices:
+        with metrics.subset(spam_indices), metrics.stage("spam_child"):
+            spam_children = spam_subcategory.classify_spam_child_batch(
+                [email_texts[i] for i in spam_indices]
+            )
+        for i, spam_child in zip(spam_indices, spam_children):
+            results[i] = ("Spam", spam_child["child"])
+
+    ham_indices = [i for i, is_spam in enumerate(spam_flags) if not is_spam]
+
+    if fingerprints is not None:
+        for i in ham_indices:
+            with metrics.subset([i]):
+                reused = _reuse_near_duplicate(fingerprints[i], mode)
+            if reused is not None:
+                results[i] = reused
+                fingerprints[i] = None
+        ham_indices = [i for i in ham_indices if results[i] is None]
+
+    if student_classifier.STUDENT_ENABLED and ham_indices:
+        with metrics.subset(ham_indices):
+            with metrics.stage("student"):
+                student_results = student_classifier.classify_by_student_batch(
+                    [email_texts[i] for i in ham_indices]
+                )
+            for k, student in enumerate(student_results):
+                metrics.tag(
+                    k,
+                    student="answered" if student["confident"] else "deferred",
+                    student_probability=student["probability"],
+                )
+        for i, student in zip(ham_indices, student_results):
+            if student["confident"]:
+                results[i] = (student["parent"], student["child"])
+        ham_indices = [i for i in ham_indices if results[i] is None]
+        log.info(
+            "[PIPELINE] Student answered %d/%d emails",
+            len(student_results) - len(ham_indices),
+            len(student_results),
+        )
+
+    if EMBEDDING_FAST_PATH and ham_indices:
+        with metrics.subset(ham_indices), metrics.stage("embedding"):
+            fast_results = classify_by_embedding_batch(
+                [email_texts[i] for i in ham_indices]
+            )
+        for i, fast in zip(ham_indices, fast_results):
+            if fast["confident"]:
+                results[i] = (fast["parent"], fast["child"])
+        ham_indices = [i for i in ham_indices if results[i] is None]
+        log.info(
+            "[PIPELINE] Embedding fast path answered %d/%d emails",
+            len(fast_results) - len(ham_indices),
+            len(fast_results),
         )
-        return "Error", "RuntimeFailure"
+    return results
+
+
+def route_batch(email_texts: list[str], mode: str) -> list[tuple[str, str]]:
+    """
+    Classifies ham emails with the Gemma router (multi-sequence decodes).
+    In score mode the probabilities of the chosen labels are tagged on the
+    metrics records as `parent_score` / `child_score`.
+    """
+    classify_batch = (
+        classify_flat_batch_with_scores
+        if mode == "flat"
+        else classify_hierarchical_batch_with_scores
+    )
+    with metrics.stage("router"):
+        results = classify_batch(email_texts)
+    for k, result in enumerate(results):
+        scores = {
+            f"{level}_score": result[f"{level}_scores"][result[level]]
+            for level in ("parent", "child")
+            if result[level] in result[f"{level}_scores"]
+        }
+        metrics.tag(k, **scores)
+    return [(result["parent"], result["child"]) for result in results]
+
+
+def _log_reuse_stats() -> None:
+    spam_detection.log_tier_stats()
+    if result_cache is not None:
+        log_stats(result_cache)
+    if NEAR_DUPLICATE_REUSE:
+        log.info("[PIPELINE] Near-duplicate label reuses: %d", near_duplicate_hits)
+
+
+def _read_email_file(file_path: str) -> Optional[str]:
+    """
+    The file's text, or None after printing its error RESULT line: a file
+    that is missing, unreadable or not UTF-8 fails alone, not the whole run.
+    """
+    filename = os.path.basename(file_path)
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"RESULT|{filename}|Error|FileNotFound|0.00", flush=True)
+    except (OSError, UnicodeDecodeError):
+        log.error("\n--- FATAL FILE ERROR ---\n%s", traceback.format_exc())
+        print(f"RESULT|{filename}|Error|RuntimeFailure|0.00", flush=True)
+    return None
+
+
+def _classify_files_batched(file_paths: list[str], batch_size: int) -> None:
+    """
+    Reads `batch_size` files at a time and classifies them together. The
+    reported time per email is the batch wall time divided by its size.
+    """
+    for start in range(0, len(file_paths), batch_size):
+        names, contents = [], []
+        for file_path in file_paths[start : start + batch_size]:
+            content = _read_email_file(file_path)
+            if content is not None:
+                names.append(os.path.basename(file_path))
+                contents.append(content)
+
+        if not contents:
+            continue
+
+        start_time = time.time()
+        results = process_email_classification_batch(contents)
+        per_email_time = (time.time() - start_time) / len(contents)
+
+        for filename, (final_parent, final_child) in zip(names, results):
+            print(
+                f"RESULT|{filename}|{final_parent}|{final_child}|{per_email_time:.3f}",
+                flush=True,
+            )
+
+
+def _classify_packed(path: str, batch_size: int) -> None:
+    """
+    Classifies every record of a packed dataset (see packed_dataset.py),
+    `batch_size` at a time, reading the texts through its mmap. Records are
+    reported as #<id>.
+    """
+    with PackedDataset(path) as dataset:
+        for records in dataset.chunks(batch_size):
+            contents = [record["text"] for record in records]
+
+            start_time = time.time()
+            if batch_size > 1:
+                results = process_email_classification_batch(contents)
+            else:
+                results = [process_email_classification(contents[0])]
+            per_email_time = (time.time() - start_time) / len(contents)
+
+            for record, (final_parent, final_child) in zip(records, results):
+                print(
+                    f"RESULT|#{record['id']}|{final_parent}|{final_child}|{per_email_time:.3f}",
+                    flush=True,
+                )
+
+
+def _classify_files_pooled(file_paths: list[str], args) -> None:
+    """Spreads the files over a WorkerPool; results print in input order."""
+    names, contents = [], []
+    for file_path in file_paths:
+        content = _read_email_file(file_path)
+        if content is not None:
+            names.append(os.path.basename(file_path))
+            contents.append(content)
+    _classify_pooled(names, contents, args)
+
+
+def _worker_env(args) -> dict:
+    # The CLI flags must reach the workers, which only see the environment
+    env = {
+        "INVOX_CLASSIFIER_MODE": args.mode,
+        "INVOX_EMBEDDING_FAST_PATH": "1" if args.embedding_fast_path else "0",
+        "INVOX_STUDENT": "1" if args.student else "0",
+    }
+    if args.no_cache:
+        env.update({"INVOX_RESULT_CACHE": "0", "INVOX_NEAR_DUPLICATE": "0"})
+    if metrics.METRICS_JSONL:
+        env["INVOX_METRICS_JSONL"] = metrics.METRICS_JSONL
+    return env
+
+
+def _classify_pooled(names: list[str], contents: list[str], args) -> None:
+    from invox.features.email_classification.worker_pool import WorkerPool
+
+    with WorkerPool(
+        workers=args.workers,
+        threads_per_worker=args.threads,
+        chunk_size=args.batch_size,
+        env=_worker_env(args),
+    ) as pool:
+        pool.warmup()
+        results = pool.imap(contents)
+        for filename, ((final_parent, final_child), elapsed) in zip(names, results):
+            print(
+                f"RESULT|{filename}|{final_parent}|{final_child}|{elapsed:.3f}",
+                flush=True,
+            )
+
+
+def _classify_streaming(source, args) -> None:
+    """
+    Runs the reader, spam-gate and router stages of pipeline.py side by side;
+    results print as each email finishes, with its time through the pipeline,
+    or go to --jsonl with their scores and stage timings.
+    """
+    import asyncio
+    from invox.features.email_classification.pipeline import (
+        ROUTER_BATCH,
+        JsonlWriter,
+        StreamingPipeline,
+    )
+
+    async def write_results(pipeline) -> None:
+        if args.jsonl:
+            with JsonlWriter(args.jsonl) as writer:
+                async for result in pipeline.run(source):
+                    writer.write(result)
+            log.info("[PIPELINE] Wrote %d results to %s", writer.written, args.jsonl)
+            return
+        async for result in pipeline.run(source):
+            print(
+                f"RESULT|{result['name']}|{result['parent']}|{result['child']}"
+                f"|{result['elapsed_sec']:.3f}",
+                flush=True,
+            )
+
+    with StreamingPipeline(
+        mode=args.mode,
+        routers=args.workers,
+        router_batch=args.batch_size if args.batch_size > 1 else ROUTER_BATCH,
+        # The settings of this (possibly __main__) module, CLI flags included
+        service=sys.modules[__name__],
+        pool_env=_worker_env(args),
+        details=bool(args.jsonl),
+    ) as pipeline:
+        pipeline.warmup()
+        asyncio.run(write_results(pipeline))
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(description="Invox email classification")
+    parser.add_argument("files", nargs="*", help="Email text files to classify")
+    parser.add_argument(
+        "--packed",
+        help="Classify a packed .jsonl dataset (generate_dataset.py --packed) instead of files",
+    )
+    parser.add_argument("--mbox", help="Classify every message of an mbox file")
+    parser.add_argument(
+        "--maildir", help="Classify every message in new/ and cur/ of a Maildir"
+    )
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help='Classify emails read from stdin as JSON lines ({"id", "text"} or a string)',
+    )
+    parser.add_argument(
+        "--jsonl",
+        help="Write results with scores and stage timings as JSON lines to this path "
+        "('-' for stdout) instead of RESULT lines; implies --stream",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="Classify this many emails per batched call (default: 1, sequential)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["hierarchical", "flat"],
+        default=CLASSIFIER_MODE,
+        help="hierarchical: Parent then Child call (TMH); flat: one call over all labels",
+    )
+    parser.add_argument(
+        "--embedding-fast-path",
+        action="store_true",
+        default=EMBEDDING_FAST_PATH,
+        help="Skip Gemma when the embedding classifier is confident",
+    )
+    parser.add_argument(
+        "--student",
+        action="store_true",
+        default=student_classifier.STUDENT_ENABLED,
+        help="Ask the student model distilled from Gemma first (see student_classifier.py)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the result cache and near-duplicate label reuse",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("INVOX_WORKERS", "1")),
+        help="Model worker processes sharing the mmap'd GGUF weights (default: 1)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=category_detection.N_THREADS,
+        help="llama.cpp threads per worker",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Overlap reading, the spam gate and the router as pipelined stages "
+        "(see pipeline.py); --workers router processes, --batch-size per router call",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        default=metrics.METRICS_JSONL,
+        help="Append per-email stage timings and token counts here as JSON lines ('-' for stderr)",
+    )
+    args = parser.parse_args()
+    metrics.configure(jsonl=args.metrics_jsonl)
+    CLASSIFIER_MODE = args.mode
+    EMBEDDING_FAST_PATH = args.embedding_fast_path
+    student_classifier.STUDENT_ENABLED = args.student
+    if args.no_cache:
+        result_cache = None
+        NEAR_DUPLICATE_REUSE = False
+    category_detection.N_THREADS = args.threads
+
+    # Mail archives and stdin are streamed in one pass, never loaded whole
+    if args.stream or args.jsonl or args.mbox or args.maildir or args.ndjson:
+        from invox.features.email_classification import mail_sources
+        from invox.features.email_classification.pipeline import file_source, packed_source
+
+        if args.mbox:
+            source = mail_sources.mbox_source(args.mbox)
+        elif args.maildir:
+            source = mail_sources.maildir_source(args.maildir)
+        elif args.ndjson:
+            source = mail_sources.ndjson_source()
+        elif args.packed:
+            source = packed_source(args.packed)
+        elif args.files:
+            source = file_source(args.files)
+        else:
+            print("RESULT|Error|NoInputFile|0.00")
+            sys.exit(1)
+        _classify_streaming(source, args)
+        _log_reuse_stats()
+        sys.exit(0)
+
+    if args.packed:
+        if args.workers > 1:
+            with PackedDataset(args.packed) as dataset:
+                records = list(dataset)
+            _classify_pooled(
+                [f"#{r['id']}" for r in records], [r["text"] for r in records], args
+            )
+            sys.exit(0)
+        warmup(batch=args.batch_size > 1)
+        _classify_packed(args.packed, args.batch_size)
+        _log_reuse_stats()
+        sys.exit(0)
+
+    if not args.files:
         print("RESULT|Error|NoInputFile|0.00")
         sys.exit(1)
 
     # Grab ALL files passed from the Bash script
-    file_paths = sys.argv[1:]
+    file_paths = args.files
+
+    if args.workers > 1:
+        # Each worker loads (and warms up) its own models
+        _classify_files_pooled(file_paths, args)
+        sys.exit(0)
+
+    # Load models up front so the first email's timing only covers inference
+    warmup(batch=args.batch_size > 1)
+
+    if args.batch_size > 1:
+        _classify_files_batched(file_paths, args.batch_size)
+        _log_reuse_stats()
+        sys.exit(0)
 
     # Loop through the files without ever unloading the GGUF model from RAM
     for file_path in file_paths:
@@ -100,7 +735,7 @@ if __name__ == "__main__":
             )
 
         except Exception as e:
-            print(
-                f"\n--- FATAL FILE ERROR ---\n{traceback.format_exc()}", file=sys.stderr
-            )
+            log.error("\n--- FATAL FILE ERROR ---\n%s", traceback.format_exc())
             print(f"RESULT|{filename}|Error|RuntimeFailure|0.00", flush=True)
+
+    _log_reuse_stats()
@@ -0,0 +1,10 @@
+"""
+Shared runtime settings for the email classification pipeline.
+"""
+
+import os
+
+# Where derived artifacts (embedding centroids, result caches, ...) are kept
+CACHE_DIR = os.getenv(
+    "INVOX_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "invox")
+)
@@ -1,17 +1,245 @@
-import sys
-from transformers import pipeline
+import os
+import math
+import time
+from typing import Optional
+import numpy as np
 
-print("  -> [Spam Gate] Initializing BERT-tiny model weights...", file=sys.stderr)
+from invox.features.email_classification import metrics, spam_rules
+from invox.features.email_classification.lazy_model import LazyModel
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.model_registry import model_tag, resolve_model
 
-spam_classifier = pipeline(
-    "text-classification",
-    model="mrm8488/bert-tiny-finetuned-enron-spam-detection",
-    device_map="auto",
-    truncation=True,
-    max_length=512,
-)
+SPAM_MODEL = os.getenv("INVOX_SPAM_MODEL", "mrm8488/bert-tiny-finetuned-enron-spam-detection")
+# Logical name in the local model registry (see model_registry.py)
+SPAM_MODEL_NAME = os.getenv("INVOX_SPAM_MODEL_NAME", "spam-gate")
+# An explicit INVOX_SPAM_MODEL takes precedence over the registry
+SPAM_MODEL_PINNED = ("repo_id",) if "INVOX_SPAM_MODEL" in os.environ else ()
+SPAM_BATCH_SIZE = int(os.getenv("INVOX_SPAM_BATCH_SIZE", "32"))
+# "torch" (transformers pipeline) or "onnx" (onnxruntime, see spam_onnx.py)
+SPAM_BACKEND = os.getenv("INVOX_SPAM_BACKEND", "torch")
+# Intra-op threads for BERT-tiny; 0 keeps the backend's default
+SPAM_THREADS = int(os.getenv("INVOX_SPAM_THREADS", "0"))
+# Tokens of each email the model sees
+SPAM_MAX_LENGTH = 512
+# Output labels of the model that mean spam
+SPAM_LABELS = ("spam", "label_1")
 
-print("  -> [Spam Gate] Model loaded into VRAM successfully.", file=sys.stderr)
+# Cascade: the rule/header tier decides clear cases, BERT-tiny the rest
+SPAM_RULES = os.getenv("INVOX_SPAM_RULES", "1") == "1"
+# Calibrated P(spam) at or above which the model tier calls spam
+SPAM_THRESHOLD = float(os.getenv("INVOX_SPAM_THRESHOLD", "0.5"))
+# Temperature for the model's probabilities (1.0 = uncalibrated); see fit_temperature()
+SPAM_TEMPERATURE = float(os.getenv("INVOX_SPAM_TEMPERATURE", "1.0"))
+
+# Decisions per tier since start-up, see log_tier_stats()
+tier_counts = {"rules_spam": 0, "rules_ham": 0, "model_spam": 0, "model_ham": 0}
+
+log = get_logger("spam_detection")
+
+
+def _resolve_spam_model() -> str:
+    return resolve_model(SPAM_MODEL_NAME, SPAM_MODEL_PINNED, repo_id=SPAM_MODEL)
+
+
+def _load_spam_classifier():
+    if SPAM_BACKEND == "onnx":
+        from invox.features.email_classification import spam_onnx
+
+        precision = spam_onnx.ONNX_PRECISION
+        log.info("  -> [Spam Gate] Opening ONNX Runtime session (%s)...", precision)
+        return spam_onnx.load(
+            SPAM_MODEL, _resolve_spam_model, SPAM_MAX_LENGTH, SPAM_THREADS
+        )
+
+    # transformers alone takes seconds to import, so it is only pulled in here
+    from transformers import logging as hf_logging
+    from transformers import pipeline
+
+    hf_logging.set_verbosity_info()
+
+    log.info("  -> [Spam Gate] Initializing BERT-tiny model weights...")
+    if SPAM_THREADS:
+        import torch
+
+        torch.set_num_threads(SPAM_THREADS)
+    classifier = pipeline(
+        "text-classification",
+        model=_resolve_spam_model(),
+        device_map="auto",
+        truncation=True,
+        max_length=SPAM_MAX_LENGTH,
+    )
+    log.info("  -> [Spam Gate] Model loaded into VRAM successfully.")
+    return classifier
+
+
+spam_model = LazyModel("Spam Gate", _load_spam_classifier)
+
+
+def warmup() -> None:
+    """Loads the spam model now instead of on the first check_is_spam() call."""
+    spam_model.get()
+
+
+def cache_tag() -> str:
+    """Spam-stage settings that change its answers, for result cache keys."""
+    rules = f"rules:{spam_rules.config_digest()}" if SPAM_RULES else "no-rules"
+    model = model_tag(SPAM_MODEL_NAME, SPAM_MODEL_PINNED, repo_id=SPAM_MODEL)
+    if SPAM_BACKEND == "onnx":
+        from invox.features.email_classification import spam_onnx
+
+        # Quantized weights move the probabilities a little
+        model += f":onnx-{spam_onnx.ONNX_PRECISION}"
+    return f"{model}|{rules}|p>={SPAM_THRESHOLD}|T={SPAM_TEMPERATURE}"
+
+
+def _logit(p: float) -> float:
+    p = min(max(p, 1e-7), 1 - 1e-7)
+    return math.log(p / (1.0 - p))
+
+
+def _spam_column(id2label: dict) -> int:
+    """Index of the model output that means spam."""
+    for index, label in id2label.items():
+        if str(label).lower() in SPAM_LABELS:
+            return int(index)
+    raise ValueError(f"{SPAM_MODEL} has no spam label among {id2label}")
+
+
+def model_spam_probabilities(
+    email_texts: list[str], batch_size: Optional[int] = None
+) -> np.ndarray:
+    """
+    Uncalibrated BERT-tiny P(spam) of each email, as a float32 array in input
+    order. All emails are tokenized in one call, sorted by token count and cut
+    into batches of `batch_size` (default SPAM_BATCH_SIZE), so every batch
+    is a length bucket padded only to its own longest email.
+    """
+    classifier = spam_model.get()
+    batch_size = batch_size or SPAM_BATCH_SIZE
+    if SPAM_BACKEND == "onnx":
+        column = _spam_column(classifier.id2label)
+        return classifier.probabilities(email_texts, column, batch_size)
+
+    import torch
+
+    tokenizer, model = classifier.tokenizer, classifier.model
+    probabilities = np.empty(len(email_texts), dtype=np.float32)
+    if not email_texts:
+        return probabilities
+
+    encoded = tokenizer(list(email_texts), truncation=True, max_length=SPAM_MAX_LENGTH)
+    lengths = np.array([len(ids) for ids in encoded["input_ids"]])
+    order = np.argsort(lengths, kind="stable")
+    spam_column = _spam_column(model.config.id2label)
+
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            bucket = order[start : start + batch_size]
+            batch = tokenizer.pad(
+                {key: [encoded[key][i] for i in bucket] for key in encoded.keys()},
+                return_tensors="pt",
+            )
+            batch = {key: value.to(model.device) for key, value in batch.items()}
+            output = model(**batch)
+            spam = torch.softmax(output.logits.float(), dim=-1)[:, spam_column]
+            probabilities[bucket] = spam.cpu().numpy()
+    return probabilities
+
+
+def _calibrate(probabilities: np.ndarray) -> np.ndarray:
+    """Temperature-scales raw P(spam) by SPAM_TEMPERATURE."""
+    if SPAM_TEMPERATURE == 1.0:
+        return probabilities
+    p = np.clip(probabilities, 1e-7, 1 - 1e-7)
+    return 1.0 / (1.0 + np.exp(-np.log(p / (1.0 - p)) / SPAM_TEMPERATURE))
+
+
+def spam_probabilities(
+    email_texts: list[str], batch_size: Optional[int] = None
+) -> np.ndarray:
+    """Calibrated model P(spam) of each email (no rule tier), in input order."""
+    return _calibrate(model_spam_probabilities(email_texts, batch_size))
+
+
+def fit_temperature(probabilities: list[float], is_spam: list[bool]) -> float:
+    """
+    Temperature that minimises the negative log-likelihood of raw model
+    probabilities on labelled data; set it as INVOX_SPAM_TEMPERATURE.
+    """
+    logits = [_logit(p) for p in probabilities]
+
+    def nll(temperature: float) -> float:
+        total = 0.0
+        for logit, spam in zip(logits, is_spam):
+            p = 1.0 / (1.0 + math.exp(-logit / temperature))
+            total -= math.log(max(p if spam else 1.0 - p, 1e-12))
+        return total
+
+    return min((t / 20 for t in range(5, 201)), key=nll)
+
+
+def _record(index: int, verdict: dict) -> dict:
+    tier_counts[f"{verdict['tier']}_{'spam' if verdict['is_spam'] else 'ham'}"] += 1
+    metrics.tag(index, spam_tier=verdict["tier"], is_spam=verdict["is_spam"])
+    metrics.add(index, spam_score=verdict["score"])
+    return verdict
+
+
+def score_spam_batch(email_texts: list[str]) -> list[dict]:
+    """
+    Runs the cascade over many emails. Each verdict has `is_spam`, `score`
+    (calibrated P(spam)), `tier` ("rules" or "model") and the rule `reasons`.
+    Only emails the rules leave undecided reach BERT-tiny, through the
+    length-bucketed batches of spam_probabilities().
+    """
+    verdicts = [None] * len(email_texts)
+    undecided = []
+    for i, email_text in enumerate(email_texts):
+        start_time = time.perf_counter()
+        rules = spam_rules.evaluate(email_text) if SPAM_RULES else None
+        metrics.add(i, spam_ms=(time.perf_counter() - start_time) * 1000)
+        if rules is not None and rules["decision"] is not None:
+            verdicts[i] = _record(
+                i,
+                {
+                    "is_spam": rules["decision"] == "spam",
+                    "score": rules["score"],
+                    "tier": "rules",
+                    "reasons": rules["reasons"],
+                }
+            )
+        else:
+            undecided.append(i)
+
+    if undecided:
+        texts = [email_texts[i] for i in undecided]
+        with metrics.subset(undecided), metrics.stage("spam"):
+            scores = spam_probabilities(texts)
+        for i, score in zip(undecided, scores.tolist()):
+            verdicts[i] = _record(
+                i,
+                {
+                    "is_spam": score >= SPAM_THRESHOLD,
+                    "score": score,
+                    "tier": "model",
+                    "reasons": [],
+                }
+            )
+    return verdicts
+
+
+def score_spam(email_text: str) -> dict:
+    log.debug("  -> [Spam Gate] Analyzing text patterns...")
+    verdict = score_spam_batch([email_text])[0]
+    log.debug(
+        "  -> [Spam Gate] %s tier: P(spam)=%.4f (threshold %s) %s",
+        verdict["tier"],
+        verdict["score"],
+        SPAM_THRESHOLD,
+        "; ".join(verdict["reasons"]),
+    )
+    return verdict
 
 
 def check_is_spam(email_text: str) -> bool:
@@ -19,15 +247,31 @@ def check_is_spam(email_text: str) -> bool:
     Evaluates email text to determine if it is spam.
     Returns True if spam, False if ham.
     """
-    print("  -> [Spam Gate] Analyzing text patterns...", file=sys.stderr)
-    result = spam_classifier(email_text)[0]
+    return score_spam(email_text)["is_spam"]
 
-    label = result["label"].lower()
-    score = result["score"]
 
-    print(
-        f"  -> [Spam Gate] Inference completed. Raw Label: {label}, Confidence: {score:.4f}",
-        file=sys.stderr,
-    )
+def check_is_spam_batch(email_texts: list[str]) -> list[bool]:
+    """Batched version of check_is_spam()."""
+    log.info("  -> [Spam Gate] Analyzing %d emails in one batch...", len(email_texts))
+    return [verdict["is_spam"] for verdict in score_spam_batch(email_texts)]
+
 
-    return label == "spam" or label == "label_1"
+def log_tier_stats() -> None:
+    """How much traffic each cascade tier decided."""
+    total = sum(tier_counts.values())
+    if not total:
+        return
+    rules = tier_counts["rules_spam"] + tier_counts["rules_ham"]
+    log.info(
+        "[SPAM] Rules tier: %d/%d (%.1f%%; %d spam, %d ham), "
+        "model tier: %d/%d (%d spam, %d ham)",
+        rules,
+        total,
+        100 * rules / total,
+        tier_counts["rules_spam"],
+        tier_counts["rules_ham"],
+        total - rules,
+        total,
+        tier_counts["model_spam"],
+        tier_counts["model_ham"],
+    )
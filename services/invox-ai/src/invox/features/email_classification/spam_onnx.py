@@ -0,0 +1,217 @@
+"""
+ONNX Runtime backend for the BERT-tiny spam gate.
+
+The torch backend pulls in transformers and torch to run a 4M-parameter
+model, which costs seconds of import time and hundreds of MB per worker.
+This backend runs the same model exported to ONNX (int8 dynamic
+quantization by default) with onnxruntime on CPU, and tokenizes with the
+`tokenizers` fast tokenizer saved next to it. Once the export exists,
+neither torch nor transformers is imported (spam_onnx_parity.py checks
+that for the whole service).
+
+Selected with INVOX_SPAM_BACKEND=onnx. The export is done once, on first load
+or explicitly, and is the only step that needs torch and transformers:
+
+    python spam_onnx.py export [--precision int8|fp32]
+
+It is cached under INVOX_CACHE_DIR; INVOX_SPAM_ONNX_DIR points at a prebuilt
+export instead (e.g. one baked into an image).
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import numpy as np
+
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.settings import CACHE_DIR
+
+# "int8" (dynamic quantization of the weights) or "fp32"
+ONNX_PRECISION = os.getenv("INVOX_SPAM_ONNX_PRECISION", "int8")
+ONNX_DIR = os.getenv("INVOX_SPAM_ONNX_DIR", "")
+ONNX_OPSET = 17
+
+MODEL_FILE = "model.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+LABELS_FILE = "labels.json"
+
+log = get_logger("spam_onnx")
+
+
+def export_dir(model_id: str, precision: str = ONNX_PRECISION) -> str:
+    """Where the export of `model_id` at `precision` lives."""
+    if ONNX_DIR:
+        return ONNX_DIR
+    key = hashlib.sha256(json.dumps([model_id, precision, ONNX_OPSET]).encode("utf-8"))
+    return os.path.join(CACHE_DIR, "spam_onnx", key.hexdigest()[:16])
+
+
+def is_exported(directory: str) -> bool:
+    return all(
+        os.path.exists(os.path.join(directory, name))
+        for name in (MODEL_FILE, TOKENIZER_FILE, LABELS_FILE)
+    )
+
+
+def export(model_path: str, directory: str, precision: str = ONNX_PRECISION) -> str:
+    """
+    Exports the Hugging Face model at `model_path` to `directory`: the ONNX
+    graph (batch and sequence axes dynamic), its fast tokenizer and its
+    id2label map. Returns `directory`.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    log.info("  -> [Spam ONNX] Exporting %s (%s)...", model_path, precision)
+    tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=True)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path).eval()
+
+    tmp_dir = f"{directory}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    fp32_path = os.path.join(tmp_dir, "model-fp32.onnx")
+
+    sample = tokenizer(["spam gate export"], return_tensors="pt")
+    input_names = [
+        name
+        for name in ("input_ids", "attention_mask", "token_type_ids")
+        if name in sample
+    ]
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes={**{name: axes for name in input_names}, "logits": {0: "batch"}},
+            opset_version=ONNX_OPSET,
+        )
+
+    model_path_out = os.path.join(tmp_dir, MODEL_FILE)
+    if precision == "int8":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, model_path_out, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    else:
+        os.replace(fp32_path, model_path_out)
+
+    tokenizer.backend_tokenizer.save(os.path.join(tmp_dir, TOKENIZER_FILE))
+    with open(os.path.join(tmp_dir, LABELS_FILE), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "id2label": {str(k): v for k, v in model.config.id2label.items()},
+                "inputs": input_names,
+                "pad_token_id": tokenizer.pad_token_id or 0,
+            },
+            f,
+            indent=2,
+        )
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return directory
+
+
+class OnnxSpamModel:
+    """BERT-tiny in an onnxruntime CPU session, with length-bucketed batches."""
+
+    def __init__(self, directory: str, max_length: int, threads: int = 0):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, LABELS_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.id2label = {int(k): v for k, v in meta["id2label"].items()}
+        self.input_names = meta["inputs"]
+        self.pad_token_id = meta["pad_token_id"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.no_padding()
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(directory, MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def _pad(self, encodings: list) -> dict[str, np.ndarray]:
+        width = max(len(e.ids) for e in encodings)
+        arrays = {
+            "input_ids": np.full(
+                (len(encodings), width), self.pad_token_id, dtype=np.int64
+            ),
+            "attention_mask": np.zeros((len(encodings), width), dtype=np.int64),
+            "token_type_ids": np.zeros((len(encodings), width), dtype=np.int64),
+        }
+        for row, encoding in enumerate(encodings):
+            n = len(encoding.ids)
+            arrays["input_ids"][row, :n] = encoding.ids
+            arrays["attention_mask"][row, :n] = encoding.attention_mask
+            arrays["token_type_ids"][row, :n] = encoding.type_ids
+        return {name: arrays[name] for name in self.input_names}
+
+    def probabilities(
+        self, email_texts: list[str], column: int, batch_size: int
+    ) -> np.ndarray:
+        """Softmax probability of output `column` for each email, in input order."""
+        probabilities = np.empty(len(email_texts), dtype=np.float32)
+        if not email_texts:
+            return probabilities
+
+        encodings = self.tokenizer.encode_batch(list(email_texts))
+        order = np.argsort([len(e.ids) for e in encodings], kind="stable")
+        for start in range(0, len(order), batch_size):
+            bucket = order[start : start + batch_size]
+            (logits,) = self.session.run(
+                ["logits"], self._pad([encodings[i] for i in bucket])
+            )
+            logits = logits.astype(np.float32)
+            logits -= logits.max(axis=1, keepdims=True)
+            exp = np.exp(logits)
+            probabilities[bucket] = exp[:, column] / exp.sum(axis=1)
+        return probabilities
+
+
+def load(model_id: str, resolve_path, max_length: int, threads: int = 0) -> OnnxSpamModel:
+    """
+    Loads the export of `model_id`, exporting it first when it is missing;
+    `resolve_path()` returns the Hugging Face weights to export from.
+    """
+    directory = export_dir(model_id)
+    if not is_exported(directory):
+        if ONNX_DIR:
+            raise FileNotFoundError(f"INVOX_SPAM_ONNX_DIR has no ONNX export: {ONNX_DIR}")
+        export(resolve_path(), directory)
+    return OnnxSpamModel(directory, max_length, threads)
+
+
+if __name__ == "__main__":
+    from invox.features.email_classification import spam_detection
+    from invox.features.email_classification.model_registry import resolve_model
+
+    parser = argparse.ArgumentParser(description="Export the spam gate to ONNX")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--precision", choices=["int8", "fp32"], default=ONNX_PRECISION)
+    args = parser.parse_args()
+
+    model_path = resolve_model(
+        spam_detection.SPAM_MODEL_NAME,
+        spam_detection.SPAM_MODEL_PINNED,
+        repo_id=spam_detection.SPAM_MODEL,
+    )
+    directory = export(
+        model_path, export_dir(spam_detection.SPAM_MODEL, args.precision), args.precision
+    )
+    size_mb = os.path.getsize(os.path.join(directory, MODEL_FILE)) / 1e6
+    print(f"Exported {spam_detection.SPAM_MODEL} ({args.precision}, {size_mb:.1f} MB)")
+    print(f"  -> {directory}")
@@ -0,0 +1,223 @@
+"""
+Rule/header tier of the spam cascade.
+
+Scores an email from cheap signals (sender domain, known phishing phrases,
+link density) in microseconds, before BERT-tiny is involved. Each signal adds
+log-odds evidence; the total maps to P(spam) through a sigmoid. Only clear
+cases are decided here:
+
+    - "spam" when the evidence reaches RULE_SPAM_LOG_ODDS
+    - "ham"  when no spam signal fired and the sender domain is (under) one
+             of INVOX_SPAM_TRUSTED_DOMAINS *and* authenticated: a DKIM, SPF or
+             DMARC pass for it in an Authentication-Results header stamped
+             by one of our own servers (INVOX_SPAM_AUTHSERV_IDS). A bare
+             From header is trivial to forge, so it never decides ham alone.
+
+Everything else is left to the model tier (decision None).
+"""
+
+import os
+import re
+import json
+import math
+import hashlib
+from email.parser import HeaderParser
+from typing import Optional
+
+# Log-odds needed for the rules to call spam on their own (~0.99 probability)
+RULE_SPAM_LOG_ODDS = float(os.getenv("INVOX_SPAM_RULE_LOG_ODDS", "4.6"))
+# Prior log-odds of an email being spam before any rule fires
+PRIOR_LOG_ODDS = -2.0
+
+TRUSTED_DOMAINS = frozenset(
+    d.strip().lower()
+    for d in os.getenv("INVOX_SPAM_TRUSTED_DOMAINS", "").split(",")
+    if d.strip()
+)
+# authserv-ids of our own MTAs; Authentication-Results from anyone else are
+# ignored, since the sender can add those headers too
+TRUSTED_AUTHSERV_IDS = frozenset(
+    d.strip().lower()
+    for d in os.getenv("INVOX_SPAM_AUTHSERV_IDS", "").split(",")
+    if d.strip()
+)
+BLOCKED_DOMAINS = frozenset(
+    d.strip().lower()
+    for d in os.getenv("INVOX_SPAM_BLOCKED_DOMAINS", "").split(",")
+    if d.strip()
+)
+
+# TLDs that carry mostly throwaway senders
+SUSPICIOUS_TLDS = frozenset(
+    ["xyz", "top", "click", "zip", "mov", "loan", "work", "rest"]
+    + ["gq", "tk", "ml", "cf", "ga"]
+)
+
+# (trigger words, pattern, log-odds weight). A pattern is only run when one of
+# its trigger words occurs in the lowercased text, which keeps ordinary emails
+# to a handful of substring checks.
+PHISHING_PHRASES = [
+    (("verify",), r"verify your (account|identity|password)", 2.5),
+    (
+        ("suspended", "locked", "deactivated"),
+        r"(account|mailbox) (has been|will be) (suspended|locked|deactivated|closed)",
+        3.0,
+    ),
+    (("confirm",), r"confirm your (password|login|credentials|billing)", 3.0),
+    (("update",), r"update your (payment|billing) (details|information)", 2.5),
+    (("unusual",), r"unusual (sign-in|login) activity", 1.5),
+    (("won", "selected"), r"you('ve| have) (won|been selected)", 3.0),
+    (("claim", "collect"), r"(claim|collect) your (prize|reward|winnings|refund)", 3.0),
+    (
+        ("lottery", "jackpot", "inheritance", "next of kin"),
+        r"lottery|jackpot|inheritance fund|next of kin",
+        2.5,
+    ),
+    (("wire", "union", "moneygram"), r"wire transfer|western union|moneygram", 1.5),
+    (("gift",), r"gift ?cards?", 1.5),
+    (("bitcoin", "crypto"), r"(bitcoin|crypto) (wallet|payment|investment)", 2.0),
+    (
+        ("100%", "risk", "credit check"),
+        r"100% (free|guaranteed)|risk[- ]free|no credit check",
+        2.0,
+    ),
+    (
+        ("act now", "limited time", "expires"),
+        r"act now|limited time offer|offer expires",
+        1.5,
+    ),
+    (
+        ("click",),
+        r"click (here|the link|below) (to|and) (verify|confirm|claim|unlock|log ?in)",
+        2.5,
+    ),
+    (("unsubscribe",), r"unsubscribe", 0.5),
+]
+_PHRASE_RULES = [
+    (triggers, re.compile(pattern), weight)
+    for triggers, pattern, weight in PHISHING_PHRASES
+]
+
+_AUTH_PASS_RE = re.compile(
+    r"\b(?:dkim|spf|dmarc)\s*=\s*pass\b[^;]*?"
+    r"\b(?:header\.d|header\.from|smtp\.mailfrom)\s*=\s*(?:[^\s;@]*@)?([a-z0-9.-]+)"
+)
+_header_parser = HeaderParser()
+_ADDRESS_DOMAIN_RE = re.compile(r"@([A-Za-z0-9.-]+\.[A-Za-z]{2,})")
+_URL_RE = re.compile(r"https?://([^/\s\"'<>]+)")
+_IP_HOST_RE = re.compile(r"^\d{1,3}(\.\d{1,3}){3}(:\d+)?$")
+_LOOKALIKE_RE = re.compile(
+    r"(paypa1|micros0ft|app1e|g00gle|amaz0n|-secure-|secure-login|verify-)",
+    re.IGNORECASE,
+)
+
+# Links per 100 words above which the body counts as link-heavy
+LINK_DENSITY_LIMIT = 3.0
+
+
+def _headers(email_text: str):
+    # Stops at the end of the header block, whatever the line endings
+    return _header_parser.parsestr(email_text, headersonly=True)
+
+
+def _authenticated_domains(headers) -> set[str]:
+    """Domains with a DKIM/SPF/DMARC pass from one of TRUSTED_AUTHSERV_IDS."""
+    domains = set()
+    for value in headers.get_all("authentication-results") or ():
+        value = " ".join(str(value).lower().split())
+        authserv_id = value.split(";", 1)[0].split()[0] if value else ""
+        if authserv_id in TRUSTED_AUTHSERV_IDS:
+            domains.update(d.rstrip(".") for d in _AUTH_PASS_RE.findall(value))
+    return domains
+
+
+def _within(domain: str, parents) -> bool:
+    return any(domain == parent or domain.endswith(f".{parent}") for parent in parents)
+
+
+def _domain(address) -> Optional[str]:
+    match = _ADDRESS_DOMAIN_RE.search(str(address or ""))
+    return match.group(1).lower() if match else None
+
+
+def sender_domain(email_text: str) -> Optional[str]:
+    return _domain(_headers(email_text).get("from"))
+
+
+def config_digest() -> str:
+    """Short hash of everything that changes rule decisions."""
+    config = [
+        RULE_SPAM_LOG_ODDS,
+        PRIOR_LOG_ODDS,
+        sorted(TRUSTED_DOMAINS),
+        sorted(TRUSTED_AUTHSERV_IDS),
+        sorted(BLOCKED_DOMAINS),
+        PHISHING_PHRASES,
+    ]
+    return hashlib.sha256(json.dumps(config).encode("utf-8")).hexdigest()[:12]
+
+
+def _sigmoid(x: float) -> float:
+    return 1.0 / (1.0 + math.exp(-x))
+
+
+def evaluate(email_text: str) -> dict:
+    """
+    Returns `score` (P(spam) from the rules), `decision` ("spam", "ham" or
+    None when the model tier has to decide) and the `reasons` that fired.
+    """
+    headers = _headers(email_text)
+    sender = _domain(headers.get("from"))
+    reply_to = _domain(headers.get("reply-to"))
+
+    log_odds = PRIOR_LOG_ODDS
+    reasons = []
+
+    if sender is not None:
+        if sender in BLOCKED_DOMAINS:
+            log_odds += 10.0
+            reasons.append(f"blocked sender {sender}")
+        if sender.rsplit(".", 1)[-1] in SUSPICIOUS_TLDS:
+            log_odds += 1.5
+            reasons.append(f"suspicious TLD .{sender.rsplit('.', 1)[-1]}")
+        if _LOOKALIKE_RE.search(sender):
+            log_odds += 2.5
+            reasons.append(f"lookalike sender {sender}")
+        if reply_to is not None and reply_to != sender:
+            log_odds += 1.0
+            reasons.append("reply-to differs from sender")
+
+    lowered = email_text.lower()
+    for triggers, pattern, weight in _PHRASE_RULES:
+        if any(trigger in lowered for trigger in triggers) and pattern.search(lowered):
+            log_odds += weight
+            reasons.append(f"phrase /{pattern.pattern}/")
+
+    hosts = _URL_RE.findall(lowered) if "http" in lowered else []
+    if hosts:
+        words = max(len(email_text.split()), 1)
+        density = 100.0 * len(hosts) / words
+        if density > LINK_DENSITY_LIMIT:
+            log_odds += 1.5
+            reasons.append(f"link density {density:.1f}/100 words")
+        if any(_IP_HOST_RE.match(host) for host in hosts):
+            log_odds += 2.5
+            reasons.append("link to a raw IP address")
+        if any(_LOOKALIKE_RE.search(host) for host in hosts):
+            log_odds += 2.5
+            reasons.append("lookalike link host")
+
+    decision = None
+    if log_odds >= RULE_SPAM_LOG_ODDS:
+        decision = "spam"
+    elif (
+        not reasons
+        and sender is not None
+        and _within(sender, TRUSTED_DOMAINS)
+        and _within(sender, _authenticated_domains(headers))
+    ):
+        decision = "ham"
+        reasons.append(f"authenticated trusted sender {sender}")
+        log_odds = -RULE_SPAM_LOG_ODDS
+
+    return {"score": _sigmoid(log_odds), "decision": decision, "reasons": reasons}
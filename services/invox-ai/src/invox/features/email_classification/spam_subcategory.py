@@ -0,0 +1,395 @@
+"""
+Spam subcategory classifier.
+
+Once the spam gate fires, the child label (Phishing, Scams, Malware, ...) is
+picked by a TF-IDF + logistic regression model instead of the Gemma router.
+It is trained on the seed descriptions below plus the Spam emails of a
+labelled dataset (INVOX_SPAM_CHILD_DATASET, a dataset directory or packed
+.jsonl; by default the repo's email_dataset, when present). The seeds alone
+do not share enough vocabulary with real mail to pick a child.
+
+Fitting also sets the probability below which the child falls back to
+"Others": stratified cross-validation labels every training Spam email with
+a model fitted on the other folds, and the cutoff is the one that gets most
+of those held-out emails right. The model, cutoff and held-out report are
+cached together under INVOX_CACHE_DIR on first load; INVOX_SPAM_CHILD_MIN_PROB
+overrides the cutoff. Run this module to refit (or `--cv` to only report).
+"""
+
+import os
+import json
+import argparse
+import hashlib
+from typing import Optional
+
+from invox.features.email_classification.categories import get_child_labels
+from invox.features.email_classification.lazy_model import LazyModel
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.packed_dataset import load_labelled
+from invox.features.email_classification.settings import CACHE_DIR
+
+SPAM_CHILDREN = get_child_labels("Spam")
+DEFAULT_DATASET = os.path.abspath(
+    os.path.join(
+        os.path.dirname(__file__),
+        *[os.pardir] * 4,
+        "tests",
+        "features",
+        "email_classification",
+        "email_dataset",
+    )
+)
+TRAINING_DATASET = os.getenv("INVOX_SPAM_CHILD_DATASET", DEFAULT_DATASET)
+# Held-out folds used to pick the cutoff
+CV_FOLDS = int(os.getenv("INVOX_SPAM_CHILD_CV_FOLDS", "5"))
+# Explicit cutoff; otherwise the fitted one (or FALLBACK_MIN_PROBABILITY when
+# there was too little labelled data to cross-validate)
+_MIN_PROBABILITY_ENV = os.getenv("INVOX_SPAM_CHILD_MIN_PROB")
+FALLBACK_MIN_PROBABILITY = 0.3
+
+SEED_EXAMPLES = {
+    "Phishing": [
+        "Your account has been suspended. Verify your identity by logging in at the link below.",
+        "Unusual sign-in activity detected. Confirm your password to keep access to your mailbox.",
+        "Your payment information is out of date. Update your billing details to avoid service interruption.",
+        "Security notice from your bank: re-enter your credentials on our secure portal.",
+        "Your email storage is full. Log in to validate your account or messages will be deleted.",
+    ],
+    "Scams": [
+        "Congratulations, you have won the international lottery. Send a processing fee to claim your prize.",
+        "I am a prince with an inheritance fund of 10 million dollars and need your help to transfer it.",
+        "Work from home and earn 5000 dollars a week, just pay the registration fee with gift cards.",
+        "Your package is held at customs. Pay the release fee by wire transfer today.",
+        "Guaranteed investment returns of 300 percent, send bitcoin to secure your spot.",
+    ],
+    "Junk": [
+        "Cheap meds, best prices, buy now, no prescription needed, limited stock.",
+        "Hot singles deals discounts click now amazing offers unsubscribe anytime.",
+        "Best replica watches and bags at wholesale prices, order today.",
+        "Lose weight fast with this one weird trick, doctors hate it.",
+        "Bulk email marketing lists for sale, millions of addresses, cheap.",
+    ],
+    "Fakes": [
+        "Official notice from the tax office: you are owed a refund, fill in the attached form.",
+        "Message from the CEO: I need you to buy gift cards for a client urgently and send me the codes.",
+        "Your delivery could not be completed. Reschedule with the courier using this fake tracking link.",
+        "Invoice attached from your supplier with new bank account details for payment.",
+        "This is the IT helpdesk, we are upgrading mailboxes, reply with your username and password.",
+    ],
+    "Malware": [
+        "Please open the attached invoice.zip and enable macros to view the document.",
+        "Your voicemail is attached as an executable file, download and run it to listen.",
+        "Install this urgent security update to remove viruses detected on your computer.",
+        "Scan the attached document.exe to see your shipment details.",
+        "Your files are encrypted. Run the attached tool to restore access.",
+    ],
+    "Clickbait": [
+        "You will not believe what this celebrity looks like now, click to see the photos.",
+        "Doctors are shocked by this miracle discovery, watch the video before it is deleted.",
+        "Top 10 secrets banks do not want you to know, number 7 will surprise you.",
+        "This simple trick will change your life forever, find out more here.",
+        "Breaking: shocking news about your town, read the full story now.",
+    ],
+    "Spoofing": [
+        "This message appears to come from your own address but was sent from an unknown server.",
+        "Email from your manager's name with an external reply-to address asking for a quick favour.",
+        "Sender domain looks like your company's but with a misspelling, requesting a payment.",
+        "Message claims to be from your bank's domain but fails sender authentication.",
+        "Forged sender address impersonating a colleague asking you to open a shared file.",
+    ],
+    "Blackmail": [
+        "I hacked your device and recorded you through your webcam. Pay in bitcoin or I send the video to your contacts.",
+        "I know your password and have compromising material. Transfer the money within 48 hours.",
+        "Your secrets will be published unless you pay the amount below to my wallet.",
+        "I have access to your accounts and your browsing history. Pay to keep this private.",
+        "Final warning: pay the ransom or the recording goes to your family and colleagues.",
+    ],
+    "Others": [
+        "Unsolicited bulk message with no clear purpose.",
+        "Generic spam email from an unknown sender.",
+        "Automated message sent to many recipients without consent.",
+        "Unwanted promotional email from an unknown list.",
+        "Suspicious message that does not fit any other spam type.",
+    ],
+}
+
+_model_digest: Optional[str] = None
+
+log = get_logger("spam_subcategory")
+
+
+def _dataset_stamp(path: str) -> list:
+    """Path, size and mtime of the training data, so an edited dataset refits."""
+    if not path or not os.path.exists(path):
+        return []
+    stamped = path if os.path.isfile(path) else os.path.join(path, "answer.txt")
+    stat = os.stat(stamped)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def model_cache_path() -> str:
+    key = hashlib.sha256(
+        json.dumps(
+            [SPAM_CHILDREN, SEED_EXAMPLES, CV_FOLDS, _dataset_stamp(TRAINING_DATASET)]
+        ).encode("utf-8")
+    ).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, "spam_subcategory", f"model-{key}.joblib")
+
+
+def load_spam_rows(path: str) -> tuple[list[str], list[str]]:
+    """Texts and children of the Spam emails in a labelled dataset."""
+    texts, children = [], []
+    for text, (parent, child) in load_labelled(path):
+        if parent == "Spam" and child in SPAM_CHILDREN:
+            texts.append(text)
+            children.append(child)
+    return texts, children
+
+
+def _build_model():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+
+    return make_pipeline(
+        TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, strip_accents="unicode"),
+        LogisticRegression(max_iter=1000, C=10.0),
+    )
+
+
+def _save_model(fitted: dict) -> None:
+    import joblib
+
+    global _model_digest
+    path = model_cache_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(fitted, tmp_path)
+    os.replace(tmp_path, path)
+    _model_digest = None
+
+
+def _train(email_texts: list[str], children: list[str]):
+    texts, labels = [], []
+    for child, examples in SEED_EXAMPLES.items():
+        texts.extend(examples)
+        labels.extend([child] * len(examples))
+    for text, child in zip(email_texts, children):
+        if child in SPAM_CHILDREN:
+            texts.append(text)
+            labels.append(child)
+
+    model = _build_model()
+    model.fit(texts, labels)
+    return model
+
+
+def _fold_count(children: list[str], folds: int) -> int:
+    # Every fold needs an email of each child
+    return (
+        min([folds] + [children.count(child) for child in set(children)])
+        if children
+        else 0
+    )
+
+
+def _held_out(email_texts: list[str], children: list[str], folds: int):
+    """
+    (top child, its probability) per email from a model fitted on the seeds
+    plus the other folds, or None when a child has too few emails for `folds`
+    (capped at the smallest child class) to be at least 2.
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    folds = _fold_count(children, folds)
+    if folds < 2:
+        return None
+
+    picks: list = [None] * len(email_texts)
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+    for train, test in splitter.split(email_texts, children):
+        model = _train([email_texts[i] for i in train], [children[i] for i in train])
+        probabilities = model.predict_proba([email_texts[i] for i in test])
+        for i, row in zip(test, probabilities):
+            best = int(row.argmax())
+            picks[i] = (str(model.classes_[best]), float(row[best]))
+    return picks
+
+
+def _with_cutoff(picks: list, cutoff: float) -> list[str]:
+    return [child if p >= cutoff else "Others" for child, p in picks]
+
+
+def choose_cutoff(picks: list, children: list[str]) -> tuple[float, int]:
+    """
+    The fallback cutoff that gets most held-out `picks` right, and how many
+    it gets right. Ties go to the lowest cutoff, which keeps more real labels.
+    """
+    best = (0.0, -1)
+    for cutoff in sorted({0.0, *(p for _, p in picks)}):
+        correct = sum(a == b for a, b in zip(_with_cutoff(picks, cutoff), children))
+        if correct > best[1]:
+            best = (cutoff, correct)
+    return best
+
+
+def cross_validate(
+    email_texts: list[str], children: list[str], folds: int = CV_FOLDS
+) -> dict:
+    """
+    Held-out report on labelled Spam emails: the seed-only model on all of
+    them, then the cross-validated picks with their best cutoff. Nothing is cached.
+    """
+    seed_only = _train([], []).predict(email_texts) if email_texts else []
+    report = {
+        "emails": len(email_texts),
+        "seed_only_correct": int(sum(p == c for p, c in zip(seed_only, children))),
+        "folds": 0,
+    }
+    picks = _held_out(email_texts, children, folds)
+    if picks is None:
+        return report
+
+    cutoff, correct = choose_cutoff(picks, children)
+    return {
+        **report,
+        "folds": _fold_count(children, folds),
+        "top_label_correct": sum(child == c for (child, _), c in zip(picks, children)),
+        "cutoff": cutoff,
+        "cutoff_correct": correct,
+    }
+
+
+def fit_model(email_texts: list[str], children: list[str]) -> dict:
+    """
+    Trains on the seed examples plus the given Spam emails, picks the cutoff
+    from their held-out report and caches both.
+    """
+    report = cross_validate(email_texts, children)
+    fitted = {
+        "model": _train(email_texts, children),
+        "min_probability": report.get("cutoff", FALLBACK_MIN_PROBABILITY),
+        "report": report,
+    }
+    _save_model(fitted)
+    return fitted
+
+
+def _load_model():
+    import joblib
+
+    path = model_cache_path()
+    if os.path.exists(path):
+        return joblib.load(path)
+
+    texts, children = [], []
+    if TRAINING_DATASET and os.path.exists(TRAINING_DATASET):
+        texts, children = load_spam_rows(TRAINING_DATASET)
+    else:
+        log.warning(
+            "  -> [Spam Subcategory] No labelled dataset at %r; seeds only",
+            TRAINING_DATASET,
+        )
+    log.info(
+        "  -> [Spam Subcategory] Training on seeds + %d Spam emails (first run)...",
+        len(texts),
+    )
+    fitted = fit_model(texts, children)
+    log.info(
+        "  -> [Spam Subcategory] Cutoff p>=%.3f (held-out: %s)",
+        fitted["min_probability"],
+        fitted["report"],
+    )
+    return fitted
+
+
+spam_child_model = LazyModel("Spam Subcategory", _load_model)
+
+
+def warmup() -> None:
+    spam_child_model.get()
+
+
+def min_probability() -> float:
+    """The cutoff below which a pick becomes "Others"."""
+    if _MIN_PROBABILITY_ENV is not None:
+        return float(_MIN_PROBABILITY_ENV)
+    return spam_child_model.get()["min_probability"]
+
+
+def cache_tag() -> str:
+    """Identifies the fitted model and cutoff, for result cache keys."""
+    global _model_digest
+    if _model_digest is None:
+        spam_child_model.get()
+        with open(model_cache_path(), "rb") as f:
+            _model_digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f"spam-child:{_model_digest}|p>={min_probability()}"
+
+
+def classify_spam_child_batch(email_texts: list[str]) -> list[dict]:
+    """
+    Picks a Spam child label for each email. Each result has `child` and its
+    `probability`; low-probability picks become "Others".
+    """
+    model = spam_child_model.get()["model"]
+    cutoff = min_probability()
+    probabilities = model.predict_proba(email_texts)
+    classes = [str(label) for label in model.classes_]
+
+    results = []
+    for row in probabilities:
+        best = int(row.argmax())
+        child = classes[best] if row[best] >= cutoff else "Others"
+        results.append({"child": child, "probability": float(row[best])})
+    return results
+
+
+def classify_spam_child(email_text: str) -> dict:
+    result = classify_spam_child_batch([email_text])[0]
+    log.debug(
+        "  -> [Spam Subcategory] %s (p=%.3f)", result["child"], result["probability"]
+    )
+    return result
+
+
+def _print_report(report: dict) -> None:
+    n = report["emails"]
+    print(f"Held-out accuracy on {n} Spam emails:")
+    print(f"  Seed-only model: {report['seed_only_correct']}/{n}")
+    if not report["folds"]:
+        print("  Too few emails per child for cross-validation")
+        return
+    print(
+        f"  {report['folds']}-fold CV (seeds + other folds): "
+        f"{report['top_label_correct']}/{n} by top label, "
+        f"{report['cutoff_correct']}/{n} at the chosen cutoff p>={report['cutoff']:.3f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "dataset",
+        nargs="?",
+        default=TRAINING_DATASET,
+        help="Dataset dir or packed .jsonl",
+    )
+    parser.add_argument(
+        "--cv", type=int, metavar="N", help="Only report N-fold held-out accuracy"
+    )
+    args = parser.parse_args()
+
+    texts, children = load_spam_rows(args.dataset)
+    if args.cv:
+        _print_report(cross_validate(texts, children, args.cv))
+    else:
+        if os.path.abspath(args.dataset) != os.path.abspath(TRAINING_DATASET):
+            print(
+                f"Set INVOX_SPAM_CHILD_DATASET={args.dataset} for the service to use it"
+            )
+            # The cache key names the training data
+            TRAINING_DATASET = args.dataset
+        fitted = fit_model(texts, children)
+        _print_report(fitted["report"])
+        print(f"Fitted on seeds + {len(texts)} Spam emails -> {model_cache_path()}")
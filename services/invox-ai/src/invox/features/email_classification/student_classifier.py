@@ -0,0 +1,322 @@
+"""
+Student classifier distilled from the Gemma router.
+
+A logistic-loss linear model over hashed word n-grams of the pre-processed
+email, trained on "Parent - Child" labels that the Gemma router itself
+assigned to a corpus. It answers in about a millisecond on CPU; service.py
+asks it first and only sends emails it is unsure about (top probability below
+INVOX_STUDENT_MIN_PROB) on to Gemma.
+
+Distillation runs in two steps, so the slow labelling is done once:
+
+    python student_classifier.py label <dataset> teacher.jsonl [--mode flat]
+    python student_classifier.py fit teacher.jsonl
+
+<dataset> is a labelled dataset directory or a packed .jsonl from
+generate_dataset.py --packed. `label` runs the spam gate and the Gemma router
+over it and writes {"text", "parent", "child"} lines for the ham emails;
+`fit` trains the student on them, reports its agreement with Gemma on a
+held-out split, and caches it under INVOX_CACHE_DIR. `fit --ground-truth
+<dataset>` trains on the dataset's own labels instead.
+"""
+
+import os
+import sys
+import json
+import random
+import hashlib
+import argparse
+from typing import Optional
+import numpy as np
+
+from invox.features.email_classification import preprocess
+from invox.features.email_classification.categories import (
+    FLAT_LABEL_PAIRS,
+    ROUTABLE_PARENTS,
+)
+from invox.features.email_classification.lazy_model import LazyModel
+from invox.features.email_classification.log import get_logger
+from invox.features.email_classification.packed_dataset import load_labelled
+from invox.features.email_classification.settings import CACHE_DIR
+
+# Ask the student before Gemma (needs a fitted model, see the module docstring)
+STUDENT_ENABLED = os.getenv("INVOX_STUDENT", "0") == "1"
+# The student answers on its own at or above this top-label probability
+MIN_PROBABILITY = float(os.getenv("INVOX_STUDENT_MIN_PROB", "0.8"))
+MODEL_PATH = os.getenv(
+    "INVOX_STUDENT_MODEL", os.path.join(CACHE_DIR, "student", "model.joblib")
+)
+HASH_FEATURES = 2**18
+
+_model_digest: Optional[str] = None
+
+log = get_logger("student_classifier")
+
+
+def _student_text(email_text: str) -> str:
+    # The same subject/sender/body view Gemma gets, minus the tokenizer budget
+    return preprocess.summarize(email_text)
+
+
+def _build_model():
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.pipeline import make_pipeline
+
+    return make_pipeline(
+        HashingVectorizer(
+            n_features=HASH_FEATURES,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            strip_accents="unicode",
+            norm=None,
+        ),
+        TfidfTransformer(sublinear_tf=True),
+        # Log loss for probabilities; plain LBFGS would need a dense
+        # (labels x HASH_FEATURES) Hessian approximation
+        SGDClassifier(
+            loss="log_loss", alpha=1e-5, max_iter=20, tol=None, random_state=0
+        ),
+    )
+
+
+def _save_model(model) -> None:
+    import joblib
+
+    global _model_digest
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    tmp_path = f"{MODEL_PATH}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, MODEL_PATH)
+    _model_digest = None
+
+
+def fit_model(email_texts: list[str], labels: list[tuple[str, str]]):
+    """Trains the student on (parent, child) labels of routable parents and caches it."""
+    texts, targets = [], []
+    for text, (parent, child) in zip(email_texts, labels):
+        if parent in ROUTABLE_PARENTS:
+            texts.append(_student_text(text))
+            targets.append(f"{parent} - {child}")
+
+    model = _build_model()
+    model.fit(texts, targets)
+    # Most hashed n-gram weights are zero; sparse ones keep the file small
+    model[-1].sparsify()
+    _save_model(model)
+    return model
+
+
+def _load_model():
+    import joblib
+
+    if not os.path.exists(MODEL_PATH):
+        log.warning(
+            "  -> [Student] No model at %s; every email goes to Gemma. "
+            "Fit one with student_classifier.py.",
+            MODEL_PATH,
+        )
+        return None
+    model = joblib.load(MODEL_PATH)
+    classifier = model[-1]
+    # sklearn's predict_proba() converts the sparse coefficients to CSC on every
+    # call (~20 ms); a (features x labels) CSR copy made once keeps it sub-ms
+    return {
+        "features": model[:-1],
+        "weights": classifier.coef_.T.tocsr(),
+        "intercept": classifier.intercept_,
+        "classes": [str(label) for label in classifier.classes_],
+    }
+
+
+student_model = LazyModel("Student Router", _load_model)
+
+
+def warmup() -> None:
+    student_model.get()
+
+
+def cache_tag() -> str:
+    """Identifies the fitted model and threshold, for result cache keys."""
+    global _model_digest
+    if _model_digest is None:
+        if student_model.get() is None:
+            _model_digest = "none"
+        else:
+            with open(MODEL_PATH, "rb") as f:
+                _model_digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f"student:{_model_digest}|p>={MIN_PROBABILITY}"
+
+
+def classify_by_student_batch(email_texts: list[str]) -> list[dict]:
+    """
+    Student predictions for many emails. Each result has `parent`, `child`,
+    `probability` and `confident` (probability >= MIN_PROBABILITY); all are
+    unconfident when no model has been fitted.
+    """
+    model = student_model.get()
+    if model is None:
+        return [
+            {"parent": None, "child": None, "probability": 0.0, "confident": False}
+            for _ in email_texts
+        ]
+
+    features = model["features"].transform([_student_text(t) for t in email_texts])
+    scores = (features @ model["weights"]).toarray() + model["intercept"]
+    # One-vs-rest probabilities, normalised per email like SGDClassifier's own
+    probabilities = 1.0 / (1.0 + np.exp(-scores))
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    classes = model["classes"]
+
+    results = []
+    for row in probabilities:
+        best = int(row.argmax())
+        parent, child = FLAT_LABEL_PAIRS[classes[best]]
+        results.append(
+            {
+                "parent": parent,
+                "child": child,
+                "probability": float(row[best]),
+                "confident": bool(row[best] >= MIN_PROBABILITY),
+            }
+        )
+    return results
+
+
+def classify_by_student(email_text: str) -> dict:
+    result = classify_by_student_batch([email_text])[0]
+    log.debug(
+        "  -> [Student] [%s - %s] (p=%.3f, confident=%s)",
+        result["parent"],
+        result["child"],
+        result["probability"],
+        result["confident"],
+    )
+    return result
+
+
+def label_with_teacher(email_texts: list[str], output_path: str, mode: str) -> int:
+    """
+    Labels the ham emails among `email_texts` with the Gemma router and
+    writes them to `output_path` as JSON lines. Returns how many were written.
+    """
+    from invox.features.email_classification import category_detection, spam_detection
+
+    classify_batch = (
+        category_detection.classify_flat_batch
+        if mode == "flat"
+        else category_detection.classify_hierarchical_batch
+    )
+    spam_flags = spam_detection.check_is_spam_batch(email_texts)
+    ham = [text for text, is_spam in zip(email_texts, spam_flags) if not is_spam]
+    log.info("[Student] Labelling %d ham emails with Gemma (%s)...", len(ham), mode)
+
+    written = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        step = category_detection.BATCH_SIZE
+        for start in range(0, len(ham), step):
+            chunk = ham[start : start + step]
+            for text, (parent, child) in zip(chunk, classify_batch(chunk)):
+                record = {"text": text, "parent": parent, "child": child}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+            f.flush()
+            log.info("[Student] %d/%d labelled", written, len(ham))
+    return written
+
+
+def evaluate_split(
+    email_texts: list[str],
+    labels: list[tuple[str, str]],
+    holdout: float = 0.2,
+    seed: int = 0,
+) -> dict:
+    """
+    Fits on a seeded split and reports agreement with `labels` on the rest:
+    overall, and coverage/agreement of the emails above MIN_PROBABILITY.
+    Leaves the cached model untouched.
+    """
+    order = list(range(len(email_texts)))
+    random.Random(seed).shuffle(order)
+    cut = int(len(order) * (1 - holdout))
+    train, test = order[:cut], order[cut:]
+
+    model = _build_model()
+    model.fit(
+        [_student_text(email_texts[i]) for i in train],
+        [f"{labels[i][0]} - {labels[i][1]}" for i in train],
+    )
+    probabilities = model.predict_proba([_student_text(email_texts[i]) for i in test])
+    classes = [str(label) for label in model.classes_]
+
+    agree = confident = confident_agree = 0
+    for i, row in zip(test, probabilities):
+        best = int(row.argmax())
+        hit = FLAT_LABEL_PAIRS[classes[best]] == tuple(labels[i])
+        agree += hit
+        if row[best] >= MIN_PROBABILITY:
+            confident += 1
+            confident_agree += hit
+    return {
+        "train": len(train),
+        "test": len(test),
+        "agreement": agree / max(len(test), 1),
+        "coverage": confident / max(len(test), 1),
+        "confident_agreement": confident_agree / max(confident, 1),
+    }
+
+
+def _read_teacher_labels(path: str) -> tuple[list[str], list[tuple[str, str]]]:
+    texts, labels = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record["text"])
+                labels.append((record["parent"], record["child"]))
+    return texts, labels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distil the Gemma router into the student")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    label = commands.add_parser("label", help="Label a dataset with the Gemma router")
+    label.add_argument("dataset", help="Dataset directory or packed .jsonl")
+    label.add_argument("output", help="Teacher labels, one JSON line per ham email")
+    label.add_argument("--mode", choices=["hierarchical", "flat"], default="hierarchical")
+    label.add_argument("--limit", type=int, default=0)
+
+    fit = commands.add_parser("fit", help="Fit the student on teacher labels")
+    fit.add_argument("labels", nargs="?", help="Output of the label command")
+    fit.add_argument("--ground-truth", help="Fit on this dataset's own labels instead")
+    fit.add_argument("--holdout", type=float, default=0.2)
+    fit.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "label":
+        emails = load_labelled(args.dataset)
+        if args.limit:
+            emails = emails[: args.limit]
+        written = label_with_teacher([text for text, _ in emails], args.output, args.mode)
+        print(f"Wrote {written} teacher labels -> {args.output}")
+        sys.exit(0)
+
+    if args.ground_truth:
+        emails = load_labelled(args.ground_truth)
+        emails = [(t, label) for t, label in emails if label[0] in ROUTABLE_PARENTS]
+        texts, labels = [t for t, _ in emails], [label for _, label in emails]
+    elif args.labels:
+        texts, labels = _read_teacher_labels(args.labels)
+    else:
+        parser.error("fit needs a labels file or --ground-truth")
+
+    if args.holdout > 0:
+        report = evaluate_split(texts, labels, args.holdout, args.seed)
+        print(
+            f"Held-out {report['test']} emails: agreement {report['agreement']:.1%}, "
+            f"{report['coverage']:.1%} above p>={MIN_PROBABILITY} "
+            f"with agreement {report['confident_agreement']:.1%}"
+        )
+    fit_model(texts, labels)
+    print(f"Fitted on {len(texts)} emails -> {MODEL_PATH}")
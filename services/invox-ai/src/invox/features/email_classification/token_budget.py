@@ -0,0 +1,135 @@
+"""
+Token-accurate prompt budgeting.
+
+Email text is fitted to a budget measured in model tokens, not characters, so
+a prompt neither wastes context nor overflows it. Three strategies decide
+which sentences survive when an email is too long:
+
+    head       the opening sentences
+    head_tail  HEAD_FRACTION of the budget from the start, the rest from the end
+    salient    the sentences with the most keyword hits (subject words, label
+               names), kept in their original order
+"""
+
+import os
+import re
+import math
+
+STRATEGY = os.getenv("INVOX_TRUNCATION", "head_tail")
+STRATEGIES = ("head", "head_tail", "salient")
+HEAD_FRACTION = 0.75
+# Rough characters per token for English text with the Gemma tokenizer
+CHARS_PER_TOKEN = 4
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_RE = re.compile(r"[a-z]{4,}")
+
+
+class CharTokenizer:
+    """Estimates tokens from the character count when no model is loaded."""
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+    def cut(self, text: str, max_tokens: int) -> str:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+
+
+class LlamaTokenizer:
+    """Exact token counts from a loaded llama_cpp.Llama."""
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def _tokenize(self, text: str) -> list[int]:
+        return self.llm.tokenize(text.encode("utf-8"), add_bos=False, special=False)
+
+    def count(self, text: str) -> int:
+        return len(self._tokenize(text))
+
+    def cut(self, text: str, max_tokens: int) -> str:
+        tokens = self._tokenize(text)[:max_tokens]
+        return self.llm.detokenize(tokens).decode("utf-8", errors="ignore")
+
+
+def split_sentences(text: str) -> list[str]:
+    return [s for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def keywords_of(*texts: str) -> set[str]:
+    return {word for text in texts for word in _WORD_RE.findall(text.lower())}
+
+
+def _take(order, counts: list[int], budget: int, contiguous: bool) -> list[int]:
+    """
+    Keeps sentence indices from `order` while they fit the budget. A
+    `contiguous` run stops at the first sentence that does not fit; otherwise
+    that sentence is skipped and later ones may still fit.
+    """
+    kept, used = [], 0
+    for i in order:
+        if used + counts[i] <= budget:
+            kept.append(i)
+            used += counts[i]
+        elif contiguous:
+            break
+    return kept
+
+
+def _select(sentences, counts, max_tokens, strategy, keywords) -> list[int]:
+    order = range(len(sentences))
+    if strategy == "head":
+        return _take(order, counts, max_tokens, contiguous=True)
+
+    if strategy == "head_tail":
+        head = _take(order, counts, int(max_tokens * HEAD_FRACTION), contiguous=True)
+        used = sum(counts[i] for i in head)
+        rest = [i for i in reversed(order) if not head or i > head[-1]]
+        return sorted(head + _take(rest, counts, max_tokens - used, contiguous=True))
+
+    if strategy == "salient":
+        def salience(i: int) -> float:
+            hits = len(keywords_of(sentences[i]) & keywords)
+            # Openings usually state the purpose of an email
+            return hits / math.sqrt(counts[i]) + (0.5 if i == 0 else 0.0)
+
+        ranked = sorted(order, key=lambda i: (-salience(i), i))
+        return sorted(_take(ranked, counts, max_tokens, contiguous=False))
+
+    raise ValueError(f"Unknown truncation strategy '{strategy}', expected {STRATEGIES}")
+
+
+def fit_text(
+    text: str,
+    max_tokens: int,
+    tokenizer=None,
+    strategy: str = STRATEGY,
+    keywords: set[str] = frozenset(),
+) -> str:
+    """Returns `text`, or a selection of its sentences, in at most `max_tokens` tokens."""
+    tokenizer = tokenizer or CharTokenizer()
+    if max_tokens <= 0:
+        return ""
+    if tokenizer.count(text) <= max_tokens:
+        return text
+
+    sentences = split_sentences(text)
+    # +1 per sentence for the separator it is joined with
+    counts = [tokenizer.count(s) + 1 for s in sentences]
+    kept = _select(sentences, counts, max_tokens, strategy, keywords)
+
+    parts = []
+    for k, i in enumerate(kept):
+        if k and i != kept[k - 1] + 1:
+            parts.append("[...]")
+        parts.append(sentences[i])
+    fitted = " ".join(parts)
+
+    if not kept or tokenizer.count(fitted) > max_tokens:
+        # One sentence longer than the whole budget, or merges across joins
+        limit = max_tokens
+        fitted = tokenizer.cut(fitted or text, limit)
+        while fitted and tokenizer.count(fitted) > max_tokens:
+            limit -= 1
+            fitted = tokenizer.cut(fitted, limit)
+    return fitted
@@ -0,0 +1,182 @@
+"""
+Multi-process worker pool for the classification pipeline.
+
+One llama.cpp process tops out well before a 32/64-core box does, so this
+runs N worker processes, each with its own Llama context and
+`threads_per_worker` llama.cpp threads. The GGUF file is memory-mapped
+(use_mmap=True in category_detection), so all workers share one page-cache
+copy of the weights; each worker only adds its own KV cache and scratch
+buffers.
+
+The dispatcher splits the input into chunks, hands them to whichever worker
+is free and yields results in input order.
+"""
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from invox.features.email_classification.log import get_logger
+
+WORKERS = int(os.getenv("INVOX_WORKERS", "1"))
+THREADS_PER_WORKER = int(os.getenv("INVOX_LLM_THREADS", "4"))
+# Pin each worker to its own block of cores so workers do not fight over them
+PIN_CORES = os.getenv("INVOX_PIN_CORES", "0") == "1"
+
+_service = None
+# Shared count of workers that have loaded their models, and its condition
+_ready = None
+_ready_changed = None
+
+log = get_logger("worker_pool")
+
+
+def _pin_to_cores(worker_index: int, threads: int) -> None:
+    if not hasattr(os, "sched_setaffinity"):
+        return
+    available = sorted(os.sched_getaffinity(0))
+    start = (worker_index * threads) % len(available)
+    cores = {available[(start + i) % len(available)] for i in range(threads)}
+    os.sched_setaffinity(0, cores)
+
+
+def _init_worker(
+    threads: int, env: dict, batch: bool, counter, ready, ready_changed, pin_cores: bool
+) -> None:
+    global _service
+    # Settings are read at import time, so they must be in place before the import
+    os.environ.update(env)
+    os.environ["INVOX_LLM_THREADS"] = str(threads)
+
+    with counter.get_lock():
+        worker_index = counter.value
+        counter.value += 1
+    if pin_cores:
+        _pin_to_cores(worker_index, threads)
+
+    from invox.features.email_classification import service
+
+    service.warmup(batch=batch)
+    _service = service
+    _mark_ready(ready, ready_changed)
+    log.info("[POOL] Worker %d (pid %d) ready.", worker_index, os.getpid())
+
+
+def _classify_chunk(email_texts: list[str]) -> tuple[list[tuple[str, str]], float]:
+    start_time = time.time()
+    if len(email_texts) == 1:
+        results = [_service.process_email_classification(email_texts[0])]
+    else:
+        results = _service.process_email_classification_batch(email_texts)
+    return results, time.time() - start_time
+
+
+def _route_chunk(email_texts: list[str], mode: str) -> list[tuple[str, str]]:
+    return _service.route_batch(email_texts, mode)
+
+
+def _mark_ready(ready, ready_changed) -> None:
+    """Counts this worker as loaded and wakes workers waiting in _wait_for_pool()."""
+    global _ready, _ready_changed
+    _ready, _ready_changed = ready, ready_changed
+    with ready_changed:
+        ready.value += 1
+        ready_changed.notify_all()
+
+
+def _wait_for_pool(workers: int) -> int:
+    # Blocking here keeps this worker busy, so the executor starts another
+    # process for each remaining warmup task instead of reusing this one
+    with _ready_changed:
+        _ready_changed.wait_for(lambda: _ready.value >= workers)
+    return os.getpid()
+
+
+class WorkerPool:
+    """
+    `workers` processes x `threads_per_worker` llama.cpp threads. `chunk_size`
+    emails are sent to a worker at a time (>1 uses the batched pipeline).
+    `env` holds INVOX_* overrides applied in every worker before import.
+    """
+
+    def __init__(
+        self,
+        workers: int = WORKERS,
+        threads_per_worker: int = THREADS_PER_WORKER,
+        chunk_size: int = 1,
+        env: Optional[dict] = None,
+        pin_cores: bool = PIN_CORES,
+    ):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.chunk_size = max(1, chunk_size)
+        # spawn, not fork: llama.cpp and torch thread pools do not survive fork()
+        context = multiprocessing.get_context("spawn")
+        # Workers that have loaded their models, see warmup()
+        self._ready = context.Value("i", 0)
+        self._ready_changed = context.Condition(self._ready.get_lock())
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(
+                threads_per_worker,
+                dict(env or {}),
+                self.chunk_size > 1,
+                context.Value("i", 0),
+                self._ready,
+                self._ready_changed,
+                pin_cores,
+            ),
+        )
+
+    def warmup(self) -> None:
+        """
+        Starts every worker and waits until all of them have loaded their
+        models. Each warmup task blocks in its worker until the shared ready
+        count reaches `workers`, so no worker can take two of them.
+        """
+        futures = [
+            self._executor.submit(_wait_for_pool, self.workers)
+            for _ in range(self.workers)
+        ]
+        for future in futures:
+            # A worker whose initializer fails breaks the pool; result() raises it
+            future.result()
+        log.info("[POOL] %d workers ready.", self._ready.value)
+
+    def imap(self, email_texts: list[str]) -> Iterator[tuple[tuple[str, str], float]]:
+        """
+        Yields (result, seconds per email) in input order. The time is the
+        worker's wall time for the chunk divided by its size.
+        """
+        chunks = [
+            email_texts[i : i + self.chunk_size]
+            for i in range(0, len(email_texts), self.chunk_size)
+        ]
+        futures = [self._executor.submit(_classify_chunk, chunk) for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            results, elapsed = future.result()
+            for result in results:
+                yield result, elapsed / len(chunk)
+
+    def submit_route(self, email_texts: list[str], mode: str) -> Future:
+        """
+        Runs only the Gemma router over `email_texts` in a free worker (the
+        streaming pipeline's router stage); the future holds their results.
+        """
+        return self._executor.submit(_route_chunk, email_texts, mode)
+
+    def map(self, email_texts: list[str]) -> list[tuple[str, str]]:
+        return [result for result, _ in self.imap(email_texts)]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,498 @@
+"""
+Accuracy and latency benchmark for the email classification pipeline.
+
+Runs the pipeline in-process (or across a WorkerPool with --workers) over the
+labelled dataset and reports latency percentiles, throughput, peak RSS,
+accuracy and per-parent confusion matrices. Email selection and order come
+from --seed, a few warmup emails are classified before timing starts, and
+the result cache and near-duplicate reuse are off so every email reaches the
+models. Results can be written as JSON (--output) and compared with an
+earlier run (--compare).
+
+--stage spam measures only the spam cascade: labels become ("Spam", "") or
+("Ham", ""), so accuracy is spam-gate accuracy and the parent confusion
+matrix is its 2x2 confusion matrix. --stage spam-child runs only the Spam
+subcategory model on the dataset's Spam emails.
+
+The run exits with status 1 when child accuracy (right child among emails
+with the right parent) is below --min-child-accuracy, or below that of the
+--compare run.
+
+--stub replaces the models with a deterministic stand-in that answers
+correctly with probability --stub-accuracy after --stub-latency-ms, so the
+harness itself runs offline without weights.
+
+Usage:
+    python benchmark.py [dataset_dir|packed.jsonl] [--limit N] [--seed S] [--mode both]
+                        [--batch-size B] [--workers W] [--output run.json]
+                        [--compare previous.json] [--stage spam|spam-child] [--stub]
+                        [--min-child-accuracy A]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import resource
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "..", "src"))
+sys.path.insert(0, SCRIPT_DIR)
+
+from near_duplicate_benchmark import load_dataset, packed_email  # noqa: E402
+from invox.features.email_classification.packed_dataset import PackedDataset  # noqa: E402
+
+MODES = ("hierarchical", "flat")
+
+
+class StubPipeline:
+    """
+    Offline stand-in for service.py. Each email gets the right label with
+    probability `accuracy` (decided by a hash of the text and `seed`, so runs
+    repeat exactly) and a wrong one otherwise, after `latency_ms` per email.
+    """
+
+    def __init__(self, labels: dict, accuracy: float, latency_ms: float, seed: int):
+        self.labels = labels
+        self.accuracy = accuracy
+        self.latency = latency_ms / 1000
+        self.seed = seed
+        self.choices = sorted(set(labels.values()))
+
+    def _predict(self, email_text: str, mode: str) -> tuple[str, str]:
+        digest = hashlib.sha256(f"{self.seed}|{mode}|{email_text}".encode("utf-8"))
+        rng = random.Random(digest.digest())
+        actual = self.labels.get(email_text, self.choices[0])
+        if rng.random() < self.accuracy:
+            return actual
+        return rng.choice(
+            [label for label in self.choices if label != actual] or [actual]
+        )
+
+    def process_email_classification(self, email_text: str, mode=None) -> tuple[str, str]:
+        time.sleep(self.latency)
+        return self._predict(email_text, mode)
+
+    def process_email_classification_batch(self, email_texts: list[str], mode=None):
+        time.sleep(self.latency * len(email_texts))
+        return [self._predict(text, mode) for text in email_texts]
+
+    def warmup(self, batch: bool = False) -> None:
+        pass
+
+
+class SpamGatePipeline:
+    """Only the spam cascade, with ("Spam", "") / ("Ham", "") as labels."""
+
+    def __init__(self):
+        from invox.features.email_classification import spam_detection
+
+        self.spam_detection = spam_detection
+
+    def process_email_classification(self, email_text: str, mode=None) -> tuple[str, str]:
+        return self.process_email_classification_batch([email_text])[0]
+
+    def process_email_classification_batch(self, email_texts: list[str], mode=None):
+        verdicts = self.spam_detection.score_spam_batch(email_texts)
+        return [("Spam", "") if v["is_spam"] else ("Ham", "") for v in verdicts]
+
+    def warmup(self, batch: bool = False) -> None:
+        self.spam_detection.warmup()
+
+
+class SpamChildPipeline:
+    """Only the Spam subcategory model, for emails known to be spam."""
+
+    def __init__(self):
+        from invox.features.email_classification import spam_subcategory
+
+        self.spam_subcategory = spam_subcategory
+
+    def process_email_classification(self, email_text: str, mode=None) -> tuple[str, str]:
+        return self.process_email_classification_batch([email_text])[0]
+
+    def process_email_classification_batch(self, email_texts: list[str], mode=None):
+        results = self.spam_subcategory.classify_spam_child_batch(email_texts)
+        return [("Spam", result["child"]) for result in results]
+
+    def warmup(self, batch: bool = False) -> None:
+        self.spam_subcategory.warmup()
+
+
+def spam_labels(emails: list) -> list:
+    return [
+        (filename, text, ("Spam", "") if label[0] == "Spam" else ("Ham", ""))
+        for filename, text, label in emails
+    ]
+
+
+def select_emails(emails: list, limit: int, seed: int) -> list:
+    """A seeded sample of `limit` emails (all when 0), in a seeded order."""
+    rng = random.Random(seed)
+    emails = list(emails)
+    rng.shuffle(emails)
+    return emails[:limit] if limit else emails
+
+
+def load_emails(path: str, limit: int, seed: int) -> list:
+    """select_emails() over a dataset dir, or a packed file read only at the sampled rows."""
+    if not os.path.isfile(path):
+        return select_emails(load_dataset(path), limit, seed)
+    with PackedDataset(path) as dataset:
+        rng = random.Random(seed)
+        count = min(limit, len(dataset)) if limit else len(dataset)
+        return [packed_email(dataset[i]) for i in rng.sample(range(len(dataset)), count)]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Linear-interpolated percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process plus that of its largest finished child (pool worker)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak += resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _increment(matrix: dict, row: str, column: str) -> None:
+    matrix.setdefault(row, {})
+    matrix[row][column] = matrix[row].get(column, 0) + 1
+
+
+def score(predictions: list[dict]) -> dict:
+    """
+    Accuracy plus confusion matrices: parent (actual -> predicted parent) and,
+    per actual parent, child (actual -> predicted child; "<wrong parent>" when
+    the parent was already missed).
+    """
+    total = max(len(predictions), 1)
+    full = sum(p["predicted"] == p["actual"] for p in predictions)
+    parent_ok = sum(p["predicted"][0] == p["actual"][0] for p in predictions)
+
+    parent_matrix, child_matrices = {}, {}
+    for p in predictions:
+        (actual_parent, actual_child), (predicted_parent, predicted_child) = (
+            p["actual"],
+            p["predicted"],
+        )
+        _increment(parent_matrix, actual_parent, predicted_parent)
+        column = (
+            predicted_child if predicted_parent == actual_parent else "<wrong parent>"
+        )
+        _increment(child_matrices.setdefault(actual_parent, {}), actual_child, column)
+
+    per_parent = {
+        parent: row.get(parent, 0) / sum(row.values())
+        for parent, row in parent_matrix.items()
+    }
+    return {
+        "accuracy": full / total,
+        "parent_accuracy": parent_ok / total,
+        "child_accuracy": full / max(parent_ok, 1),
+        "full_pass": full,
+        "partial_pass": parent_ok - full,
+        "full_fail": len(predictions) - parent_ok,
+        "per_parent_recall": dict(sorted(per_parent.items())),
+        "parent_confusion": parent_matrix,
+        "child_confusion": child_matrices,
+    }
+
+
+def _classify(pipeline, pool, texts: list[str], mode: str) -> list[tuple]:
+    """(label, seconds per email) for each text, in order."""
+    if pool is not None:
+        return list(pool.imap(texts))
+    start_time = time.perf_counter()
+    if len(texts) == 1:
+        labels = [pipeline.process_email_classification(texts[0], mode)]
+    else:
+        labels = pipeline.process_email_classification_batch(texts, mode)
+    per_email = (time.perf_counter() - start_time) / len(texts)
+    return [(tuple(label), per_email) for label in labels]
+
+
+def run_mode(
+    pipeline, pool, emails: list, mode: str, batch_size: int, warmup: int
+) -> dict:
+    for start in range(0, min(warmup, len(emails)), batch_size):
+        warm = emails[start : start + batch_size]
+        _classify(pipeline, pool, [text for _, text, _ in warm], mode)
+
+    predictions = []
+    # A pool keeps its own batching (chunk_size); hand it everything at once
+    step = len(emails) if pool is not None else batch_size
+    start_time = time.perf_counter()
+    for start in range(0, len(emails), step):
+        chunk = emails[start : start + step]
+        results = _classify(pipeline, pool, [text for _, text, _ in chunk], mode)
+        for (filename, _, actual), (predicted, seconds) in zip(chunk, results):
+            predictions.append(
+                {
+                    "file": filename,
+                    "actual": list(actual),
+                    "predicted": list(predicted),
+                    "latency_ms": round(seconds * 1000, 3),
+                }
+            )
+    elapsed = time.perf_counter() - start_time
+
+    latencies = [p["latency_ms"] for p in predictions]
+    return {
+        **score(predictions),
+        "emails": len(predictions),
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_per_sec": round(len(predictions) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / max(len(latencies), 1), 3),
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "predictions": predictions,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SCRIPT_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(mode: str, run: dict) -> None:
+    latency = run["latency_ms"]
+    print(f"\n============= {mode} =============")
+    print(f"Emails       : {run['emails']}")
+    print(
+        f"Accuracy     : {run['accuracy']:.1%} (parent: {run['parent_accuracy']:.1%}, "
+        f"child: {child_accuracy(run):.1%}; "
+        f"full {run['full_pass']}, partial {run['partial_pass']}, fail {run['full_fail']})"
+    )
+    print(
+        f"Latency (ms) : p50 {latency['p50']:.1f}  p95 {latency['p95']:.1f}  "
+        f"p99 {latency['p99']:.1f}  mean {latency['mean']:.1f}"
+    )
+    print(f"Throughput   : {run['throughput_per_sec']:.2f} emails/s")
+    print(f"Peak RSS     : {run['peak_rss_mb']:.0f} MB (load {run['load_sec']:.1f}s)")
+
+    parents = sorted(run["parent_confusion"])
+    columns = sorted(
+        {c for row in run["parent_confusion"].values() for c in row} | set(parents)
+    )
+    width = max(len(name) for name in columns) + 1
+    print("\nParent confusion (rows: actual, columns: predicted)")
+    print(" " * width + "".join(f"{c[:7]:>8}" for c in columns))
+    for parent in parents:
+        row = run["parent_confusion"][parent]
+        print(f"{parent:<{width}}" + "".join(f"{row.get(c, 0):>8}" for c in columns))
+
+
+def child_accuracy(run: dict) -> float:
+    # Runs saved before child_accuracy was recorded
+    if "child_accuracy" in run:
+        return run["child_accuracy"]
+    return run["full_pass"] / max(run["full_pass"] + run["partial_pass"], 1)
+
+
+def child_regressions(runs: dict, minimum: float, previous: dict) -> list[str]:
+    """Why the run fails on child accuracy, one line per mode; empty if it passes."""
+    failures = []
+    for mode, run in runs.items():
+        accuracy = child_accuracy(run)
+        before = previous.get("runs", {}).get(mode)
+        if accuracy < minimum:
+            failures.append(f"{mode}: child accuracy {accuracy:.1%} < {minimum:.1%}")
+        if before is not None and accuracy < child_accuracy(before):
+            failures.append(
+                f"{mode}: child accuracy dropped "
+                f"{child_accuracy(before):.1%} -> {accuracy:.1%}"
+            )
+    return failures
+
+
+def print_comparison(previous: dict, current: dict) -> None:
+    """Accuracy/latency deltas and emails whose label changed, per mode."""
+    for mode, run in current["runs"].items():
+        before = previous.get("runs", {}).get(mode)
+        if before is None:
+            continue
+        print(
+            f"\n============= {mode}: vs {previous['config'].get('git_commit')} ============="
+        )
+        print(f"Accuracy     : {before['accuracy']:.1%} -> {run['accuracy']:.1%}")
+        print(
+            f"Child acc.   : {child_accuracy(before):.1%} -> {child_accuracy(run):.1%}"
+        )
+        for q in ("p50", "p95", "p99"):
+            print(
+                f"Latency {q:<4} : {before['latency_ms'][q]:.1f} -> "
+                f"{run['latency_ms'][q]:.1f} ms"
+            )
+        old = {p["file"]: p["predicted"] for p in before["predictions"]}
+        for p in run["predictions"]:
+            if p["file"] in old and old[p["file"]] != p["predicted"]:
+                mark = "fixed" if p["predicted"] == p["actual"] else "changed"
+                print(f"  {p['file']}: {old[p['file']]} -> {p['predicted']} ({mark})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "dataset_dir",
+        nargs="?",
+        default=os.path.join(SCRIPT_DIR, "email_dataset"),
+        help="Dataset directory, or a packed .jsonl from generate_dataset.py --packed",
+    )
+    parser.add_argument("--limit", type=int, default=0, help="Seeded sample of N emails")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed emails per mode")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Spread emails over a WorkerPool"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=int(os.getenv("INVOX_LLM_THREADS", "4")),
+        help="llama.cpp threads per worker",
+    )
+    parser.add_argument(
+        "--stage",
+        choices=["pipeline", "spam", "spam-child"],
+        default="pipeline",
+        help="spam: measure only the spam cascade; spam-child: only the Spam child model",
+    )
+    parser.add_argument(
+        "--min-child-accuracy",
+        type=float,
+        default=0.0,
+        help="Exit with status 1 below this child accuracy (0-1)",
+    )
+    parser.add_argument("--output", help="Write the full results to this JSON file")
+    parser.add_argument("--compare", help="Earlier --output file to diff against")
+    parser.add_argument(
+        "--stub", action="store_true", help="Use a stub instead of the models"
+    )
+    parser.add_argument("--stub-accuracy", type=float, default=0.8)
+    parser.add_argument("--stub-latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    emails = load_emails(args.dataset_dir, args.limit, args.seed)
+    modes = MODES if args.mode == "both" else (args.mode,)
+    if args.stage == "spam":
+        emails = spam_labels(emails)
+        modes = ("spam",)
+    elif args.stage == "spam-child":
+        emails = [email for email in emails if email[2][0] == "Spam"]
+        modes = ("spam-child",)
+
+    # Every email has to reach the models to be measured
+    os.environ["INVOX_RESULT_CACHE"] = "0"
+    os.environ["INVOX_NEAR_DUPLICATE"] = "0"
+
+    runs = {}
+    for mode in modes:
+        pipeline = pool = None
+        load_start = time.perf_counter()
+        if args.stub:
+            labels = {text: label for _, text, label in emails}
+            pipeline = StubPipeline(
+                labels, args.stub_accuracy, args.stub_latency_ms, args.seed
+            )
+        elif args.stage == "spam":
+            pipeline = SpamGatePipeline()
+        elif args.stage == "spam-child":
+            pipeline = SpamChildPipeline()
+        elif args.workers > 1:
+            from invox.features.email_classification.worker_pool import WorkerPool
+
+            pool = WorkerPool(
+                args.workers,
+                args.threads,
+                chunk_size=args.batch_size,
+                env={"INVOX_CLASSIFIER_MODE": mode},
+            )
+            pool.warmup()
+        else:
+            os.environ["INVOX_LLM_THREADS"] = str(args.threads)
+            from invox.features.email_classification import service
+
+            pipeline = service
+
+        if pipeline is not None:
+            pipeline.warmup(batch=args.batch_size > 1)
+        load_sec = time.perf_counter() - load_start
+        try:
+            runs[mode] = run_mode(
+                pipeline, pool, emails, mode, args.batch_size, args.warmup
+            )
+        finally:
+            if pool is not None:
+                pool.close()
+        # After close(), so finished pool workers are included
+        runs[mode]["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        runs[mode]["load_sec"] = round(load_sec, 3)
+        print_report(mode, runs[mode])
+
+    results = {
+        "config": {
+            "dataset_dir": os.path.abspath(args.dataset_dir),
+            "emails": len(emails),
+            "seed": args.seed,
+            "batch_size": args.batch_size,
+            "warmup": args.warmup,
+            "workers": args.workers,
+            "threads": args.threads,
+            "stage": args.stage,
+            "stub": args.stub,
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "env": {
+                k: v for k, v in sorted(os.environ.items()) if k.startswith("INVOX_")
+            },
+        },
+        "runs": runs,
+    }
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        print_comparison(previous, results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    failures = child_regressions(runs, args.min_child_accuracy, previous)
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,30 @@
+"""
+Generates the synthetic labelled email dataset.
+
+Without --packed, writes --count numbered .txt files plus answer.txt into
+OUTPUT_DIR, the layout the benchmarks have always read. With --packed, streams
+--count emails into one packed JSONL file (labels inline) plus its offset
+index; see invox.features.email_classification.packed_dataset. Email i is
+drawn from its own random.Random seeded with (--seed, i), so a dataset is
+reproducible and identical whatever --workers splits the generation across.
+
+Usage:
+    python generate_dataset.py [--seed S]
+    python generate_dataset.py --packed emails.jsonl --count 1000000 [--seed S] [--workers P]
+"""
+
 import os
+import sys
 import random
+import argparse
 import datetime
+import json
+from multiprocessing import Pool
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(SCRIPT_DIR, "..", "..", "..", "src")))
+
+from invox.features.email_classification.packed_dataset import PackedWriter
 
 # --- Configuration ---
 OUTPUT_DIR = "services/invox-ai/tests/features/email_classification/email_dataset"
@@ -23,40 +47,41 @@ TAXONOMY = {
 
 # --- Simple Faker Implementation ---
 class SimpleFaker:
-    def __init__(self):
+    def __init__(self, rng=random):
+        self.rng = rng
         self.first_names = ["James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen"]
         self.last_names = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin"]
         self.companies = ["Acme Corp", "Globex", "Soylent Corp", "Initech", "Umbrella Corp", "Cyberdyne", "Massive Dynamic", "Hooli", "Vehement Capital", "Stark Ind", "Wayne Ent", "Oscorp"]
         self.domains = ["example.com", "test.net", "demo.org", "company.co", "biz.info", "secure-bank.net", "fast-shipping.com", "edu-mail.org", "gov-service.us", "cloud-host.io"]
     
     def name(self):
-        return f"{random.choice(self.first_names)} {random.choice(self.last_names)}"
+        return f"{self.rng.choice(self.first_names)} {self.rng.choice(self.last_names)}"
     
     def email(self, name=None):
         if not name:
             name = self.name()
         local = name.lower().replace(" ", ".")
-        domain = random.choice(self.domains)
+        domain = self.rng.choice(self.domains)
         return f"{local}@{domain}"
 
     def company(self):
-        return random.choice(self.companies)
+        return self.rng.choice(self.companies)
     
     def date(self):
         start_date = datetime.date(2023, 1, 1)
         end_date = datetime.date(2024, 12, 31)
         time_between_dates = end_date - start_date
         days_between_dates = time_between_dates.days
-        random_number_of_days = random.randrange(days_between_dates)
+        random_number_of_days = self.rng.randrange(days_between_dates)
         random_date = start_date + datetime.timedelta(days=random_number_of_days)
         return random_date.strftime("%a, %d %b %Y")
 
     def sentence(self):
         words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua", "ut", "enim", "ad", "minim", "veniam"]
-        return " ".join(random.choices(words, k=random.randint(5, 12))).capitalize() + "."
+        return " ".join(self.rng.choices(words, k=self.rng.randint(5, 12))).capitalize() + "."
 
     def paragraph(self):
-        return " ".join([self.sentence() for _ in range(random.randint(3, 6))])
+        return " ".join([self.sentence() for _ in range(self.rng.randint(3, 6))])
 
 faker = SimpleFaker()
 
@@ -185,7 +210,7 @@ Best regards,
 {sender}
 {company}"""
 
-def generate_email_content(category, subcategory):
+def generate_email_content(category, subcategory, faker=faker):
     key = f"{category}:{subcategory}"
     sender_name = faker.name()
     recipient_name = faker.name()
@@ -198,13 +223,13 @@ def generate_email_content(category, subcategory):
             topic=subcategory,
             date=date_str,
             sender=sender_name,
-            project_name=f"Project-{random.randint(100,999)}",
+            project_name=f"Project-{faker.rng.randint(100,999)}",
             name=recipient_name,
-            id=f"{random.randint(10000,99999)}",
-            amount=f"{random.randint(50, 500)}",
-            item=f"Widget-{random.randint(1,9)}",
+            id=f"{faker.rng.randint(10000,99999)}",
+            amount=f"{faker.rng.randint(50, 500)}",
+            item=f"Widget-{faker.rng.randint(1,9)}",
             hotel_name=f"{faker.last_names[0]} Hotel",
-            code=f"{random.randint(100000, 999999)}"
+            code=f"{faker.rng.randint(100000, 999999)}"
         )
         
         # Add headers if missing (simple hack)
@@ -230,7 +255,7 @@ def generate_email_content(category, subcategory):
     # Padding to meet word count (180-350 words)
     # Current content is short. Let's append some realistic footer filler.
     current_words = len(content.split())
-    needed = random.randint(180, 350) - current_words
+    needed = faker.rng.randint(180, 350) - current_words
     
     if needed > 0:
         filler = "\n\n" + "="*20 + "\n"
@@ -246,20 +271,55 @@ def generate_email_content(category, subcategory):
 
     return content
 
+ALL_PAIRS = [(cat, sub) for cat, subs in TAXONOMY.items() for sub in subs]
+
+
+def generate_record(seed, index):
+    """Email `index` of the dataset seeded with `seed`; independent of every other index."""
+    email_faker = SimpleFaker(random.Random(f"{seed}:{index}"))
+    cat, sub = email_faker.rng.choice(ALL_PAIRS)
+    content = generate_email_content(cat, sub, email_faker)
+    return {"id": index, "parent": cat, "child": sub, "text": content}
+
+
+def _generate_chunk(job):
+    seed, start, stop = job
+    return [
+        json.dumps(generate_record(seed, i), ensure_ascii=False).encode("utf-8") + b"\n"
+        for i in range(start, stop)
+    ]
+
+
+def write_packed(path, count, seed, workers=1, chunk_size=1000):
+    """Streams `count` emails into a packed dataset, generated across `workers` processes.
+
+    Chunks are written as they come back, in order (imap), so the whole dataset
+    is never held in memory and the file is byte-identical for any worker count.
+    """
+    jobs = ((seed, start, min(start + chunk_size, count)) for start in range(0, count, chunk_size))
+    with PackedWriter(path) as writer:
+        if workers > 1:
+            with Pool(workers) as pool:
+                for lines in pool.imap(_generate_chunk, jobs):
+                    for line in lines:
+                        writer.write_line(line)
+        else:
+            for job in jobs:
+                for line in _generate_chunk(job):
+                    writer.write_line(line)
+    print(f"Generated {count} emails into {path}")
+
+
 # --- Main Generation Loop ---
-def main():
+def write_directory(count=NUM_EMAILS, seed=None):
+    if seed is not None:
+        random.seed(seed)
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
 
     answers = []
-    
-    # Flatten categories for random selection
-    all_pairs = []
-    for cat, subs in TAXONOMY.items():
-        for sub in subs:
-            all_pairs.append((cat, sub))
-            
-    for i in range(1, NUM_EMAILS + 1):
+
+    for i in range(1, count + 1):
         filename = f"{i:03d}.txt"
         filepath = os.path.join(OUTPUT_DIR, filename)
         
@@ -270,7 +330,7 @@ def main():
             cat = list(TAXONOMY.keys())[i-1]
             sub = random.choice(TAXONOMY[cat])
         else:
-            cat, sub = random.choice(all_pairs)
+            cat, sub = random.choice(ALL_PAIRS)
             
         content = generate_email_content(cat, sub)
         
@@ -282,7 +342,22 @@ def main():
     with open(ANSWER_FILE, "w", encoding="utf-8") as f:
         f.write("\n".join(answers))
         
-    print(f"Generated {NUM_EMAILS} emails and {ANSWER_FILE}")
+    print(f"Generated {count} emails and {ANSWER_FILE}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--packed", help="Write one packed JSONL file instead of .txt files")
+    parser.add_argument("--count", type=int, default=NUM_EMAILS, help="Number of emails")
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes for --packed")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Emails per worker job")
+    args = parser.parse_args()
+
+    if args.packed:
+        seed = 0 if args.seed is None else args.seed
+        write_packed(args.packed, args.count, seed, args.workers, args.chunk_size)
+    else:
+        write_directory(args.count, args.seed)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,93 @@
+"""
+Import-time benchmark for the email classification modules.
+
+Each module is imported in a fresh interpreter so nothing is shared between
+measurements. Reports median wall time and the child's peak RSS, and with
+--warmup also the time service.warmup() takes to load every model.
+
+Usage: python import_benchmark.py [--repeat N] [--warmup]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "..", "..", "..", "src"))
+
+MODULES = [
+    "invox.features.email_classification.categories",
+    "invox.features.email_classification.spam_detection",
+    "invox.features.email_classification.category_detection",
+    "invox.features.email_classification.embedding_classifier",
+    "invox.features.email_classification.student_classifier",
+    "invox.features.email_classification.pipeline",
+    "invox.features.email_classification.service",
+]
+
+_CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module} as target
+imported = time.perf_counter() - start
+warmup = None
+if {warmup}:
+    start = time.perf_counter()
+    target.warmup()
+    warmup = time.perf_counter() - start
+print(json.dumps({{
+    "import_sec": imported,
+    "warmup_sec": warmup,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}}))
+"""
+
+
+def measure(module: str, warmup: bool) -> dict:
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    completed = subprocess.run(
+        [sys.executable, "-c", _CHILD.format(module=module, warmup=warmup)],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--warmup", action="store_true", help="Also time service.warmup()"
+    )
+    args = parser.parse_args()
+
+    print(f"{'Module':<58} {'Import (s)':>10} {'Peak RSS (MB)':>14}")
+    for module in MODULES:
+        runs = [measure(module, False) for _ in range(args.repeat)]
+        errors = [run["error"] for run in runs if "error" in run]
+        if errors:
+            print(f"{module:<58} {'FAILED':>10}  {errors[0]}")
+            continue
+        median_import = statistics.median(run["import_sec"] for run in runs)
+        peak_rss = max(run["peak_rss_mb"] for run in runs)
+        print(f"{module:<58} {median_import:>10.3f} {peak_rss:>14.1f}")
+
+    if args.warmup:
+        run = measure("invox.features.email_classification.service", True)
+        if "error" in run:
+            print(f"\nservice.warmup() FAILED: {run['error']}")
+        else:
+            print(
+                f"\nservice.warmup(): {run['warmup_sec']:.3f}s, "
+                f"peak RSS {run['peak_rss_mb']:.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures how many LLM calls the MinHash-LSH near-duplicate index avoids on
+the labelled dataset, and how often a reused label is actually correct.
+
+Emails are replayed in order. On an index hit the stored label is reused;
+on a miss the ground-truth label stands in for the LLM answer and the email
+is added to the index.
+
+Usage: python near_duplicate_benchmark.py [--threshold J] [dataset_dir|packed.jsonl]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "..", "src"))
+
+from invox.features.email_classification.near_duplicate import (  # noqa: E402
+    DEFAULT_THRESHOLD,
+    Fingerprint,
+    NearDuplicateIndex,
+)
+from invox.features.email_classification.packed_dataset import PackedDataset  # noqa: E402
+
+
+def packed_email(record: dict) -> tuple[str, str, tuple[str, str]]:
+    return f"#{record['id']}", record["text"], (record["parent"], record["child"])
+
+
+def load_dataset(dataset_dir: str) -> list[tuple[str, str, tuple[str, str]]]:
+    """(filename, text, (parent, child)) per email of a dataset dir or packed file."""
+    if os.path.isfile(dataset_dir):
+        with PackedDataset(dataset_dir) as dataset:
+            return [packed_email(record) for record in dataset]
+
+    with open(os.path.join(dataset_dir, "answer.txt"), "r", encoding="utf-8") as f:
+        answers = [line.strip() for line in f if line.strip()]
+
+    emails = []
+    for i, answer in enumerate(answers, start=1):
+        filename = f"{i:03d}.txt"
+        path = os.path.join(dataset_dir, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            parent, child = [part.strip() for part in answer.split(",", 1)]
+            emails.append((filename, f.read(), (parent, child)))
+    return emails
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "dataset_dir", nargs="?", default=os.path.join(SCRIPT_DIR, "email_dataset")
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Minimum Jaccard similarity for reuse",
+    )
+    args = parser.parse_args()
+
+    emails = load_dataset(args.dataset_dir)
+    index = NearDuplicateIndex(threshold=args.threshold)
+
+    reused = correct = 0
+    start_time = time.perf_counter()
+    for _, text, label in emails:
+        fingerprint = Fingerprint(text)
+        match = index.query(fingerprint)
+        if match is not None:
+            reused += 1
+            correct += match[0] == label
+        else:
+            index.add(fingerprint, label)
+    elapsed = time.perf_counter() - start_time
+
+    total = len(emails)
+    print(f"Emails            : {total}")
+    print(f"Threshold         : Jaccard >= {args.threshold}")
+    print(f"LLM calls         : {total - reused}")
+    print(f"LLM calls avoided : {reused} ({reused / max(total, 1):.1%})")
+    if reused:
+        print(f"Reuse accuracy    : {correct}/{reused} ({correct / reused:.1%})")
+    print(f"Index size        : {len(index)}")
+    print(f"Time per email    : {elapsed / max(total, 1) * 1e3:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measures the spam cascade on the labelled dataset: how much traffic the rule
+tier decides on its own, how fast, and how often it is right. With --model
+the undecided emails also go through BERT-tiny, a calibration temperature is
+fitted and precision/recall are reported for a range of thresholds.
+
+Usage: python spam_cascade_benchmark.py [--model] [dataset_dir]
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "..", "src"))
+sys.path.insert(0, SCRIPT_DIR)
+
+from invox.features.email_classification import spam_rules  # noqa: E402
+from near_duplicate_benchmark import load_dataset  # noqa: E402
+
+
+def _precision_recall(predicted: list[bool], actual: list[bool]) -> tuple[float, float]:
+    tp = sum(p and a for p, a in zip(predicted, actual))
+    fp = sum(p and not a for p, a in zip(predicted, actual))
+    fn = sum(a and not p for p, a in zip(predicted, actual))
+    return tp / max(tp + fp, 1), tp / max(tp + fn, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "dataset_dir", nargs="?", default=os.path.join(SCRIPT_DIR, "email_dataset")
+    )
+    parser.add_argument(
+        "--model", action="store_true", help="Also run BERT-tiny on undecided emails"
+    )
+    args = parser.parse_args()
+
+    emails = load_dataset(args.dataset_dir)
+    actual = [label[0] == "Spam" for _, _, label in emails]
+
+    start_time = time.perf_counter()
+    verdicts = [spam_rules.evaluate(text) for _, text, _ in emails]
+    rule_time = time.perf_counter() - start_time
+
+    decided = [i for i, v in enumerate(verdicts) if v["decision"] is not None]
+    rule_correct = sum((verdicts[i]["decision"] == "spam") == actual[i] for i in decided)
+    total = len(emails)
+    print(f"Emails              : {total} ({sum(actual)} spam)")
+    print(f"Rule tier time      : {rule_time / max(total, 1) * 1e6:.1f} us/email")
+    share = len(decided) / max(total, 1)
+    print(f"Rule tier decided   : {len(decided)}/{total} ({share:.1%})")
+    if decided:
+        print(f"Rule tier accuracy  : {rule_correct}/{len(decided)}")
+    print(f"Left for model tier : {total - len(decided)}")
+
+    if not args.model:
+        return
+
+    from invox.features.email_classification import spam_detection
+
+    undecided = [i for i in range(total) if verdicts[i]["decision"] is None]
+    spam_detection.warmup()
+    start_time = time.perf_counter()
+    raw = spam_detection.model_spam_probabilities(
+        [emails[i][1] for i in undecided]
+    ).tolist()
+    model_time = time.perf_counter() - start_time
+    undecided_actual = [actual[i] for i in undecided]
+
+    temperature = spam_detection.fit_temperature(raw, undecided_actual)
+    per_email_ms = model_time / max(len(undecided), 1) * 1e3
+    print(f"\nModel tier time     : {per_email_ms:.2f} ms/email")
+    print(f"Fitted temperature  : {temperature:.2f} (INVOX_SPAM_TEMPERATURE)")
+    calibrated = [
+        1.0 / (1.0 + math.exp(-spam_detection._logit(p) / temperature)) for p in raw
+    ]
+    print(f"{'Threshold':>9} {'Precision':>10} {'Recall':>8}  (calibrated P(spam))")
+    for threshold in (0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9):
+        predicted = [p >= threshold for p in calibrated]
+        precision, recall = _precision_recall(predicted, undecided_actual)
+        print(f"{threshold:>9.1f} {precision:>10.1%} {recall:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Parity and footprint check of the ONNX spam backend against torch.
+
+Runs the spam model on the same seeded sample under each backend (torch,
+ONNX fp32, ONNX int8), each in a fresh interpreter so import time, load time
+and peak RSS are its own. ONNX probabilities are compared with the torch
+ones; the script exits non-zero when the largest difference exceeds the
+tolerance for that precision or the spam/ham decisions at the threshold
+disagree on more than --max-flips emails, or when an ONNX run has imported
+torch or transformers.
+
+It first checks OnnxSpamModel's padding and length bucketing against a stub
+tokenizer and session; --batching-only stops there, so that part runs without
+onnxruntime, torch or the model download.
+
+Usage: python spam_onnx_parity.py [dataset_dir|packed.jsonl] [--limit N]
+                                  [--fp32-tolerance 1e-4] [--int8-tolerance 0.05]
+                                  [--batching-only]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from types import SimpleNamespace
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, "..", "..", "..", "src"))
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, SCRIPT_DIR)
+
+BACKENDS = [
+    ("torch", {"INVOX_SPAM_BACKEND": "torch"}),
+    ("onnx-fp32", {"INVOX_SPAM_BACKEND": "onnx", "INVOX_SPAM_ONNX_PRECISION": "fp32"}),
+    ("onnx-int8", {"INVOX_SPAM_BACKEND": "onnx", "INVOX_SPAM_ONNX_PRECISION": "int8"}),
+]
+# What the ONNX backend exists to keep out of the serving process
+HEAVY_MODULES = ("torch", "transformers")
+
+
+class _StubTokenizer:
+    def __init__(self, encodings: dict):
+        self.encodings = encodings
+
+    def encode_batch(self, texts):
+        return [self.encodings[text] for text in texts]
+
+
+class _StubSession:
+    """Logits [0, first id / 10] per row; records the batches it was given."""
+
+    def __init__(self):
+        self.batches = []
+
+    def run(self, output_names, feeds):
+        import numpy as np
+
+        self.batches.append(feeds)
+        logits = np.zeros((len(feeds["input_ids"]), 2), dtype=np.float32)
+        logits[:, 1] = feeds["input_ids"][:, 0] / 10
+        return [logits]
+
+
+def check_batching() -> list:
+    """Failures of OnnxSpamModel._pad and the bucket ordering in probabilities()."""
+    import numpy as np
+    from invox.features.email_classification.spam_onnx import OnnxSpamModel
+
+    pad_token_id = 0
+    lengths = [5, 1, 3, 1, 4, 2, 5, 3]
+    # Email i is tokens [i + 1] * length, so every row says where it came from
+    encodings = {
+        f"email {i}": SimpleNamespace(
+            ids=[i + 1] * n, attention_mask=[1] * n, type_ids=[i % 2] * n
+        )
+        for i, n in enumerate(lengths)
+    }
+    texts = list(encodings)
+
+    # __init__ needs onnxruntime and an export; the methods under test do not
+    model = OnnxSpamModel.__new__(OnnxSpamModel)
+    model.input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    model.pad_token_id = pad_token_id
+    model.tokenizer = _StubTokenizer(encodings)
+    model.session = _StubSession()
+    failures = []
+
+    padded = model._pad(
+        [encodings["email 1"], encodings["email 0"], encodings["email 5"]]
+    )
+    if list(padded) != model.input_names:
+        failures.append(f"_pad returned inputs {list(padded)}, not {model.input_names}")
+    expected_ids = [[2, 0, 0, 0, 0], [1, 1, 1, 1, 1], [6, 6, 0, 0, 0]]
+    if padded["input_ids"].tolist() != expected_ids:
+        failures.append(f"_pad input_ids {padded['input_ids'].tolist()}")
+    expected_mask = [[1, 0, 0, 0, 0], [1, 1, 1, 1, 1], [1, 1, 0, 0, 0]]
+    if padded["attention_mask"].tolist() != expected_mask:
+        failures.append(f"_pad attention_mask {padded['attention_mask'].tolist()}")
+    expected_types = [[1, 0, 0, 0, 0], [0, 0, 0, 0, 0], [1, 1, 0, 0, 0]]
+    if padded["token_type_ids"].tolist() != expected_types:
+        failures.append(f"_pad token_type_ids {padded['token_type_ids'].tolist()}")
+    if any(array.dtype != np.int64 for array in padded.values()):
+        failures.append("_pad arrays are not int64")
+
+    model.input_names = ["input_ids", "attention_mask"]
+    if list(model._pad([encodings["email 0"]])) != model.input_names:
+        failures.append("_pad fed an input the export does not declare")
+    model.input_names = ["input_ids", "attention_mask", "token_type_ids"]
+
+    probabilities = model.probabilities(texts, column=1, batch_size=3)
+    expected = 1 / (1 + np.exp(-(np.arange(len(texts)) + 1) / 10))
+    if not np.allclose(probabilities, expected, atol=1e-6):
+        failures.append(
+            f"probabilities not in input order: {[round(float(p), 3) for p in probabilities]}"
+        )
+    widths = [feeds["input_ids"].shape[1] for feeds in model.session.batches]
+    sizes = [len(feeds["input_ids"]) for feeds in model.session.batches]
+    # Sorted by length, each batch is as wide as its longest email and no wider
+    if widths != [2, 4, 5] or sizes != [3, 3, 2]:
+        failures.append(f"batches of {sizes} emails padded to widths {widths}")
+    for feeds in model.session.batches:
+        rows = feeds["attention_mask"].sum(axis=1).tolist()
+        if rows != sorted(rows):
+            failures.append(f"batch rows not in length order: {rows}")
+
+    model.session = _StubSession()
+    if len(model.probabilities([], column=1, batch_size=3)) or model.session.batches:
+        failures.append("empty input ran the session")
+    return failures
+
+
+def run_child(args) -> None:
+    """Scores the sample with the backend from the environment; prints JSON."""
+    from benchmark import load_emails
+
+    texts = [text for _, text, _ in load_emails(args.dataset_dir, args.limit, args.seed)]
+
+    start_time = time.perf_counter()
+    # Through the whole service, so an import anywhere in it shows up below
+    from invox.features.email_classification import service
+
+    spam_detection = service.spam_detection
+
+    import_sec = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    spam_detection.warmup()
+    load_sec = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    probabilities = spam_detection.model_spam_probabilities(texts)
+    score_sec = time.perf_counter() - start_time
+
+    print(
+        json.dumps(
+            {
+                "probabilities": probabilities.tolist(),
+                "import_sec": import_sec,
+                "load_sec": load_sec,
+                "emails_per_sec": len(texts) / max(score_sec, 1e-9),
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                "heavy_imports": [m for m in HEAVY_MODULES if m in sys.modules],
+            }
+        )
+    )
+
+
+def run_backend(env: dict, args) -> dict:
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        args.dataset_dir,
+        "--limit",
+        str(args.limit),
+        "--seed",
+        str(args.seed),
+        "--child",
+    ]
+    proc = subprocess.run(
+        command,
+        env={**os.environ, "PYTHONPATH": SRC_DIR, "INVOX_LOG_LEVEL": "WARNING", **env},
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"{env}: {proc.stderr.strip().splitlines()[-1:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "dataset_dir", nargs="?", default=os.path.join(SCRIPT_DIR, "email_dataset")
+    )
+    parser.add_argument(
+        "--limit", type=int, default=200, help="Seeded sample of N emails"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--fp32-tolerance", type=float, default=1e-4)
+    parser.add_argument("--int8-tolerance", type=float, default=0.05)
+    parser.add_argument(
+        "--max-flips", type=int, default=0, help="Decisions allowed to differ"
+    )
+    parser.add_argument(
+        "--batching-only",
+        action="store_true",
+        help="Only check padding and bucketing; needs no model",
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    failures = check_batching()
+    for failure in failures:
+        print(f"[BATCHING] FAIL {failure}")
+    if failures or args.batching_only:
+        if not failures:
+            print("[BATCHING] OK")
+        sys.exit(1 if failures else 0)
+
+    # Export up front so the ONNX rows measure serving, not the one-off export
+    from invox.features.email_classification import spam_detection, spam_onnx
+
+    for precision in ("fp32", "int8"):
+        if not spam_onnx.is_exported(
+            spam_onnx.export_dir(spam_detection.SPAM_MODEL, precision)
+        ):
+            subprocess.run(
+                [sys.executable, spam_onnx.__file__, "export", "--precision", precision],
+                env={**os.environ, "PYTHONPATH": SRC_DIR},
+                check=True,
+            )
+
+    runs = {}
+    for name, env in BACKENDS:
+        print(f"[PARITY] {name}...", file=sys.stderr, flush=True)
+        runs[name] = run_backend(env, args)
+
+    reference = runs["torch"]["probabilities"]
+    tolerances = {"onnx-fp32": args.fp32_tolerance, "onnx-int8": args.int8_tolerance}
+    failed = False
+
+    print(
+        f"{'Backend':<10} {'Import s':>8} {'Load s':>7} {'Emails/s':>9} "
+        f"{'RSS MB':>7} {'Max |dP|':>9} {'Flips':>6}"
+    )
+    for name, run in runs.items():
+        diffs = [abs(p - r) for p, r in zip(run["probabilities"], reference)]
+        flips = sum(
+            (p >= args.threshold) != (r >= args.threshold)
+            for p, r in zip(run["probabilities"], reference)
+        )
+        ok = name == "torch" or (
+            max(diffs) <= tolerances[name]
+            and flips <= args.max_flips
+            and not run["heavy_imports"]
+        )
+        failed |= not ok
+        print(
+            f"{name:<10} {run['import_sec']:>8.2f} {run['load_sec']:>7.2f} "
+            f"{run['emails_per_sec']:>9.1f} {run['peak_rss_mb']:>7.0f} "
+            f"{max(diffs):>9.2e} {flips:>6}{'' if ok else '  FAIL'}"
+        )
+        if name != "torch" and run["heavy_imports"]:
+            print(f"  {name} imported {', '.join(run['heavy_imports'])}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
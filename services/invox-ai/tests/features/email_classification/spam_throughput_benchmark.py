@@ -0,0 +1,100 @@
+"""
+Spam-model throughput: per-email calls vs. length-bucketed batches.
+
+Every email goes to BERT-tiny (the rule tier is switched off). The baselines
+are one transformers pipeline call per email and check_is_spam() per email;
+spam_probabilities() then runs over the same emails at each --batch-sizes
+value. Reports emails/s, the speedup over per-email check_is_spam() and the
+largest P(spam) difference from the per-email pipeline.
+
+Usage: python spam_throughput_benchmark.py [dataset_dir|packed.jsonl]
+                                           [--limit N] [--batch-sizes 8,32,64]
+                                           [--threads T] [--seed S]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "..", "src"))
+sys.path.insert(0, SCRIPT_DIR)
+
+from benchmark import load_emails  # noqa: E402
+
+
+def _timed(fn) -> tuple[list[float], float]:
+    start_time = time.perf_counter()
+    probabilities = fn()
+    return [float(p) for p in probabilities], time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "dataset_dir", nargs="?", default=os.path.join(SCRIPT_DIR, "email_dataset")
+    )
+    parser.add_argument(
+        "--limit", type=int, default=256, help="Seeded sample of N emails"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-sizes", default="8,32,64")
+    parser.add_argument(
+        "--threads", type=int, default=0, help="torch threads (INVOX_SPAM_THREADS)"
+    )
+    args = parser.parse_args()
+
+    # Raw model probabilities on every email, comparable across all rows
+    os.environ["INVOX_SPAM_RULES"] = "0"
+    os.environ["INVOX_SPAM_TEMPERATURE"] = "1.0"
+    # The per-email baseline is the transformers pipeline
+    os.environ["INVOX_SPAM_BACKEND"] = "torch"
+    if args.threads:
+        os.environ["INVOX_SPAM_THREADS"] = str(args.threads)
+    from invox.features.email_classification import spam_detection
+
+    texts = [text for _, text, _ in load_emails(args.dataset_dir, args.limit, args.seed)]
+    spam_detection.warmup()
+    classifier = spam_detection.spam_model.get()
+    spam_column = spam_detection._spam_column(classifier.model.config.id2label)
+    spam_label = classifier.model.config.id2label[spam_column]
+
+    def pipeline_p_spam(output: dict) -> float:
+        score = output["score"]
+        return score if output["label"] == spam_label else 1.0 - score
+
+    # Untimed pass so lazy initialisation is not charged to the first row
+    spam_detection.spam_probabilities(texts[:8])
+
+    rows = []
+    reference, elapsed = _timed(
+        lambda: [pipeline_p_spam(classifier(text)[0]) for text in texts]
+    )
+    rows.append(("pipeline, per email", reference, elapsed))
+
+    per_email, elapsed = _timed(
+        lambda: [spam_detection.score_spam(text)["score"] for text in texts]
+    )
+    rows.append(("check_is_spam, per email", per_email, elapsed))
+    baseline = elapsed
+
+    for batch_size in [int(b) for b in args.batch_sizes.split(",") if b]:
+        probabilities, elapsed = _timed(
+            lambda: spam_detection.spam_probabilities(texts, batch_size=batch_size)
+        )
+        rows.append((f"bucketed, batch {batch_size}", probabilities, elapsed))
+
+    print(f"Emails: {len(texts)}, torch threads: {args.threads or 'default'}")
+    print(f"{'Path':<26} {'Emails/s':>9} {'ms/email':>9} {'Speedup':>8} {'Max |dP|':>9}")
+    for name, probabilities, elapsed in rows:
+        drift = max(abs(p - r) for p, r in zip(probabilities, reference))
+        print(
+            f"{name:<26} {len(texts) / elapsed:>9.1f} "
+            f"{elapsed / len(texts) * 1000:>9.2f} {baseline / elapsed:>7.1f}x "
+            f"{drift:>9.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Scaling benchmark for the multi-process worker pool.
+
+For every (workers, threads per worker) combination, starts a WorkerPool,
+waits for all workers to load their models, then classifies the dataset and
+reports emails/sec. The result cache and near-duplicate reuse are disabled
+so every email reaches the models.
+
+Usage:
+    python worker_scaling_benchmark.py --workers 1,2,4,8 --threads 4,8 [--limit N]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", "..", "..", "src"))
+sys.path.insert(0, SCRIPT_DIR)
+
+from invox.features.email_classification.worker_pool import WorkerPool  # noqa: E402
+from near_duplicate_benchmark import load_dataset  # noqa: E402
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+def run(emails, workers: int, threads: int, batch_size: int, mode: str) -> dict:
+    env = {
+        "INVOX_CLASSIFIER_MODE": mode,
+        "INVOX_RESULT_CACHE": "0",
+        "INVOX_NEAR_DUPLICATE": "0",
+    }
+    start_time = time.perf_counter()
+    with WorkerPool(workers, threads, chunk_size=batch_size, env=env) as pool:
+        pool.warmup()
+        load_sec = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        results = pool.map([text for _, text, _ in emails])
+        elapsed = time.perf_counter() - start_time
+
+    correct = sum(result == label for result, (_, _, label) in zip(results, emails))
+    return {
+        "load_sec": load_sec,
+        "elapsed_sec": elapsed,
+        "emails_per_sec": len(emails) / elapsed,
+        "accuracy": correct / max(len(emails), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "dataset_dir", nargs="?", default=os.path.join(SCRIPT_DIR, "email_dataset")
+    )
+    parser.add_argument("--workers", type=_int_list, default=[1, 2, 4])
+    parser.add_argument("--threads", type=_int_list, default=[4])
+    parser.add_argument("--batch-size", type=int, default=1, help="Emails per dispatch")
+    parser.add_argument("--mode", choices=["hierarchical", "flat"], default="hierarchical")
+    parser.add_argument("--limit", type=int, default=0, help="Only use the first N emails")
+    args = parser.parse_args()
+
+    emails = load_dataset(args.dataset_dir)
+    if args.limit:
+        emails = emails[: args.limit]
+
+    print(f"Emails: {len(emails)}, cores available: {os.cpu_count()}")
+    print(
+        f"{'Workers':>7} {'Threads':>7} {'Cores':>6} {'Load (s)':>9} "
+        f"{'Run (s)':>8} {'Emails/s':>9} {'Speedup':>8} {'Accuracy':>9}"
+    )
+    baseline = None
+    for threads in args.threads:
+        for workers in args.workers:
+            stats = run(emails, workers, threads, args.batch_size, args.mode)
+            baseline = baseline or stats["emails_per_sec"]
+            print(
+                f"{workers:>7} {threads:>7} {workers * threads:>6} "
+                f"{stats['load_sec']:>9.1f} {stats['elapsed_sec']:>8.1f} "
+                f"{stats['emails_per_sec']:>9.2f} "
+                f"{stats['emails_per_sec'] / baseline:>7.2f}x "
+                f"{stats['accuracy']:>8.1%}",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()